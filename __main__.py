@@ -1,5 +1,11 @@
 import os
 import db
+from db_cache import ReadCache
+from conversation_store import (
+    ConversationStore,
+    DBConversationBackend,
+    MemoryConversationBackend,
+)
 from dotenv import load_dotenv
 from workspace import LocalWorkspace
 from agent_log import AgentLogger
@@ -9,13 +15,33 @@ load_dotenv()
 LOG = AgentLogger(__name__)
 
 database_name = os.getenv("DATABASE_STRING")
+database_async = os.getenv("DATABASE_ASYNC", "false").lower() == "true"
+database_write_behind = os.getenv("DATABASE_WRITE_BEHIND", "false").lower() == "true"
+database_cache_ttl = float(os.getenv("DATABASE_CACHE_TTL", 0))
+conversation_store = os.getenv("CONVERSATION_STORE", "db")
+chat_repeat_window = int(os.getenv("CHAT_REPEAT_WINDOW", 8))
 
 if __name__ == "__main__":
     """Runs the agent server"""
     database_name = database_name
     workspace = LocalWorkspace(os.getenv("AGENT_WORKSPACE"))
     port = os.getenv("PORT")
-    database = db.AgentDB(database_name, debug_enabled=False)
-    agent = agents.ForgeAgent(database=database, workspace=workspace)
+    cache = ReadCache(ttl=database_cache_ttl) if database_cache_ttl > 0 else None
+    database_class = db.AsyncAgentDB if database_async else db.AgentDB
+    database = database_class(
+        database_name,
+        debug_enabled=False,
+        write_behind=database_write_behind,
+        cache=cache,
+    )
+    conversations = ConversationStore(
+        MemoryConversationBackend()
+        if conversation_store == "memory"
+        else DBConversationBackend(database),
+        near_window=chat_repeat_window,
+    )
+    agent = agents.ForgeAgent(
+        database=database, workspace=workspace, conversations=conversations
+    )
     agent.start(port=port)
     LOG.info(f"Agent server starting")
\ No newline at end of file
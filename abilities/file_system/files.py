@@ -1,6 +1,7 @@
 from typing import List
 from ..registry import ability
 from typing import Dict
+import asyncio
 import subprocess
 import json
 
@@ -15,7 +16,8 @@ import json
             "required": True
         }
     ],
-    output_type="dict"
+    output_type="dict",
+    side_effects=True,
 )
 
 async def run_python_file(agent, task_id: str, file_name: str) -> Dict:
@@ -32,7 +34,7 @@ async def run_python_file(agent, task_id: str, file_name: str) -> Dict:
     command = f"python {file_name}"
 
     try:
-        req = subprocess.run(command,
+        req = await asyncio.to_thread(subprocess.run, command,
             shell=True,
             capture_output=True,
             cwd=get_cwd
@@ -66,10 +68,12 @@ async def run_python_file(agent, task_id: str, file_name: str) -> Dict:
         }
     ],
     output_type="list[str]",
+    read_only=True,
+    reads="path",
 )
 async def list_files(agent, task_id: str, path: str) -> List[str]:
 
-    return agent.workspace.list(task_id=task_id, path=path)
+    return await asyncio.to_thread(agent.workspace.list, task_id=task_id, path=path)
 
 
 @ability(
@@ -90,6 +94,7 @@ async def list_files(agent, task_id: str, path: str) -> List[str]:
         },
     ],
     output_type="File has been succesfully written",
+    writes="file_name",
 )
 async def write_file(agent, task_id: str, file_name: str, data: bytes) -> None:
 
@@ -102,7 +107,9 @@ async def write_file(agent, task_id: str, file_name: str, data: bytes) -> None:
 
         data = str.encode(data)
 
-        agent.workspace.write(task_id=task_id, path=file_name, data=data)
+        await asyncio.to_thread(
+            agent.workspace.write, task_id=task_id, path=file_name, data=data
+        )
     
         await agent.db.create_artifact(
             task_id=task_id,
@@ -127,7 +134,9 @@ async def write_file(agent, task_id: str, file_name: str, data: bytes) -> None:
         },
     ],
     output_type="bytes",
+    read_only=True,
+    reads="file_path",
 )
 async def read_file(agent, task_id: str, file_path: str) -> bytes:
 
-    return agent.workspace.read(task_id=task_id, path=file_path)
+    return await asyncio.to_thread(agent.workspace.read, task_id=task_id, path=file_path)
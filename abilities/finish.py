@@ -14,6 +14,7 @@ from .registry import ability
         }
     ],
     output_type="None",
+    side_effects=True,
 )
 async def finish(
     agent,
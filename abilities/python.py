@@ -2,6 +2,7 @@
 Ability for running Python code
 """
 from typing import Dict
+import asyncio
 import subprocess
 import json
 
@@ -19,7 +20,8 @@ from ..registry import ability
             "required": True
         }
     ],
-    output_type="dict"
+    output_type="dict",
+    side_effects=True,
 )
 
 async def run_python_file(agent, task_id: str, file_name: str) -> Dict:
@@ -32,7 +34,7 @@ async def run_python_file(agent, task_id: str, file_name: str) -> Dict:
     }
     command = f"python {file_name}"
     try:
-        req = subprocess.run(command,
+        req = await asyncio.to_thread(subprocess.run, command,
             shell=True,
             capture_output=True,
             cwd=get_cwd
@@ -2,7 +2,7 @@ import glob
 import importlib
 import inspect
 import os
-from typing import Any, Callable, List
+from typing import Any, Callable, List, Optional
 import pydantic
 import sys
 
@@ -19,6 +19,16 @@ class Ability(pydantic.BaseModel):
     parameters: List[AbilityParameter]
     output_type: str
     category: str | None = None
+    # scheduling metadata: reads/writes name the argument holding the path
+    read_only: bool = False
+    reads: Optional[str] = None
+    writes: Optional[str] = None
+    side_effects: bool = False
+
+    @property
+    def exclusive(self) -> bool:
+        """Must run on its own: side effects, or nothing declared at all"""
+        return self.side_effects or not (self.read_only or self.writes)
 
     def __call__(self, *args: Any, **kwds: Any) -> Any:
         return self.method(*args, **kwds)
@@ -33,7 +43,14 @@ class Ability(pydantic.BaseModel):
 
 
 def ability(
-    name: str, description: str, parameters: List[AbilityParameter], output_type: str
+    name: str,
+    description: str,
+    parameters: List[AbilityParameter],
+    output_type: str,
+    read_only: bool = False,
+    reads: Optional[str] = None,
+    writes: Optional[str] = None,
+    side_effects: bool = False,
 ):
     def decorator(func):
         func_params = inspect.signature(func).parameters
@@ -53,6 +70,10 @@ def ability(
             parameters=parameters,
             method=func,
             output_type=output_type,
+            read_only=read_only,
+            reads=reads,
+            writes=writes,
+            side_effects=side_effects,
         )
         return func
 
@@ -74,6 +95,7 @@ class AbilityRegister:
             if not os.path.basename(ability_path) in [
                 "__init__.py",
                 "registry.py",
+                "scheduler.py",
             ]:
                 ability = os.path.relpath(
                     ability_path, os.path.dirname(__file__)
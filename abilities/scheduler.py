@@ -0,0 +1,190 @@
+import asyncio
+import posixpath
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+from json_stream import AbilityStreamParser
+from agent_log import AgentLogger
+
+LOG = AgentLogger(__name__)
+
+
+def _paths_overlap(a: Optional[str], b: Optional[str]) -> bool:
+    # an unknown path may be anything
+    if a is None or b is None:
+        return True
+    a = posixpath.normpath(a.lstrip("/"))
+    b = posixpath.normpath(b.lstrip("/"))
+    if a == "." or b == ".":
+        return True
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+class AbilityScheduler:
+    """
+    Runs the abilities of one LLM reply. Calls are split into waves in reply
+    order; calls inside a wave don't conflict and run with asyncio.gather,
+    bounded by max_concurrency per task. Results come back in reply order.
+    """
+
+    def __init__(self, registry, max_concurrency: int = 4, events=None) -> None:
+        self.registry = registry
+        self.max_concurrency = max_concurrency
+        self.events = events
+        self.prefetched = 0
+        self.prefetch_hits = 0
+        self._limits = weakref.WeakValueDictionary()
+
+    def _limit(self, task_id: str) -> asyncio.Semaphore:
+        limit = self._limits.get(task_id)
+        if limit is None:
+            limit = self._limits[task_id] = asyncio.Semaphore(self.max_concurrency)
+        return limit
+
+    def _access(self, call: Dict[str, Any]) -> Tuple[bool, Optional[str], bool]:
+        """(exclusive, path, writes) for one call"""
+        ability = self.registry.abilities.get(call["name"])
+        if ability is None or ability.exclusive:
+            return True, None, True
+        args = call.get("args") or {}
+        if ability.writes:
+            return False, args.get(ability.writes), True
+        return False, args.get(ability.reads) if ability.reads else None, False
+
+    def plan(self, calls: List[Dict[str, Any]]) -> List[List[int]]:
+        """Indexes of calls grouped into waves that may run concurrently"""
+        waves: List[List[int]] = []
+        wave: List[int] = []
+        touched: List[Tuple[Optional[str], bool]] = []
+        for index, call in enumerate(calls):
+            exclusive, path, writes = self._access(call)
+            conflict = exclusive or any(
+                (writes or other_writes) and _paths_overlap(path, other_path)
+                for other_path, other_writes in touched
+            )
+            if conflict and wave:
+                waves.append(wave)
+                wave, touched = [], []
+            if exclusive:
+                waves.append([index])
+                continue
+            wave.append(index)
+            touched.append((path, writes))
+        if wave:
+            waves.append(wave)
+        return waves
+
+    def prefetchable(self, call: Dict[str, Any]) -> bool:
+        """Whether the call only reads and may start before the reply is final"""
+        ability = self.registry.abilities.get(call.get("name"))
+        return ability is not None and ability.read_only and not ability.exclusive
+
+    def start(
+        self, task_id: str, call: Dict[str, Any], step_id: Optional[str] = None
+    ) -> asyncio.Task:
+        self.prefetched += 1
+        return asyncio.ensure_future(self._run(self._limit(task_id), task_id, call, step_id))
+
+    def _publish(self, task_id: str, event: str, **data: Any) -> None:
+        if self.events is not None:
+            self.events.publish(task_id, event, **data)
+
+    async def _run(
+        self,
+        limit: asyncio.Semaphore,
+        task_id: str,
+        call: Dict[str, Any],
+        step_id: Optional[str],
+    ) -> Tuple[Any, Optional[Exception]]:
+        async with limit:
+            LOG.info(f"Running Ability:{call['name']}")
+            self._publish(
+                task_id, "ability_started",
+                step_id=step_id, ability=call["name"], args=call.get("args"),
+            )
+            started = time.perf_counter()
+            output, error = None, None
+            try:
+                output = await self.registry.run_ability(
+                    task_id, call["name"], **(call.get("args") or {})
+                )
+            except Exception as err:
+                error = err
+            self._publish(
+                task_id, "ability_finished",
+                step_id=step_id,
+                ability=call["name"],
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                error=str(error) if error is not None else None,
+            )
+            return output, error
+
+    async def run_all(
+        self,
+        task_id: str,
+        calls: List[Dict[str, Any]],
+        step_id: Optional[str] = None,
+        started: Optional[List[Optional[asyncio.Task]]] = None,
+    ) -> List[Tuple[Any, Optional[Exception]]]:
+        """
+        (output, error) per call, in the order of calls. started holds, per
+        call, a run already begun with start() that is awaited instead.
+        """
+        limit = self._limit(task_id)
+        started = started or [None] * len(calls)
+        results: List[Tuple[Any, Optional[Exception]]] = [None] * len(calls)
+        for wave in self.plan(calls):
+            outputs = await asyncio.gather(
+                *(
+                    started[index] or self._run(limit, task_id, calls[index], step_id)
+                    for index in wave
+                )
+            )
+            for index, output in zip(wave, outputs):
+                results[index] = output
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        return {"prefetched": self.prefetched, "prefetch_hits": self.prefetch_hits}
+
+
+class AbilityPrefetch:
+    """
+    Starts abilities while the LLM reply is still streaming. Only the calls
+    at the head of the reply that just read are started early, so nothing
+    runs ahead of a write it should see. The final reply decides: take()
+    hands over a started run only if the parsed call matches it exactly.
+    """
+
+    def __init__(self, scheduler: AbilityScheduler, task_id: str, step_id: Optional[str] = None):
+        self.scheduler = scheduler
+        self.task_id = task_id
+        self.step_id = step_id
+        self.parser = AbilityStreamParser()
+        self._started: Dict[int, Tuple[Dict[str, Any], asyncio.Task]] = {}
+
+    def feed(self, delta: str) -> None:
+        for position, call in self.parser.feed(delta):
+            if position != len(self._started) or not self.scheduler.prefetchable(call):
+                continue
+            LOG.info(f"Prefetching Ability:{call['name']}")
+            self._started[position] = (
+                call,
+                self.scheduler.start(self.task_id, call, self.step_id),
+            )
+
+    def take(self, position: int, call: Dict[str, Any]) -> Optional[asyncio.Task]:
+        started_call, task = self._started.get(position, (None, None))
+        if task is None or started_call != call:
+            return None
+        del self._started[position]
+        self.scheduler.prefetch_hits += 1
+        return task
+
+    async def discard(self) -> None:
+        """Cancel the runs the final reply didn't use"""
+        tasks = [task for _, task in self._started.values()]
+        self._started.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
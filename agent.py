@@ -1,7 +1,9 @@
 import asyncio
 import os
 import pathlib
+import time
 from io import BytesIO
+from typing import Optional
 from uuid import uuid4
 from fastapi import APIRouter, FastAPI, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
@@ -11,9 +13,11 @@ from hypercorn.asyncio import serve
 from hypercorn.config import Config
 from abilities.registry import AbilityRegister
 from db import AgentDB
+from events import EventBroker
 from middlewares import AgentMiddleware
 from routes.agent_protocol import base_router
 from schema import *
+from step_runner import StepRunner
 from workspace import Workspace
 from agent_log import AgentLogger
 LOG = AgentLogger(__name__)
@@ -23,6 +27,14 @@ class Agent:
         self.db = database
         self.workspace = workspace
         self.abilities = AbilityRegister(self)
+        # progress of running steps, streamed to clients over SSE
+        self.events = EventBroker()
+        # runs steps submitted with background=True
+        self.step_runner = StepRunner(
+            self,
+            workers=int(os.getenv("STEP_WORKERS", 4)),
+            max_queue=int(os.getenv("STEP_QUEUE_SIZE", 100)),
+        )
 
     def start(self, port: int = 8000, router: APIRouter = base_router):
         """
@@ -72,6 +84,10 @@ class Agent:
             LOG.warning(f"Frontend not found. {frontend_path} does not exist. The frontend will not be served")
 
         app.add_middleware(AgentMiddleware, agent=self)
+        # flush buffered writes and release pooled connections on shutdown
+        app.add_event_handler("shutdown", self.step_runner.close)
+        if hasattr(self.db, "close"):
+            app.add_event_handler("shutdown", self.db.close)
 
         config.loglevel = "ERROR"
         config.bind = [f"0.0.0.0:{port}"]
@@ -79,9 +95,26 @@ class Agent:
         LOG.info(f"Agent server starting on http://localhost:{port}")
         asyncio.run(serve(app, config))
 
-    async def create_task(self, task_request: TaskRequestBody) -> Task:
+    def get_metrics(self) -> dict:
+        """
+        Runtime counters of the agent's components.
+        """
+        metrics = {
+            "step_runner": self.step_runner.stats(),
+            "events": self.events.stats(),
+        }
+        if getattr(self.db, "cache", None) is not None:
+            metrics["db_cache"] = self.db.cache.stats()
+        if getattr(self.db, "write_behind", None) is not None:
+            metrics["db_write_behind"] = self.db.write_behind.stats()
+        return metrics
+
+    async def create_task(
+        self, task_request: TaskRequestBody, background: bool = False
+    ) -> Task:
         """
-        Create a task for the agent.
+        Create a task for the agent. With background=True agents that need
+        setup may return the task before it is ready to run steps.
         """
         try:
             task = await self.db.create_task(
@@ -92,46 +125,130 @@ class Agent:
         except Exception as e:
             raise
 
-    async def list_tasks(self, page: int = 1, pageSize: int = 10) -> TaskListResponse:
+    async def list_tasks(
+        self,
+        page: int = 1,
+        pageSize: int = 10,
+        include_artifacts: bool = True,
+        cursor: Optional[str] = None,
+        count: Optional[str] = None,
+    ) -> TaskListResponse:
         """
         List all tasks that the agent has created.
         """
         try:
-            tasks, pagination = await self.db.list_tasks(page, pageSize)
+            tasks, pagination = await self.db.list_tasks(
+                page, pageSize, include_artifacts, cursor=cursor, count=count
+            )
             response = TaskListResponse(tasks=tasks, pagination=pagination)
             return response
         except Exception as e:
             raise
 
-    async def get_task(self, task_id: str) -> Task:
+    async def get_task(self, task_id: str, include_archived: bool = False) -> Task:
         """
         Get a task by ID.
         """
         try:
-            task = await self.db.get_task(task_id)
+            task = await self.db.get_task(task_id, include_archived=include_archived)
         except Exception as e:
             raise
         return task
 
     async def list_steps(
-        self, task_id: str, page: int = 1, pageSize: int = 10
+        self,
+        task_id: str,
+        page: int = 1,
+        pageSize: int = 10,
+        include_artifacts: bool = True,
+        cursor: Optional[str] = None,
+        count: Optional[str] = None,
+        include_archived: bool = False,
     ) -> TaskStepsListResponse:
         """
         List the IDs of all steps that the task has created.
         """
         try:
-            steps, pagination = await self.db.list_steps(task_id, page, pageSize)
+            steps, pagination = await self.db.list_steps(
+                task_id,
+                page,
+                pageSize,
+                include_artifacts,
+                cursor=cursor,
+                count=count,
+                include_archived=include_archived,
+            )
             response = TaskStepsListResponse(steps=steps, pagination=pagination)
             return response
         except Exception as e:
             raise
 
-    async def execute_step(self, task_id: str, step_request: StepRequestBody) -> Step:
+    async def create_step(self, task_id: str, step_request: StepRequestBody) -> Step:
         """
-        Create a step for the task.
+        Create the row of a step, before it runs.
+        """
+        step = await self.db.create_step(
+            task_id=task_id,
+            input=step_request,
+            additional_input=step_request.additional_input,
+            is_last=False,
+        )
+        self.events.publish(
+            task_id, "step_created", step_id=step.step_id, input=step.input
+        )
+        return step
+
+    async def execute_step(
+        self,
+        task_id: str,
+        step_request: StepRequestBody,
+        step: Optional[Step] = None,
+    ) -> Step:
+        """
+        Create a step for the task and run it. A step already created with
+        create_step is passed in as step.
         """
         raise NotImplementedError
 
+    async def submit_step(self, task_id: str, step_request: StepRequestBody) -> Step:
+        """
+        Create a step and queue it to run in the background.
+        """
+        return await self.step_runner.submit(task_id, step_request)
+
+    async def run_step(self, task_id: str, step_request: StepRequestBody) -> Step:
+        """
+        Create a step and run it in the request, after any step of the task
+        the background workers are running.
+        """
+        async with self.step_runner.task_lock(task_id):
+            return await self.execute_step(task_id, step_request)
+
+    async def stream_events(
+        self, task_id: str, last_event_id: Optional[int] = None, keepalive: float = 15
+    ):
+        """
+        Server-sent events for a task, until the client goes away.
+        """
+        async for event in self.events.subscribe(task_id, last_event_id, keepalive):
+            # a comment line keeps proxies from closing an idle stream
+            yield event.to_sse() if event is not None else ": keepalive\n\n"
+
+    async def wait_for_step(self, task_id: str, step_id: str, timeout: float) -> Step:
+        """
+        Get a step once it has finished, or as it is after timeout seconds.
+        """
+        if await self.step_runner.wait(step_id, timeout):
+            return await self.get_step(task_id, step_id)
+        # not queued here: run in a request, by another process or long ago
+        deadline = time.monotonic() + timeout
+        while True:
+            step = await self.get_step(task_id, step_id)
+            remaining = deadline - time.monotonic()
+            if step is None or step.status == Status.completed or remaining <= 0:
+                return step
+            await asyncio.sleep(min(0.5, remaining))
+
     async def get_step(self, task_id: str, step_id: str) -> Step:
         """
         Get a step by ID.
@@ -143,14 +260,19 @@ class Agent:
             raise
 
     async def list_artifacts(
-        self, task_id: str, page: int = 1, pageSize: int = 10
+        self,
+        task_id: str,
+        page: int = 1,
+        pageSize: int = 10,
+        cursor: Optional[str] = None,
+        count: Optional[str] = None,
     ) -> TaskArtifactsListResponse:
         """
         List the artifacts that the task has created.
         """
         try:
             artifacts, pagination = await self.db.list_artifacts(
-                task_id, page, pageSize
+                task_id, page, pageSize, cursor=cursor, count=count
             )
             return TaskArtifactsListResponse(artifacts=artifacts, pagination=pagination)
 
@@ -1,50 +1,111 @@
+import asyncio
+import functools
 import json
 import pprint
 import os
+from typing import Optional
 from agent import Agent 
 from db import AgentDB
 from schema import Step
+from schema import StepReply
 from schema import StepRequestBody
 from workspace import Workspace
 from schema import Task
 from schema import TaskRequestBody
 from prompting import PromptEngine
-from llm import chat_completion_request
+from llm import chat_completion_request, llm_stats
 from ai_profile import ProfileGenerator
 from ai_planning import AIPlanning
 from datetime import datetime
 from weaviate_memstore import WeaviateMemstore
+from local_memstore import LocalMemstore
+from conversation_store import ConversationStore, DBConversationBackend
+from context_window import ContextWindow
+from abilities.scheduler import AbilityPrefetch, AbilityScheduler
+from json_stream import parse_reply
 from agent_log import AgentLogger
 LOG = AgentLogger(__name__)
+# role_find calls before a task falls back to the default profile
+PROFILE_ATTEMPTS = 3
 
 class ForgeAgent(Agent):
 
-    def __init__(self, database: AgentDB, workspace: Workspace):
+    def __init__(
+        self,
+        database: AgentDB,
+        workspace: Workspace,
+        conversations: Optional[ConversationStore] = None,
+    ):
         super().__init__(database, workspace)
-        self.chat_history = {}
-        self.expert_profile = None
+        # chat history, instruction messages and step counts live in the
+        # store so tasks survive restarts and can move between workers
+        self.conversations = conversations or ConversationStore(
+            DBConversationBackend(database)
+        )
+        self.context_window = ContextWindow(
+            os.getenv("OPENAI_MODEL"),
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", 0)) or None,
+            response_tokens=int(os.getenv("CONTEXT_RESPONSE_TOKENS", 1024)),
+        )
+        self.ability_scheduler = AbilityScheduler(
+            self.abilities, int(os.getenv("ABILITY_CONCURRENCY", 4)), self.events
+        )
         self.prompt_engine = PromptEngine(os.getenv("OPENAI_MODEL"))
-        self.ai_plan = None
-        self.instruction_msgs = {}
-        self.task_steps_amount = {}
+        # ask the provider for a JSON object (response_format) on every step
+        self.json_mode = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+        # step replies read as sent or after a local repair, and the extra
+        # round trips spent asking the model to reformat one
+        self.replies = {"parsed": 0, "repaired": 0, "reformats": 0}
+        self.task_reformats = {}
         # memstore
         self.memstore_db = os.getenv("VECTOR_DB")
         self.memstore = None
+        # background task setups still running in this process
+        self.bootstraps = {}
+
+    def get_metrics(self) -> dict:
+        metrics = super().get_metrics()
+        metrics["context_window"] = self.context_window.stats()
+        metrics["abilities"] = self.ability_scheduler.stats()
+        metrics["llm"] = llm_stats()
+        metrics["replies"] = {**self.replies, "reformats_by_task": dict(self.task_reformats)}
+        if isinstance(self.memstore, LocalMemstore):
+            metrics["memstore"] = self.memstore.stats()
+        return metrics
+
+    def parse_step_reply(self, chat_response: str) -> Optional[dict]:
+        """The step reply as a dict, None when it isn't a StepReply even after repairs"""
+        try:
+            answer, repaired = parse_reply(chat_response)
+            reply = StepReply.model_validate(answer)
+        except ValueError as err:
+            LOG.error(f"Step reply not in the given format: {err}")
+            return None
+        self.replies["repaired" if repaired else "parsed"] += 1
+        return reply.model_dump(exclude_unset=True)
+
+    async def request_reformat(self, task_id: str, content: str) -> None:
+        """Ask the model to send its reply again, which costs the task a step"""
+        self.replies["reformats"] += 1
+        self.task_reformats[task_id] = self.task_reformats.get(task_id, 0) + 1
+        await self.add_chat(task_id, "system", content)
 
     def add_chat_memory(self, task_id: str, chat_msg: dict) -> None:
         LOG.info(f"Adding chat memory for task {task_id}")
         try:
             data_class = "chat"
-            WeaviateMemstore.add_data_obj(self.memstore,data_class,chat_msg )
+            # task_id is what stores filter and partition on
+            self.memstore.add_data_obj(data_class, {**chat_msg, "task_id": task_id})
         except Exception as err:
             LOG.error(f"add_chat_memory failed: {err}")
 
-    def add_chat(self, 
+    async def add_chat(self, 
         task_id: str, 
         role: str, 
         content: str,
         is_function: bool = False,
-        function_name: str = None):
+        function_name: str = None,
+        instruction: bool = False):
         
         if is_function:
             chat_struct = {
@@ -58,20 +119,19 @@ class ForgeAgent(Agent):
                 "content": content
             }
         
-        try:
-            if chat_struct not in self.chat_history[task_id]:
-                self.chat_history[task_id].append(chat_struct)
-            else:
-                chat_struct["role"] = "user"
-                timestamp = datetime.now().strftime("%m/%d/%Y %H:%M:%S")
-                chat_struct["content"] = f"[{timestamp}] You have gone off course and repeating the same step. Remember the instructions you are supposed to be working through and move on\n\n{self.instruction_msgs[-1]}"
-                self.chat_history[task_id].append(chat_struct)
-
-        except KeyError:
-            self.chat_history[task_id] = [chat_struct]
+        chat_history = await self.conversations.history(task_id)
+        repeated = chat_struct in chat_history or (
+            is_function and chat_history.is_near_repeat(chat_struct)
+        )
+        if repeated:
+            instructions = await self.conversations.instructions(task_id)
+            chat_struct["role"] = "user"
+            timestamp = datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+            chat_struct["content"] = f"[{timestamp}] You have gone off course and repeating the same step. Remember the instructions you are supposed to be working through and move on\n\n{instructions[-1]['content'] if instructions else ''}"
+        await self.conversations.append(task_id, chat_struct, instruction)
 
          # add chat memory
-        if not is_function and chat_struct not in self.chat_history[task_id]:
+        if not is_function and not repeated and self.memstore is not None:
             try:
                 self.add_chat_memory(task_id, chat_struct)
             except Exception as err:
@@ -79,25 +139,45 @@ class ForgeAgent(Agent):
 
 
 
-    async def create_task(self, task_request: TaskRequestBody) -> Task:
+    async def create_task(
+        self, task_request: TaskRequestBody, background: bool = False
+    ) -> Task:
         self.instruct_amt = 0
         # create task
         try:
             task = await self.db.create_task(
                 input=task_request.input,
-                additional_input=task_request.additional_input
+                additional_input=task_request.additional_input,
+                ready=False,
             )     
             LOG.info(f"Task created: {task.task_id} input: {task.input[:40]}{'...' if len(task.input) > 40 else ''}")
 
         except Exception as err:
             LOG.error(f"create_task failed: {err}")
-        
-        try:
-            if self.memstore_db == "weaviate":
-                self.memstore = WeaviateMemstore(use_embedded=True)
-        except Exception as err:
-            LOG.error(f"memstore creation failed: {err}")
 
+        if background:
+            # the client polls the task until ready, execute_step waits for it
+            bootstrap = asyncio.create_task(self.bootstrap_task(task))
+            self.bootstraps[task.task_id] = bootstrap
+            bootstrap.add_done_callback(
+                functools.partial(self._bootstrap_done, task.task_id)
+            )
+            return task
+        await self.bootstrap_task(task)
+        task.ready = True
+        return task
+
+    def _bootstrap_done(self, task_id: str, bootstrap: asyncio.Task) -> None:
+        self.bootstraps.pop(task_id, None)
+        if not bootstrap.cancelled():
+            # already logged by bootstrap_task
+            bootstrap.exception()
+
+    async def bootstrap_task(self, task: Task) -> None:
+        """
+        Set a task up for its first step. The profile, the plan and the
+        memstore don't depend on each other, so they are prepared concurrently.
+        """
         directory_path = self.workspace.get_cwd_path(task.task_id)
 
         if not os.path.exists(directory_path):
@@ -106,76 +186,154 @@ class ForgeAgent(Agent):
         else:
            LOG.info(f"Directory '{directory_path}' already exists.")
 
+        try:
+            # profile and plan belong to this task, bootstraps of others run alongside
+            _, expert_profile, plan_steps = await asyncio.gather(
+                self.setup_memstore(),
+                self.generate_profile(task),
+                self.plan_steps(task.task_id, task.input),
+            )
+            await self.set_instruction_messages(
+                task.task_id, task.input, plan_steps, expert_profile
+            )
+            await self.db.set_task_ready(task.task_id)
+        except Exception as err:
+            LOG.error(f"bootstrap of task {task.task_id} failed: {err}")
+            raise
+
+    async def setup_memstore(self) -> None:
+        try:
+            if self.memstore_db == "weaviate":
+                self.memstore = await asyncio.to_thread(
+                    WeaviateMemstore, use_embedded=True
+                )
+            elif self.memstore_db == "local" and self.memstore is None:
+                self.memstore = LocalMemstore(
+                    path=os.getenv("LOCAL_MEMSTORE_PATH") or None,
+                    ivf_threshold=int(os.getenv("LOCAL_MEMSTORE_IVF_THRESHOLD", 10000)),
+                )
+        except Exception as err:
+            LOG.error(f"memstore creation failed: {err}")
+
+    async def generate_profile(self, task: Task) -> Optional[dict]:
+        """The expert profile for task, None when the model gave no usable one"""
+        # PROFILE_MODEL is what LLM_ROUTES sees, the templates stay the gpt-3.5-turbo ones
         profile_gen = ProfileGenerator(
             task,
-            "gpt-3.5-turbo"
+            os.getenv("PROFILE_MODEL") or os.getenv("OPENAI_MODEL"),
+            prompt_model="gpt-3.5-turbo",
         )
 
         LOG.info("Generating expert profile...")
 
-        while self.expert_profile is None:
-            role_reply = await profile_gen.role_find()
-            try:        
-                self.expert_profile = json.loads(role_reply)
-            except Exception as err:
+        for attempt in range(PROFILE_ATTEMPTS):
+            # a retry asks the model again rather than the response cache
+            role_reply = await profile_gen.role_find(cache=attempt == 0)
+            try:
+                expert_profile, _ = parse_reply(role_reply)
+            except ValueError as err:
                 LOG.error(f"role_reply failed\n{err}")
-
-        LOG.info("Profile generated!")
-        self.instruction_msgs[task.task_id] = []
-        await self.set_instruction_messages(task.task_id, task.input)
-        self.task_steps_amount[task.task_id] = 0
-        return task
+                continue
+            if isinstance(expert_profile, dict):
+                LOG.info("Profile generated!")
+                return expert_profile
+            LOG.error(f"role_reply is not an object\n{role_reply}")
+        LOG.warning(f"No profile after {PROFILE_ATTEMPTS} attempts, using the default")
+        return None
+
+    async def plan_steps(self, task_id: str, task_input: str):
+        ai_plan = AIPlanning(
+            task_input,
+            task_id,
+            self.abilities.list_abilities_for_prompt(),
+            self.workspace,
+            os.getenv("PLANNING_MODEL") or os.getenv("OPENAI_MODEL"),
+            prompt_model="gpt-4",
+        )
+        try:
+            return await ai_plan.create_steps()
+        except Exception as err:
+            LOG.error(f"plan_steps_prompt failed\n{err}")
 
 
-    async def execute_step(self, task_id: str, step_request: StepRequestBody) -> Step:
+    async def execute_step(
+        self,
+        task_id: str,
+        step_request: StepRequestBody,
+        step: Optional[Step] = None,
+    ) -> Step:
+        if bootstrap := self.bootstraps.get(task_id):
+            await asyncio.shield(bootstrap)
         # have AI determine last step
-        step = await self.db.create_step(
-            task_id=task_id,
-            input=step_request,
-            additional_input=step_request.additional_input,
-            is_last=False
-        )
+        if step is None:
+            step = await self.create_step(task_id, step_request)
 
         step.status = "created"
-        self.task_steps_amount[task_id] += 1
-        LOG.info(f"Step {self.task_steps_amount[task_id]}")
+        LOG.info(f"Step {await self.conversations.next_step(task_id)}")
         timestamp = datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+        prefetch = AbilityPrefetch(self.ability_scheduler, task_id, step.step_id)
 
+        def on_token(delta: str) -> None:
+            self.events.publish(task_id, "llm_token", step_id=step.step_id, delta=delta)
+            prefetch.feed(delta)
+
+        chat_response = None
         try:
-            LOG.info(f"chat history {self.chat_history[task_id]}")
+            chat_history = await self.conversations.messages(task_id)
+            LOG.info(f"chat history {chat_history}")
+            messages, usage = self.context_window.fit(
+                chat_history,
+                await self.conversations.instructions(task_id),
+                task_id,
+            )
+            LOG.info(f"context tokens {usage}")
             chat_completion_parms = {
-                "messages": self.chat_history[task_id],
+                "messages": messages,
                 "model": os.getenv("OPENAI_MODEL"),
-                "temperature": 0.1
+                "temperature": 0.1,
+                "response_format": {"type": "json_object"} if self.json_mode else None,
             }
 
-            chat_response = await chat_completion_request(**chat_completion_parms)
+            provider_usage = {}
+            chat_response = await chat_completion_request(
+                **chat_completion_parms,
+                on_token=on_token,
+                on_usage=provider_usage.update,
+            )
+            self.context_window.record_usage(usage, provider_usage)
+            LOG.info(f"provider tokens {provider_usage}")
 
         except Exception as err:
-            LOG.error(f"API token error. Cut down messages {err}")
-            step.status = "error"
-        
+            # a timeout or API error leaves no reply to work with, the step fails
+            error = str(err) or type(err).__name__
+            LOG.error(f"API token error. Cut down messages {error}")
+            await prefetch.discard()
+            step.status = "completed"
+            step.is_last = False
+            step.output = f"Step failed: {error}"
+            await self.db.update_step(
+                task_id,
+                step.step_id,
+                step.status,
+                step.additional_input,
+                output=step.output,
+                is_last=step.is_last,
+            )
+            self.events.publish(task_id, "step_failed", step_id=step.step_id, error=error)
+            return step
+
         LOG.info(f"chat_response\n{chat_response}")
 
         try:
-            answer = json.loads(chat_response)
-            output = None     
-            # make sure about reply format
-            #ability
-            #abilities
-            #check one ability or more abilities
-            correct_spelling = ""
-            if "ability" in answer:
-                correct_spelling = "ability"
-            elif "abilities" in answer:
-                correct_spelling = "abilities"
-
-
-            if (correct_spelling not in answer or "thoughts" not in answer):
+            # fences and text around the JSON are repaired here, without a round trip
+            answer = self.parse_step_reply(chat_response)
+            output = None
+
+            if answer is None:
                 system_prompt = self.prompt_engine.load_prompt("system-reformat")
                 LOG.info("your rply was not in given json format ...")
-                self.add_chat(task_id,"system",f"Your reply was not in the given JSON format.\n{system_prompt}")
-                LOG.error("chat[-1]: {self.chat_history[task_id][-1]}")
+                await self.request_reformat(task_id, f"Your reply was not in the given JSON format.\n{system_prompt}")
+                LOG.error("chat[-1]: {chat_history[-1]}")
                 LOG.error(f"chat_response\n{chat_response}")
             else:
                 # Set the step output and is_last from AI
@@ -188,46 +346,47 @@ class ForgeAgent(Agent):
 
 
                 if "abilities" in answer:
-                    ability = answer["abilities"]
-                    for n in range(len(ability)):
-                        if ability and (ability[n]["name"] != "" and ability[n]["name"] != None and ability[n]["name"] != "None"):
-                            ability_name = ability[n]["name"]
-                            LOG.info(f"Running Ability:{ability_name}")
-                            try:
-                                if "args" in ability[n]:
-                                    output = await self.abilities.run_ability(task_id,ability[n]["name"],**ability[n]["args"])
-                                else:
-                                    output = await self.abilities.run_ability(task_id,ability[n]["name"])   
-                            except Exception as err:
-                                LOG.error(f"Ability run failed: {err}")
-                                output = err
-                                self.add_chat(task_id=task_id,role="system",content=f"[{timestamp}] Ability {ability[n]['name']} failed to run: {err}")
+                    positions = [
+                        n for n, call in enumerate(answer["abilities"])
+                        if call["name"] != "" and call["name"] != None and call["name"] != "None"
+                    ]
+                    ability = [answer["abilities"][n] for n in positions]
+                    # independent calls run concurrently, results come back in reply order
+                    results = await self.ability_scheduler.run_all(
+                        task_id,
+                        ability,
+                        step.step_id,
+                        started=[prefetch.take(n, call) for n, call in zip(positions, ability)],
+                    )
+                    for n, (output, err) in enumerate(results):
+                        if err is not None:
+                            LOG.error(f"Ability run failed: {err}")
+                            output = err
+                            await self.add_chat(task_id=task_id,role="system",content=f"[{timestamp}] Ability {ability[n]['name']} failed to run: {err}")
+                        else:
+                            if output == None:
+                                output = ""
+                            LOG.info(f"Ability Output\n{output}")
+                            if isinstance(output, bytes):
+                                output = output.decode()
+                            if "args" in ability[n]:
+                                ccontent = f"[Arguments {ability[n]['args']}]: {output} "
                             else:
-                                if output == None:
-                                    output = ""
-                                LOG.info(f"Ability Output\n{output}")
-                                if isinstance(output, bytes):
-                                    output = output.decode()
-                                if "args" in ability[n]:
-                                    ccontent = f"[Arguments {ability[n]['args']}]: {output} "
-                                else:
-                                    ccontent = output
-                                self.add_chat(task_id=task_id,role="function",content=ccontent,is_function=True,function_name=ability[n]["name"])
-                                step.status = "completed"
-                                if ability[n]["name"] == "finish":
-                                    step.is_last = True
+                                ccontent = output
+                            await self.add_chat(task_id=task_id,role="function",content=ccontent,is_function=True,function_name=ability[n]["name"])
+                            step.status = "completed"
+                            if ability[n]["name"] == "finish":
+                                step.is_last = True
 
                 elif "ability" in answer:
                     ability = answer["ability"]
-                    try:
-                        if "args" in ability.keys():
-                            output = await self.abilities.run_ability(task_id,ability["name"],**ability["args"])
-                        else:
-                            output = await self.abilities.run_ability(task_id,ability["name"])   
-                    except Exception as err:
+                    [(output, err)] = await self.ability_scheduler.run_all(
+                        task_id, [ability], step.step_id, started=[prefetch.take(0, ability)]
+                    )
+                    if err is not None:
                         LOG.error(f"Ability run failed: {err}")
                         output = err
-                        self.add_chat(task_id=task_id,role="system",content=f"[{timestamp}] Ability {ability['name']} failed to run: {err}")
+                        await self.add_chat(task_id=task_id,role="system",content=f"[{timestamp}] Ability {ability['name']} failed to run: {err}")
                     LOG.info(f"Ability Output\n{output}")
                     if output == None or output == "":
                         output = "Ability Executed successfully.Task completed"
@@ -238,7 +397,7 @@ class ForgeAgent(Agent):
                         ccontent = f"[Arguments {ability['args']}]: {output} "
                     else:
                         ccontent = output
-                    self.add_chat(task_id=task_id,role="function",content=ccontent,is_function=True,function_name=ability["name"])
+                    await self.add_chat(task_id=task_id,role="function",content=ccontent,is_function=True,function_name=ability["name"])
                     step.status = "completed"
                     if ability["name"] == "finish":
                         step.is_last = True
@@ -250,33 +409,52 @@ class ForgeAgent(Agent):
             LOG.error(f"chat_response: {chat_response}")
             step.status = "completed"
             step.is_last = False
-            self.add_chat(task_id,"system",f"Something went wrong with processing on our end. Please reformat your reply and try again.\n{e}")
+            await self.request_reformat(task_id, f"Something went wrong with processing on our end. Please reformat your reply and try again.\n{e}")
+        await prefetch.discard()
     # dump whole chat log at last step
-        if step.is_last and task_id in self.chat_history:
+        if step.is_last:
             LOG.info("dump whole chat log at last step >>")
-            LOG.info(f"{pprint.pformat(self.chat_history[task_id])}")
+            LOG.info(f"{pprint.pformat(await self.conversations.messages(task_id))}")
+            self.conversations.forget(task_id)
+        # persist the result so polling clients and other workers can read it
+        await self.db.update_step(
+            task_id,
+            step.step_id,
+            step.status,
+            step.additional_input,
+            output=step.output,
+            is_last=step.is_last,
+        )
+        self.events.publish(
+            task_id,
+            "step_completed",
+            step_id=step.step_id,
+            status=step.status,
+            output=step.output,
+            is_last=step.is_last,
+        )
         # Return the completed step
         return step
 
-    async def set_instruction_messages(self, task_id: str, task_input: str):
+    async def set_instruction_messages(
+        self, task_id: str, task_input: str, plan_steps, expert_profile: Optional[dict] = None
+    ):
 
         system_prompt = self.prompt_engine.load_prompt("system-reformat")
         LOG.info(f"{system_prompt}")
-        self.instruction_msgs[task_id].append(("system", system_prompt))
-        self.add_chat(task_id, "system", system_prompt)
+        await self.add_chat(task_id, "system", system_prompt, instruction=True)
         # add abilities prompt
         abilities_prompt = self.prompt_engine.load_prompt(
             "abilities-list",
             **{"abilities": self.abilities.list_abilities_for_prompt()}
         )
         LOG.info(f"{abilities_prompt}")
-        self.instruction_msgs[task_id].append(("system", abilities_prompt))
-        self.add_chat(task_id, "system", abilities_prompt)
+        await self.add_chat(task_id, "system", abilities_prompt, instruction=True)
         # add role system prompt
         try:
             role_prompt_params = {
-                "name": self.expert_profile["name"],
-                "expertise": self.expert_profile["expertise"]
+                "name": expert_profile["name"],
+                "expertise": expert_profile["expertise"]
             }
         except Exception as err:
             LOG.error(f"""
@@ -295,20 +473,7 @@ class ForgeAgent(Agent):
             **role_prompt_params
         )
         LOG.info(f"{role_prompt}")
-        self.instruction_msgs[task_id].append(("system", role_prompt))
-        self.add_chat(task_id, "system", role_prompt)
-        self.ai_plan = AIPlanning(
-            task_input,
-            task_id,
-            self.abilities.list_abilities_for_prompt(),
-            self.workspace,
-            "gpt-4"
-        )
-        try:
-            plan_steps = await self.ai_plan.create_steps()
-        except Exception as err:
-            LOG.error(f"plan_steps_prompt failed\n{err}")
-        
+        await self.add_chat(task_id, "system", role_prompt, instruction=True)
         ctoa_prompt_params = {
             "plan": plan_steps,
             "task": task_input
@@ -319,5 +484,4 @@ class ForgeAgent(Agent):
             **ctoa_prompt_params
         )
         LOG.info(f"{task_prompt}")
-        self.instruction_msgs[task_id].append(("user", task_prompt))
-        self.add_chat(task_id, "user", task_prompt)
+        await self.add_chat(task_id, "user", task_prompt, instruction=True)
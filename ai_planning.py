@@ -2,6 +2,7 @@
 import os
 from prompting import PromptEngine
 from llm import chat_completion_request
+from llm_limiter import PRIORITY_BACKGROUND
 from workspace import Workspace
 from agent_log import AgentLogger
 LOG = AgentLogger(__name__)
@@ -13,14 +14,18 @@ class AIPlanning:
         task_id: str,
         abilities: str,
         workspace: Workspace,
-        model: str = os.getenv("OPENAI_MODEL")):
-        
+        model: str = os.getenv("OPENAI_MODEL"),
+        prompt_model: str = None):
+        """
+        model is the one asked, prompt_model (default model) picks the
+        prompt templates.
+        """
         self.task = task
         self.task_id = task_id
         self.abilities = abilities
         self.workspace = workspace
         self.model = model
-        self.prompt_engine = PromptEngine(self.model)
+        self.prompt_engine = PromptEngine(prompt_model or self.model)
 
     async def create_steps(self) -> str:
         abilities_prompt = self.prompt_engine.load_prompt(
@@ -61,6 +66,6 @@ class AIPlanning:
         }
         
         response = await chat_completion_request(
-            **chat_completion_parms)
+            **chat_completion_parms, cache=True, priority=PRIORITY_BACKGROUND)
             
         return response
@@ -3,25 +3,39 @@ import openai
 import os
 import json
 from prompting import PromptEngine
+from json_stream import parse_reply
 from llm import chat_completion_request
+from llm_limiter import PRIORITY_BACKGROUND
+
+
+def is_profile(reply: str) -> bool:
+    """Whether reply parses to a JSON object"""
+    try:
+        profile, _ = parse_reply(reply)
+    except ValueError:
+        return False
+    return isinstance(profile, dict)
 
 class ProfileGenerator:
     def __init__(
         self, 
         task: str,
-        model: str = os.getenv("OPENAI_MODEL")):
+        model: str = os.getenv("OPENAI_MODEL"),
+        prompt_model: str = None):
         """
         Initialize the profile generator with the task to be performed.
+        model is the one asked, prompt_model (default model) picks the
+        prompt templates.
         """
         self.task = task
         self.model = model
         
-        self.prompt_engine = PromptEngine(self.model)
+        self.prompt_engine = PromptEngine(prompt_model or self.model)
 
-    async def role_find(self) -> str:
+    async def role_find(self, cache: bool = True) -> str:
         """
         Ask LLM what role this task would fit
-        Return role
+        Return role; only replies holding a JSON object are cached
         """
         role_prompt = self.prompt_engine.load_prompt(
             "role-selection",
@@ -57,7 +71,10 @@ class ProfileGenerator:
         }
 
         response = await chat_completion_request(
-            **chat_completion_parms)
+            **chat_completion_parms,
+            cache=cache,
+            accept=is_profile,
+            priority=PRIORITY_BACKGROUND)
         
 
         return response
@@ -0,0 +1,161 @@
+import argparse
+import datetime
+import os
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from agent_log import AgentLogger
+from db import (
+    AgentDB,
+    ArtifactModel,
+    ChatMessageModel,
+    ConversationModel,
+    StepModel,
+    TaskArchiveModel,
+    TaskModel,
+    convert_to_step,
+    convert_to_task,
+    pack_archive,
+)
+
+LOG = AgentLogger(__name__)
+
+
+class TaskArchiver:
+    """
+    Moves finished tasks (an is_last step and no step touched for max_age)
+    from the live tables into tasks_archive, one batch per transaction so
+    a run can be stopped and resumed at any point.
+
+    The task, step and artifact entries of the database's read cache are
+    invalidated for every archived task. That only reaches the cache of
+    this process: run as a separate CLI, the server's in-memory cache keeps
+    serving archived rows until they expire, so DATABASE_CACHE_TTL bounds
+    how long a server can show a task that has already been archived.
+    """
+
+    def __init__(
+        self,
+        database: AgentDB,
+        max_age: datetime.timedelta,
+        batch_size: int = 100,
+    ) -> None:
+        self.database = database
+        self.max_age = max_age
+        self.batch_size = batch_size
+
+    def finished_task_ids(self, session, cutoff: datetime.datetime) -> List[str]:
+        finished = select(StepModel.task_id).filter(StepModel.is_last == True)
+        query = (
+            select(StepModel.task_id)
+            .filter(StepModel.task_id.in_(finished))
+            .group_by(StepModel.task_id)
+            .having(func.max(StepModel.modified_at) < cutoff)
+            .limit(self.batch_size)
+        )
+        return list(session.scalars(query))
+
+    def archive_batch(self) -> int:
+        """Archive up to batch_size tasks, returns how many were moved"""
+        cutoff = datetime.datetime.utcnow() - self.max_age
+        try:
+            with self.database.Session() as session:
+                task_ids = self.finished_task_ids(session, cutoff)
+                if not task_ids:
+                    return 0
+                tasks = session.scalars(
+                    select(TaskModel)
+                    .options(selectinload(TaskModel.artifacts))
+                    .filter(TaskModel.task_id.in_(task_ids))
+                ).all()
+                steps = session.scalars(
+                    select(StepModel)
+                    .options(selectinload(StepModel.artifacts))
+                    .filter(StepModel.task_id.in_(task_ids))
+                ).all()
+                steps_by_task = {}
+                for step in steps:
+                    steps_by_task.setdefault(step.task_id, []).append(
+                        convert_to_step(step)
+                    )
+                for task in tasks:
+                    session.add(
+                        TaskArchiveModel(
+                            task_id=task.task_id,
+                            created_at=task.created_at,
+                            payload=pack_archive(
+                                convert_to_task(task),
+                                steps_by_task.get(task.task_id, []),
+                            ),
+                        )
+                    )
+                for model in (
+                    ChatMessageModel,
+                    ConversationModel,
+                    ArtifactModel,
+                    StepModel,
+                    TaskModel,
+                ):
+                    session.execute(
+                        delete(model).where(model.task_id.in_(task_ids)),
+                        execution_options={"synchronize_session": False},
+                    )
+                session.commit()
+                if self.database.cache is not None:
+                    for task in tasks:
+                        self.database.cache.invalidate(task_id=task.task_id)
+                        for artifact in task.artifacts:
+                            self.database.cache.invalidate(artifact_id=artifact.artifact_id)
+                    for step in steps:
+                        self.database.cache.invalidate(step_id=step.step_id)
+                return len(task_ids)
+        except SQLAlchemyError as e:
+            LOG.error(f"SQLAlchemy error while archiving tasks: {e}")
+            raise
+        except Exception as e:
+            LOG.error(f"Unexpected error while archiving tasks: {e}")
+            raise
+
+    def run(self, max_batches: Optional[int] = None) -> int:
+        archived = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = self.archive_batch()
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            LOG.info(f"Archived {archived} tasks so far")
+        return archived
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Archive finished agent tasks",
+        epilog="A running server may keep serving archived tasks from its read "
+        "cache for up to DATABASE_CACHE_TTL seconds.",
+    )
+    parser.add_argument(
+        "--max-age-days",
+        type=float,
+        default=float(os.getenv("ARCHIVE_MAX_AGE_DAYS", 30)),
+        help="archive tasks whose last step finished more than this many days ago",
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--max-batches",
+        type=int,
+        default=None,
+        help="stop after this many batches, the next run picks up from there",
+    )
+    args = parser.parse_args()
+
+    archiver = TaskArchiver(
+        AgentDB(os.getenv("DATABASE_STRING")),
+        datetime.timedelta(days=args.max_age_days),
+        batch_size=args.batch_size,
+    )
+    LOG.info(f"Archived {archiver.run(args.max_batches)} tasks")
@@ -0,0 +1,65 @@
+"""
+Repeat detection cost of building a task's chat history, message by
+message: the old list scan (run twice per append, as add_chat did) against
+ChatHistory's hash index with the near-repeat window.
+
+Run from the repository root:
+
+    python benchmarks/chat_history.py --messages 1000 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_store import ChatHistory  # noqa: E402
+
+
+def messages(count: int, output_size: int) -> list:
+    """Alternating assistant replies and function outputs, all distinct"""
+    return [
+        {"role": "function", "name": "read_file", "content": f"{n} " + "x" * output_size}
+        if n % 2
+        else {"role": "assistant", "content": f'{{"thoughts": {{"speak": "step {n}"}}}}'}
+        for n in range(count)
+    ]
+
+
+def list_scan(chat: list) -> float:
+    history = []
+    started = time.perf_counter()
+    for message in chat:
+        repeated = message in history
+        history.append(message)
+        # add_chat scanned again before writing the chat memory
+        if not repeated and message not in history:
+            pass
+    return time.perf_counter() - started
+
+
+def hash_index(chat: list) -> float:
+    history = ChatHistory()
+    started = time.perf_counter()
+    for message in chat:
+        if message not in history and not history.is_near_repeat(message):
+            history.append(message)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--output-size", type=int, default=2000)
+    args = parser.parse_args()
+    print(f"{'messages':>9}  {'history':<12}{'total ms':>10}{'us/append':>11}")
+    for count in args.messages:
+        chat = messages(count, args.output_size)
+        for name, run in (("list scan", list_scan), ("ChatHistory", hash_index)):
+            elapsed = run(chat)
+            print(f"{count:>9}  {name:<12}{elapsed * 1000:>10.1f}{elapsed / count * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Lookup latency on the steps and artifacts tables at growing sizes, with the
+task/step indexes and the artifact unique key, and again with them dropped.
+
+Each size fills a fresh sqlite database with that many steps and as many
+artifacts (one per step, 100 steps per task). Run from the repository root:
+
+    python benchmarks/db_indexes.py --rows 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text  # noqa: E402
+from db import AgentDB, ArtifactModel, StepModel, TaskModel  # noqa: E402
+
+STEPS_PER_TASK = 100
+CHUNK = 50000
+# everything added for step and artifact lookups
+INDEXES = (
+    "ix_steps_task_id_created_at",
+    "ix_artifacts_task_id_created_at",
+    "ix_artifacts_step_id",
+    "uq_artifacts_task_file_path",
+)
+
+
+def fill(db: AgentDB, rows: int) -> list:
+    """Insert rows steps and artifacts, return (task_id, step_id, file_name) samples"""
+    start = datetime.datetime(2024, 1, 1)
+    samples = []
+    with db.engine.begin() as conn:
+        for first in range(0, rows, CHUNK):
+            tasks, steps, artifacts = [], [], []
+            for n in range(first, min(first + CHUNK, rows)):
+                created = start + datetime.timedelta(seconds=n)
+                if n % STEPS_PER_TASK == 0:
+                    task_id = str(uuid.uuid4())
+                    tasks.append({"task_id": task_id, "input": "bench", "created_at": created})
+                step_id = str(uuid.uuid4())
+                steps.append(
+                    {"step_id": step_id, "task_id": task_id, "status": "completed", "created_at": created}
+                )
+                artifacts.append(
+                    {
+                        "artifact_id": str(uuid.uuid4()),
+                        "task_id": task_id,
+                        "step_id": step_id,
+                        "file_name": f"file{n}.txt",
+                        "relative_path": "out/",
+                        "created_at": created,
+                    }
+                )
+                if n % 997 == 0:
+                    samples.append((task_id, step_id, f"file{n}.txt"))
+            if tasks:
+                conn.execute(insert(TaskModel), tasks)
+            conn.execute(insert(StepModel), steps)
+            conn.execute(insert(ArtifactModel), artifacts)
+    return samples
+
+
+def timed(samples: list, query) -> float:
+    """Median milliseconds of query over the samples"""
+    latencies = []
+    for sample in samples:
+        started = time.perf_counter()
+        query(*sample)
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies) * 1000
+
+
+def lookups(db: AgentDB, samples: list) -> dict:
+    with db.Session() as session:
+        return {
+            "steps by task": timed(
+                samples,
+                lambda task_id, step_id, file_name: session.query(StepModel)
+                .filter_by(task_id=task_id)
+                .order_by(StepModel.created_at, StepModel.step_id)
+                .limit(10)
+                .all(),
+            ),
+            "artifacts by step": timed(
+                samples,
+                lambda task_id, step_id, file_name: session.query(ArtifactModel)
+                .filter_by(step_id=step_id)
+                .all(),
+            ),
+            "artifact dedupe": timed(
+                samples,
+                lambda task_id, step_id, file_name: session.query(ArtifactModel)
+                .filter_by(task_id=task_id, file_name=file_name, relative_path="out/")
+                .first(),
+            ),
+        }
+
+
+def upserts(db: AgentDB, samples: list) -> float:
+    async def run() -> float:
+        latencies = []
+        for task_id, step_id, file_name in samples:
+            started = time.perf_counter()
+            await db.create_artifact(task_id, file_name, "out/", step_id=step_id)
+            latencies.append(time.perf_counter() - started)
+        return statistics.median(latencies) * 1000
+
+    return asyncio.run(run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    print(f"{'rows':>9}  {'lookup':<20}{'indexed ms':>12}{'no index ms':>13}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as folder:
+            db = AgentDB(f"sqlite:///{folder}/bench.db")
+            samples = fill(db, rows)
+            samples = random.Random(0).sample(samples, min(args.queries, len(samples)))
+            indexed = lookups(db, samples)
+            indexed["artifact upsert"] = upserts(db, samples)
+            with db.engine.begin() as conn:
+                for name in INDEXES:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            plain = lookups(db, samples)
+            db.engine.dispose()
+        for name, latency in indexed.items():
+            baseline = f"{plain[name]:>13.3f}" if name in plain else f"{'n/a':>13}"
+            print(f"{rows:>9}  {name:<20}{latency:>12.3f}{baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Event-loop stall of AgentDB against AsyncAgentDB.
+
+A heartbeat coroutine sleeps 1ms in a loop while concurrent workers create,
+update and list steps; the time it wakes up late is time the loop was
+blocked. Run from the repository root:
+
+    python benchmarks/db_stall.py --workers 32 --rounds 20
+    python benchmarks/db_stall.py --database "postgresql://user@host/bench"
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import AgentDB, AsyncAgentDB  # noqa: E402
+from schema import StepRequestBody  # noqa: E402
+
+HEARTBEAT = 0.001
+
+
+async def heartbeat(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(time.perf_counter() - started - HEARTBEAT)
+
+
+async def worker(db, task_id: str, rounds: int, latencies: list) -> None:
+    for n in range(rounds):
+        started = time.perf_counter()
+        step = await db.create_step(task_id, StepRequestBody(input=f"step {n}"))
+        await db.update_step(task_id, step.step_id, "completed", output="done")
+        await db.list_steps(task_id, per_page=10)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(db_class, database_string: str, workers: int, rounds: int) -> dict:
+    db = db_class(database_string)
+    tasks = [await db.create_task(f"task {n}") for n in range(workers)]
+    lags, latencies = [], []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(db, t.task_id, rounds, latencies) for t in tasks))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    await db.close()
+    latencies.sort()
+    return {
+        "wall_s": elapsed,
+        "stall_total_s": sum(lags),
+        "stall_max_ms": max(lags) * 1000,
+        "op_p50_ms": statistics.median(latencies) * 1000,
+        "op_p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", help="DATABASE_STRING, a temporary sqlite file by default")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'class':<14}{'wall s':>9}{'stall s':>9}{'max stall ms':>14}{'p50 ms':>9}{'p99 ms':>9}")
+    for db_class in (AgentDB, AsyncAgentDB):
+        with tempfile.TemporaryDirectory() as folder:
+            database = args.database or f"sqlite:///{folder}/bench.db"
+            result = asyncio.run(run(db_class, database, args.workers, args.rounds))
+        print(
+            f"{db_class.__name__:<14}{result['wall_s']:>9.2f}{result['stall_total_s']:>9.2f}"
+            f"{result['stall_max_ms']:>14.1f}{result['op_p50_ms']:>9.1f}{result['op_p99_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Insert and query latency of LocalMemstore, brute force and with its IVF
+index, and of WeaviateMemstore when a Weaviate instance is configured.
+
+The objects are chat messages of one task drawn from a set of topics;
+each query is a few words of a stored message. IVF recall@10 is measured
+against the brute-force results of the same store. Weaviate vectorizes
+with text2vec-openai, so its results are not comparable and only its
+latency is reported; it needs OPENAI_API_KEY and WEAVIATE_URL plus
+WEAVIATE_API_KEY (or --weaviate-embedded). Without them it is skipped.
+Run from the repository root:
+
+    python benchmarks/memstore.py --objects 1000 10000 50000
+    python benchmarks/memstore.py --objects 1000 --weaviate
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_memstore import LocalMemstore  # noqa: E402
+
+TOPICS = 50
+WORDS_PER_TOPIC = 40
+
+
+def corpus(count: int, queries: int, seed: int = 0) -> tuple:
+    """(messages, queries): messages mix one topic's words with common ones"""
+    rng = random.Random(seed)
+    common = [f"w{n}" for n in range(200)]
+    topics = [[f"t{t}x{n}" for n in range(WORDS_PER_TOPIC)] for t in range(TOPICS)]
+    messages = []
+    for _ in range(count):
+        topic = rng.choice(topics)
+        words = rng.sample(topic, 8) + rng.sample(common, 6)
+        rng.shuffle(words)
+        messages.append(" ".join(words))
+    questions = [" ".join(rng.sample(rng.choice(messages).split(), 4)) for _ in range(queries)]
+    return messages, questions
+
+
+def summary(latencies: list) -> tuple:
+    ordered = sorted(latencies)
+    return (
+        statistics.median(ordered) * 1000,
+        ordered[int(0.99 * (len(ordered) - 1))] * 1000,
+    )
+
+
+def run(memstore, task_id: str, messages: list, questions: list) -> dict:
+    inserts = []
+    for message in messages:
+        started = time.perf_counter()
+        memstore.add_data_obj("chat", {"role": "user", "content": message, "task_id": task_id})
+        inserts.append(time.perf_counter() - started)
+    if isinstance(memstore, LocalMemstore):
+        # one query starts the index build, wait for it to be in use
+        memstore.get_data_obj(task_id, "chat", questions[0])
+        memstore.wait_for_indexes()
+    queries, results = [], []
+    for question in questions:
+        started = time.perf_counter()
+        found = memstore.get_data_obj(task_id, "chat", question)
+        queries.append(time.perf_counter() - started)
+        results.append([obj["content"] for obj in found])
+    return {"insert": summary(inserts), "query": summary(queries), "results": results}
+
+
+def recall(found: list, exact: list) -> float:
+    return statistics.mean(
+        len(set(got) & set(want)) / len(want) for got, want in zip(found, exact) if want
+    )
+
+
+def weaviate_store(embedded: bool):
+    from weaviate_memstore import WeaviateMemstore
+
+    return WeaviateMemstore(use_embedded=embedded)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--objects", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-probe", type=int, default=16)
+    parser.add_argument("--weaviate", action="store_true", help="also run against WEAVIATE_URL")
+    parser.add_argument("--weaviate-embedded", action="store_true")
+    args = parser.parse_args()
+    weaviate = None
+    if args.weaviate or args.weaviate_embedded:
+        if args.weaviate_embedded or os.getenv("WEAVIATE_URL"):
+            weaviate = weaviate_store(args.weaviate_embedded)
+        else:
+            print("weaviate: skipped, WEAVIATE_URL is not set\n")
+    print(
+        f"{'objects':>8}  {'store':<12}{'insert p50':>11}{'insert p99':>11}"
+        f"{'query p50':>11}{'query p99':>11}{'recall@10':>11}"
+    )
+    for count in args.objects:
+        messages, questions = corpus(count, args.queries)
+        stores = [
+            ("brute force", LocalMemstore(ivf_threshold=0)),
+            ("ivf", LocalMemstore(ivf_threshold=min(count, 10000), n_probe=args.n_probe)),
+        ]
+        if weaviate is not None:
+            stores.append(("weaviate", weaviate))
+        exact = None
+        for name, memstore in stores:
+            # a fresh task per run, Weaviate keeps what earlier runs stored
+            result = run(memstore, str(uuid.uuid4()), messages, questions)
+            if exact is None:
+                exact = result["results"]
+            quality = f"{recall(result['results'], exact):>11.3f}" if name != "weaviate" else f"{'n/a':>11}"
+            print(
+                f"{count:>8}  {name:<12}"
+                f"{result['insert'][0]:>11.3f}{result['insert'][1]:>11.3f}"
+                f"{result['query'][0]:>11.3f}{result['query'][1]:>11.3f}{quality}"
+            )
+
+
+if __name__ == "__main__":
+    main()
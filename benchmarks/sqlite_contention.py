@@ -0,0 +1,113 @@
+"""
+SQLite under concurrent steps: AsyncAgentDB with its SQLite profile (WAL,
+pragmas, single writer lane) against the same class with the profile off.
+
+Writers create and update steps while readers list steps and fetch tasks;
+reported are operations per second, p99 latency and "database is locked"
+failures. Run from the repository root:
+
+    python benchmarks/sqlite_contention.py --writers 32 --readers 32 --rounds 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from schema import StepRequestBody  # noqa: E402
+
+
+def open_db(path: str, profile: bool) -> db.AsyncAgentDB:
+    apply_profile = db.apply_sqlite_profile
+    if not profile:
+        db.apply_sqlite_profile = lambda engine: None
+    try:
+        agent_db = db.AsyncAgentDB(f"sqlite:///{path}")
+    finally:
+        db.apply_sqlite_profile = apply_profile
+    if not profile:
+        # every coroutine writes on its own connection, as before the profile
+        agent_db._write_lock = None
+    return agent_db
+
+
+async def timed(op, latencies: list, failures: list) -> None:
+    started = time.perf_counter()
+    try:
+        await op()
+    except Exception as e:
+        failures.append(e)
+        return
+    latencies.append(time.perf_counter() - started)
+
+
+async def writer(agent_db, task_id: str, rounds: int, latencies: list, failures: list) -> None:
+    for n in range(rounds):
+        async def step() -> None:
+            created = await agent_db.create_step(task_id, StepRequestBody(input=f"step {n}"))
+            await agent_db.update_step(task_id, created.step_id, "completed", output="x" * 512)
+
+        await timed(step, latencies, failures)
+
+
+async def reader(agent_db, task_id: str, rounds: int, latencies: list, failures: list) -> None:
+    for _ in range(rounds):
+        async def read() -> None:
+            await agent_db.get_task(task_id)
+            await agent_db.list_steps(task_id, per_page=20)
+
+        await timed(read, latencies, failures)
+
+
+async def run(profile: bool, writers: int, readers: int, rounds: int) -> dict:
+    with tempfile.TemporaryDirectory() as folder:
+        agent_db = open_db(f"{folder}/bench.db", profile)
+        tasks = [(await agent_db.create_task(f"task {n}")).task_id for n in range(writers)]
+        writes, reads, failures = [], [], []
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(writer(agent_db, tasks[n], rounds, writes, failures) for n in range(writers)),
+            *(reader(agent_db, tasks[n % writers], rounds, reads, failures) for n in range(readers)),
+        )
+        elapsed = time.perf_counter() - started
+        await agent_db.close()
+
+    def p99(values: list) -> float:
+        return sorted(values)[int(0.99 * (len(values) - 1))] * 1000 if values else float("nan")
+
+    return {
+        "ops_per_s": (len(writes) + len(reads)) / elapsed,
+        "write_p50_ms": statistics.median(writes) * 1000 if writes else float("nan"),
+        "write_p99_ms": p99(writes),
+        "read_p99_ms": p99(reads),
+        "locked": sum("locked" in str(e) for e in failures),
+        "failed": len(failures),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    print(
+        f"{'profile':<9}{'ops/s':>9}{'write p50':>11}{'write p99':>11}"
+        f"{'read p99':>10}{'locked':>8}{'failed':>8}"
+    )
+    for profile in (False, True):
+        result = asyncio.run(run(profile, args.writers, args.readers, args.rounds))
+        print(
+            f"{'on' if profile else 'off':<9}{result['ops_per_s']:>9.0f}"
+            f"{result['write_p50_ms']:>11.1f}{result['write_p99_ms']:>11.1f}"
+            f"{result['read_p99_ms']:>10.1f}{result['locked']:>8}{result['failed']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import functools
+import hashlib
+import json
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import tiktoken
+from agent_log import AgentLogger
+
+LOG = AgentLogger(__name__)
+
+# prompt + completion limit per model family, longest prefix wins
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+# per-message framing overhead of the chat format
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3
+
+
+def context_limit(model: Optional[str]) -> int:
+    matches = [name for name in MODEL_CONTEXT_TOKENS if (model or "").startswith(name)]
+    if not matches:
+        return DEFAULT_CONTEXT_TOKENS
+    return MODEL_CONTEXT_TOKENS[max(matches, key=len)]
+
+
+class TokenCounter:
+    """
+    Counts chat tokens with tiktoken. Counts are memoized per text, so the
+    unchanged part of a growing history is not re-encoded on every step.
+    """
+
+    def __init__(self, model: Optional[str]) -> None:
+        self.model = model
+        try:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # the encoding files are downloaded on first use
+            LOG.warning(f"tiktoken encoding unavailable, estimating tokens: {e}")
+            self.encoding = None
+        self.count_text = functools.lru_cache(maxsize=4096)(self._count_text)
+
+    def _count_text(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        tokens = TOKENS_PER_MESSAGE + self.count_text(str(message.get("content", "")))
+        if message.get("name"):
+            tokens += TOKENS_PER_NAME + self.count_text(message["name"])
+        return tokens
+
+    def count_messages(self, messages: Iterable[Dict[str, Any]]) -> int:
+        return TOKENS_PER_REPLY + sum(self.count_message(m) for m in messages)
+
+
+class ContextWindow:
+    """
+    Fits a conversation into the model's context budget before it is sent.
+    Instruction messages are always kept and always sent first, in stored
+    order, so every step of a task starts with the same bytes and provider
+    prompt caching can reuse them. Past the budget, function outputs older
+    than the last keep_recent messages are cut down to a short excerpt
+    first, then the oldest other messages are dropped.
+    """
+
+    def __init__(
+        self,
+        model: Optional[str],
+        max_tokens: Optional[int] = None,
+        response_tokens: int = 1024,
+        keep_recent: int = 6,
+        excerpt_chars: int = 400,
+        history_size: int = 50,
+    ) -> None:
+        self.counter = TokenCounter(model)
+        self.budget = (max_tokens or context_limit(model)) - response_tokens
+        self.keep_recent = keep_recent
+        self.excerpt_chars = excerpt_chars
+        self.steps = 0
+        self.history_tokens = 0
+        self.prompt_tokens = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.prefix_cache_hits = 0
+        self.prefix_stable_steps = 0
+        self.recent: deque = deque(maxlen=history_size)
+        # last prefix hash per task
+        self._prefixes: "OrderedDict[str, str]" = OrderedDict()
+
+    def excerpt(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        content = str(message["content"])
+        if len(content) <= self.excerpt_chars:
+            return message
+        half = self.excerpt_chars // 2
+        tokens = self.counter.count_text(content)
+        return dict(
+            message,
+            content=f"{content[:half]}\n...[{tokens} tokens of output trimmed]...\n{content[-half:]}",
+        )
+
+    def fit(
+        self,
+        messages: List[Dict[str, Any]],
+        instructions: List[Dict[str, Any]],
+        task_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """The messages to send and the token accounting for this step"""
+        pinned = {(m["role"], m["content"]) for m in instructions}
+        # copies, so nothing downstream can edit the stored history
+        prefix = [dict(m) for m in instructions]
+        window = [dict(m) for m in messages if (m["role"], m["content"]) not in pinned]
+        prefix_tokens = sum(self.counter.count_message(m) for m in prefix)
+        sizes = [self.counter.count_message(m) for m in window]
+        history_tokens = total = TOKENS_PER_REPLY + prefix_tokens + sum(sizes)
+        recent_from = max(len(window) - self.keep_recent, 0)
+        trimmed = evicted = 0
+
+        if total > self.budget:
+            for i in range(recent_from):
+                if total <= self.budget:
+                    break
+                if window[i]["role"] != "function":
+                    continue
+                short = self.excerpt(window[i])
+                if short is not window[i]:
+                    window[i] = short
+                    size = self.counter.count_message(short)
+                    total -= sizes[i] - size
+                    sizes[i] = size
+                    trimmed += 1
+
+        if total > self.budget:
+            # oldest first, the newest message is never dropped
+            keep = [True] * len(window)
+            for i in range(len(window) - 1):
+                if total <= self.budget:
+                    break
+                keep[i] = False
+                total -= sizes[i]
+                evicted += 1
+            window = [m for m, kept in zip(window, keep) if kept]
+
+        prefix_hash = hashlib.sha256(
+            json.dumps(prefix, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()[:16]
+        prefix_stable = self._prefixes.get(task_id) == prefix_hash
+        self._prefixes[task_id] = prefix_hash
+        self._prefixes.move_to_end(task_id)
+        while len(self._prefixes) > 1000:
+            self._prefixes.popitem(last=False)
+        window = prefix + window
+
+        if total > self.budget:
+            LOG.warning(f"Context for task {task_id} still {total} tokens over budget {self.budget}")
+
+        usage = {
+            "task_id": task_id,
+            "history_tokens": history_tokens,
+            "prompt_tokens": total,
+            "budget": self.budget,
+            "trimmed_messages": trimmed,
+            "evicted_messages": evicted,
+            "prefix_messages": len(prefix),
+            "prefix_tokens": prefix_tokens,
+            "prefix_hash": prefix_hash,
+            "prefix_stable": prefix_stable,
+        }
+        self.steps += 1
+        self.prefix_stable_steps += prefix_stable
+        self.history_tokens += history_tokens
+        self.prompt_tokens += total
+        self.recent.append(usage)
+        return window, usage
+
+    def record_usage(self, usage: Dict[str, Any], provider: Dict[str, Any]) -> None:
+        """Add the token use the provider reported for the step that usage came from"""
+        cached = provider.get("cached_tokens") or 0
+        usage["input_tokens"] = provider.get("prompt_tokens")
+        usage["cached_tokens"] = cached
+        usage["prefix_cache_hit"] = cached > 0
+        self.input_tokens += provider.get("prompt_tokens") or 0
+        self.cached_tokens += cached
+        self.prefix_cache_hits += cached > 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "steps": self.steps,
+            "history_tokens": self.history_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens_saved": self.history_tokens - self.prompt_tokens,
+            "prefix_stable_steps": self.prefix_stable_steps,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "prefix_cache_hits": self.prefix_cache_hits,
+            "recent_steps": list(self.recent),
+        }
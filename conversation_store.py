@@ -0,0 +1,192 @@
+import abc
+import asyncio
+import itertools
+import re
+from collections import Counter, deque
+from typing import Any, Dict, Iterator, List, Tuple
+
+TIMESTAMP = re.compile(r"\[\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}\]")
+
+
+def message_key(message: Dict[str, Any]) -> Tuple:
+    return message["role"], message.get("name"), str(message["content"])
+
+
+def near_key(message: Dict[str, Any]) -> Tuple:
+    """message_key with timestamps, case and spacing normalized away"""
+    content = TIMESTAMP.sub("", str(message["content"]))
+    return message["role"], message.get("name"), " ".join(content.casefold().split())
+
+
+class ChatHistory:
+    """
+    A task's messages with a hash index over their contents, so checking
+    whether a message was already sent costs the same at 10 messages as at
+    10k. Near-repeats are tracked over the last near_window messages only.
+    """
+
+    def __init__(self, near_window: int = 8) -> None:
+        self.messages: List[Dict[str, Any]] = []
+        self._seen: set = set()
+        self._recent: deque = deque(maxlen=near_window)
+        self._recent_keys: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def __contains__(self, message: Dict[str, Any]) -> bool:
+        return message_key(message) in self._seen
+
+    def append(self, message: Dict[str, Any]) -> None:
+        self.messages.append(message)
+        self._seen.add(message_key(message))
+        if self._recent.maxlen:
+            if len(self._recent) == self._recent.maxlen:
+                self._recent_keys[self._recent[0]] -= 1
+            key = near_key(message)
+            self._recent.append(key)
+            self._recent_keys[key] += 1
+
+    def is_near_repeat(self, message: Dict[str, Any]) -> bool:
+        return self._recent_keys[near_key(message)] > 0
+
+
+class ConversationBackend(abc.ABC):
+    """
+    Append-only message log per task plus its step counter. Every message
+    gets an increasing id so readers can fetch just the part they have not
+    seen yet.
+    """
+
+    @abc.abstractmethod
+    async def append(
+        self, task_id: str, messages: List[Dict[str, Any]], instruction: bool = False
+    ) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def read(
+        self, task_id: str, after_id: int = 0, instruction_only: bool = False
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        pass
+
+    @abc.abstractmethod
+    async def next_step(self, task_id: str) -> int:
+        pass
+
+
+class MemoryConversationBackend(ConversationBackend):
+    """Keeps everything in process, for tests and single-shot runs"""
+
+    def __init__(self) -> None:
+        self._ids = itertools.count(1)
+        self._messages: Dict[str, List[Tuple[int, Dict[str, Any], bool]]] = {}
+        self._steps: Dict[str, int] = {}
+
+    async def append(
+        self, task_id: str, messages: List[Dict[str, Any]], instruction: bool = False
+    ) -> None:
+        log = self._messages.setdefault(task_id, [])
+        for message in messages:
+            log.append((next(self._ids), dict(message), instruction))
+
+    async def read(
+        self, task_id: str, after_id: int = 0, instruction_only: bool = False
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        return [
+            (message_id, dict(message))
+            for message_id, message, instruction in self._messages.get(task_id, [])
+            if message_id > after_id and (instruction or not instruction_only)
+        ]
+
+    async def next_step(self, task_id: str) -> int:
+        self._steps[task_id] = self._steps.get(task_id, 0) + 1
+        return self._steps[task_id]
+
+
+class DBConversationBackend(ConversationBackend):
+    """Stores the log in the agent database (AgentDB or AsyncAgentDB)"""
+
+    def __init__(self, database) -> None:
+        self.database = database
+
+    async def append(
+        self, task_id: str, messages: List[Dict[str, Any]], instruction: bool = False
+    ) -> None:
+        await self.database.append_messages(task_id, messages, instruction)
+
+    async def read(
+        self, task_id: str, after_id: int = 0, instruction_only: bool = False
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        return await self.database.list_messages(task_id, after_id, instruction_only)
+
+    async def next_step(self, task_id: str) -> int:
+        return await self.database.next_step_number(task_id)
+
+
+class ConversationStore:
+    """
+    Per-process view over a ConversationBackend. Loaded messages are kept per
+    task and topped up with only the newer rows, so a worker that picks up a
+    task started elsewhere loads it once and then reads increments.
+    """
+
+    def __init__(
+        self,
+        backend: ConversationBackend,
+        max_tasks: int = 256,
+        near_window: int = 8,
+    ) -> None:
+        self.backend = backend
+        self.max_tasks = max_tasks
+        self.near_window = near_window
+        self._loaded: Dict[str, ChatHistory] = {}
+        self._last_id: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, task_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(task_id, asyncio.Lock())
+
+    async def history(self, task_id: str) -> ChatHistory:
+        """The whole conversation of a task, oldest first"""
+        async with self._lock(task_id):
+            rows = await self.backend.read(task_id, self._last_id.get(task_id, 0))
+            if task_id not in self._loaded:
+                self._evict()
+                self._loaded[task_id] = ChatHistory(self.near_window)
+            loaded = self._loaded[task_id]
+            for message_id, message in rows:
+                loaded.append(message)
+                self._last_id[task_id] = message_id
+            return loaded
+
+    async def messages(self, task_id: str) -> List[Dict[str, Any]]:
+        return (await self.history(task_id)).messages
+
+    async def append(
+        self, task_id: str, message: Dict[str, Any], instruction: bool = False
+    ) -> None:
+        await self.backend.append(task_id, [message], instruction)
+
+    async def instructions(self, task_id: str) -> List[Dict[str, Any]]:
+        rows = await self.backend.read(task_id, instruction_only=True)
+        return [message for _, message in rows]
+
+    async def next_step(self, task_id: str) -> int:
+        return await self.backend.next_step(task_id)
+
+    def forget(self, task_id: str) -> None:
+        """Drop the loaded copy of a task, the log itself stays"""
+        self._loaded.pop(task_id, None)
+        self._last_id.pop(task_id, None)
+        self._locks.pop(task_id, None)
+
+    def _evict(self) -> None:
+        while len(self._loaded) >= self.max_tasks:
+            self.forget(next(iter(self._loaded)))
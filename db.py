@@ -1,20 +1,51 @@
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 from sqlalchemy import (
     JSON,
     Boolean,
     Column,
     DateTime,
     ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
     String,
+    Text,
+    and_,
     create_engine,
+    event,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import InterfaceError, OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Session,
+    joinedload,
+    relationship,
+    selectinload,
+    sessionmaker,
 )
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import DeclarativeBase, joinedload, relationship, sessionmaker
 from schema import Artifact, Pagination, Status, Step, StepRequestBody, Task
 from agent_log import AgentLogger
+from write_behind import WriteBatch, WriteBehindQueue
+from db_cache import ReadCache
+import asyncio
+import base64
+import contextlib
 import datetime
+import json
 import math
+import os
 import uuid
+import zlib
 
 LOG = AgentLogger(__name__)
 
@@ -28,6 +59,8 @@ class TaskModel(Base):
     task_id = Column(String, primary_key=True, index=True)
     input = Column(String)
     additional_input = Column(JSON)
+    # false while the task is still being set up in the background
+    ready = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     modified_at = Column(
         DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow
@@ -35,6 +68,8 @@ class TaskModel(Base):
 
     artifacts = relationship("ArtifactModel", back_populates="task")
 
+    __table_args__ = (Index("ix_tasks_created_at_task_id", "created_at", "task_id"),)
+
 
 class StepModel(Base):
     __tablename__ = "steps"
@@ -44,6 +79,7 @@ class StepModel(Base):
     name = Column(String)
     input = Column(String)
     status = Column(String)
+    output = Column(Text)
     is_last = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     modified_at = Column(
@@ -53,13 +89,18 @@ class StepModel(Base):
     additional_input = Column(JSON)
     artifacts = relationship("ArtifactModel", back_populates="step")
 
+    __table_args__ = (
+        # covers lookups by task and the (created_at, step_id) keyset order
+        Index("ix_steps_task_id_created_at", "task_id", "created_at", "step_id"),
+    )
+
 
 class ArtifactModel(Base):
     __tablename__ = "artifacts"
 
     artifact_id = Column(String, primary_key=True, index=True)
     task_id = Column(String, ForeignKey("tasks.task_id"))
-    step_id = Column(String, ForeignKey("steps.step_id"))
+    step_id = Column(String, ForeignKey("steps.step_id"), index=True)
     agent_created = Column(Boolean, default=False)
     file_name = Column(String)
     relative_path = Column(String)
@@ -71,11 +112,173 @@ class ArtifactModel(Base):
     step = relationship("StepModel", back_populates="artifacts")
     task = relationship("TaskModel", back_populates="artifacts")
 
+    __table_args__ = (
+        Index(
+            "ix_artifacts_task_id_created_at", "task_id", "created_at", "artifact_id"
+        ),
+        Index(
+            "uq_artifacts_task_file_path",
+            "task_id",
+            "file_name",
+            "relative_path",
+            unique=True,
+        ),
+    )
+
+
+class TaskArchiveModel(Base):
+    """
+    A finished task with its steps and artifacts, moved out of the live
+    tables as one zlib-compressed JSON document.
+    """
+
+    __tablename__ = "tasks_archive"
+
+    task_id = Column(String, primary_key=True)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    payload = Column(LargeBinary)
+
+
+class ChatMessageModel(Base):
+    """Append-only conversation log, one row per chat message"""
+
+    __tablename__ = "chat_messages"
+
+    message_id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String, ForeignKey("tasks.task_id"))
+    role = Column(String)
+    name = Column(String)
+    content = Column(Text)
+    instruction = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        # readers fetch the tail of one task's log past the last id they saw
+        Index("ix_chat_messages_task_id_message_id", "task_id", "message_id"),
+    )
+
+
+class ConversationModel(Base):
+    __tablename__ = "conversations"
+
+    task_id = Column(String, ForeignKey("tasks.task_id"), primary_key=True)
+    steps_amount = Column(Integer, default=0)
+
+
+ARTIFACT_DEDUPE_COLUMNS = ["task_id", "file_name", "relative_path"]
+
+
+def migrate_schema(connection) -> None:
+    """
+    Bring databases created by older versions up to date. create_all skips
+    tables that already exist, so their new columns and indexes are added here.
+    Duplicate artifacts are collapsed first so the unique index can be built,
+    and NULL relative paths become "" since the index treats NULLs as distinct.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(
+                    text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                )
+    connection.execute(
+        text(
+            "DELETE FROM artifacts WHERE relative_path IS NULL AND EXISTS ("
+            "SELECT 1 FROM artifacts AS other "
+            "WHERE other.task_id = artifacts.task_id "
+            "AND other.file_name = artifacts.file_name "
+            "AND (other.relative_path = '' OR (other.relative_path IS NULL "
+            "AND other.artifact_id < artifacts.artifact_id)))"
+        )
+    )
+    connection.execute(
+        text("UPDATE artifacts SET relative_path = '' WHERE relative_path IS NULL")
+    )
+    existing = {index["name"] for index in inspector.get_indexes("artifacts")}
+    if "uq_artifacts_task_file_path" not in existing:
+        connection.execute(
+            text(
+                "DELETE FROM artifacts WHERE artifact_id NOT IN ("
+                "SELECT MIN(artifact_id) FROM artifacts "
+                "GROUP BY task_id, file_name, relative_path)"
+            )
+        )
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
 
-def convert_to_task(task_obj: TaskModel, debug_enabled: bool = False) -> Task:
+def artifact_upsert(dialect, values: Dict[str, Any]):
+    """
+    Single-statement insert-or-return for the artifact dedupe triple, or None
+    when the dialect cannot do ON CONFLICT ... RETURNING.
+    """
+    if dialect.name == "postgresql":
+        insert = postgresql.insert
+    elif dialect.name == "sqlite":
+        insert = sqlite.insert
+    else:
+        return None
+    if not dialect.insert_returning:
+        return None
+    stmt = insert(ArtifactModel).values(**values)
+    # no-op update so RETURNING yields the existing row on conflict
+    stmt = stmt.on_conflict_do_update(
+        index_elements=ARTIFACT_DEDUPE_COLUMNS,
+        set_={"file_name": stmt.excluded.file_name},
+    )
+    return stmt.returning(ArtifactModel)
+
+
+def artifact_insert_ignore(dialect):
+    """Bulk artifact insert that skips rows already present"""
+    if dialect.name == "postgresql":
+        return postgresql.insert(ArtifactModel).on_conflict_do_nothing(
+            index_elements=ARTIFACT_DEDUPE_COLUMNS
+        )
+    if dialect.name == "sqlite":
+        return sqlite.insert(ArtifactModel).on_conflict_do_nothing(
+            index_elements=ARTIFACT_DEDUPE_COLUMNS
+        )
+    return insert(ArtifactModel)
+
+
+def write_batch_statements(dialect, batch: WriteBatch) -> List[Tuple[Any, list]]:
+    """Bulk statements and parameter lists that persist a write-behind batch"""
+    statements = []
+    if batch.new_steps:
+        statements.append((insert(StepModel), list(batch.new_steps.values())))
+    if batch.step_updates:
+        statements.append(
+            (
+                update(StepModel),
+                [
+                    dict(values, step_id=step_id)
+                    for step_id, values in batch.step_updates.items()
+                ],
+            )
+        )
+    if batch.artifacts:
+        statements.append(
+            (artifact_insert_ignore(dialect), list(batch.artifacts.values()))
+        )
+    return statements
+
+
+def convert_to_task(
+    task_obj: TaskModel, debug_enabled: bool = False, include_artifacts: bool = True
+) -> Task:
     if debug_enabled:
         LOG.info(f"Converting TaskModel to Task for task_id: {task_obj.task_id}")
-    task_artifacts = [convert_to_artifact(artifact) for artifact in task_obj.artifacts]
+    task_artifacts = (
+        [convert_to_artifact(artifact) for artifact in task_obj.artifacts]
+        if include_artifacts
+        else []
+    )
     return Task(
         task_id=task_obj.task_id,
         created_at=task_obj.created_at,
@@ -83,16 +286,27 @@ def convert_to_task(task_obj: TaskModel, debug_enabled: bool = False) -> Task:
         input=task_obj.input,
         additional_input=task_obj.additional_input,
         artifacts=task_artifacts,
+        # rows from before the column existed are ready
+        ready=task_obj.ready is not False,
     )
 
 
-def convert_to_step(step_model: StepModel, debug_enabled: bool = False) -> Step:
+def step_status(status: Optional[str]) -> Status:
+    if status in (Status.running.value, Status.completed.value):
+        return Status(status)
+    return Status.created
+
+
+def convert_to_step(
+    step_model: StepModel, debug_enabled: bool = False, include_artifacts: bool = True
+) -> Step:
     if debug_enabled:
         LOG.info(f"Converting StepModel to Step for step_id: {step_model.step_id}")
-    step_artifacts = [
-        convert_to_artifact(artifact) for artifact in step_model.artifacts
-    ]
-    status = Status.completed if step_model.status == "completed" else Status.created
+    step_artifacts = (
+        [convert_to_artifact(artifact) for artifact in step_model.artifacts]
+        if include_artifacts
+        else []
+    )
     return Step(
         task_id=step_model.task_id,
         step_id=step_model.step_id,
@@ -100,7 +314,8 @@ def convert_to_step(step_model: StepModel, debug_enabled: bool = False) -> Step:
         modified_at=step_model.modified_at,
         name=step_model.name,
         input=step_model.input,
-        status=status,
+        status=step_status(step_model.status),
+        output=step_model.output,
         artifacts=step_artifacts,
         is_last=step_model.is_last == 1,
         additional_input=step_model.additional_input,
@@ -118,42 +333,410 @@ def convert_to_artifact(artifact_model: ArtifactModel) -> Artifact:
     )
 
 
-class AgentDB:
-    def __init__(self, database_string, debug_enabled: bool = False) -> None:
-        super().__init__()
+def message_row(task_id: str, message: Dict[str, Any], instruction: bool) -> dict:
+    return {
+        "task_id": task_id,
+        "role": message["role"],
+        "name": message.get("name"),
+        "content": message["content"],
+        "instruction": instruction,
+    }
+
+
+def convert_to_message(message_model: ChatMessageModel) -> Tuple[int, Dict[str, Any]]:
+    message = {"role": message_model.role, "content": message_model.content}
+    if message_model.name is not None:
+        message["name"] = message_model.name
+    return message_model.message_id, message
+
+
+def pack_archive(task: Task, steps: List[Step]) -> bytes:
+    document = {
+        "task": task.model_dump(mode="json"),
+        "steps": [step.model_dump(mode="json") for step in steps],
+    }
+    return zlib.compress(json.dumps(document).encode())
+
+
+def unpack_archive(payload: bytes) -> Tuple[Task, List[Step]]:
+    document = json.loads(zlib.decompress(payload))
+    task = Task.model_validate(document["task"])
+    return task, [Step.model_validate(step) for step in document["steps"]]
+
+
+def page_archived_steps(
+    steps: List[Step],
+    page: int,
+    per_page: int,
+    include_artifacts: bool,
+    cursor: Optional[str],
+    count: Optional[str],
+) -> Tuple[List[Step], Pagination]:
+    """Same windowing as the live list_steps, done in memory"""
+    steps = sorted(steps, key=lambda step: (step.created_at, step.step_id))
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        window = [s for s in steps if (s.created_at, s.step_id) > after]
+    else:
+        window = steps[(page - 1) * per_page :]
+    total = ItemCount(None if count_mode(count, cursor) == "none" else len(steps))
+    window, pagination = build_page(
+        window[: per_page + 1], page, per_page, cursor, total,
+        lambda step: (step.created_at, step.step_id),
+    )
+    if not include_artifacts:
+        window = [step.model_copy(update={"artifacts": []}) for step in window]
+    return window, pagination
+
+
+def step_update_values(
+    status: str,
+    additional_input: Optional[Dict[str, Any]],
+    output: Optional[str] = None,
+    is_last: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Columns written by update_step, output and is_last only when given"""
+    values = {"status": status, "additional_input": additional_input}
+    if output is not None:
+        values["output"] = output
+    if is_last is not None:
+        values["is_last"] = is_last
+    return values
+
+
+def merge_step_update(step: Step, values: Dict[str, Any]) -> Step:
+    """The step as it reads once update_step's column values are applied"""
+    changes = dict(values)
+    if "status" in changes:
+        changes["status"] = step_status(changes["status"])
+    return step.model_copy(update=changes)
+
+
+def row_values(model: Base) -> Dict[str, Any]:
+    return {column.key: getattr(model, column.key) for column in model.__table__.columns}
+
+
+def new_step_row(
+    task_id: str,
+    input: StepRequestBody,
+    is_last: bool = False,
+    additional_input: Optional[Dict[str, Any]] = {},
+) -> Dict[str, Any]:
+    now = datetime.datetime.utcnow()
+    return dict(
+        task_id=task_id,
+        step_id=str(uuid.uuid4()),
+        name=input.input,
+        input=input.input,
+        status="created",
+        is_last=is_last,
+        additional_input=additional_input,
+        created_at=now,
+        modified_at=now,
+    )
+
+
+def new_artifact_row(
+    task_id: str,
+    file_name: str,
+    relative_path: str,
+    agent_created: bool = False,
+    step_id: str | None = None,
+) -> Dict[str, Any]:
+    now = datetime.datetime.utcnow()
+    return dict(
+        artifact_id=str(uuid.uuid4()),
+        task_id=task_id,
+        step_id=step_id,
+        agent_created=agent_created,
+        file_name=file_name,
+        relative_path=relative_path,
+        created_at=now,
+        modified_at=now,
+    )
+
+
+def buffered_step(
+    write_behind: WriteBehindQueue,
+    step_id: str,
+    step_model: Optional[StepModel] = None,
+    debug_enabled: bool = False,
+) -> Optional[Step]:
+    """
+    A step as seen through the write-behind buffer: unflushed columns and
+    artifacts are laid over the database row, if there is one.
+    """
+    state, is_new = write_behind.step_state(step_id)
+    if state is None:
+        return convert_to_step(step_model, debug_enabled) if step_model else None
+    if is_new:
+        values, artifacts = state, []
+    elif step_model is not None:
+        values = {**row_values(step_model), **state}
+        artifacts = [row_values(artifact) for artifact in step_model.artifacts]
+    else:
+        return None
+    step = StepModel(**values)
+    step.artifacts = [
+        ArtifactModel(**artifact)
+        for artifact in artifacts + write_behind.step_artifacts(step_id)
+    ]
+    return convert_to_step(step, debug_enabled)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Errors a retry can get past: the database unreachable, locked or restarting"""
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+def _as_bool(value: str) -> bool:
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+# Engine/pool settings that can be passed as DATABASE_STRING query options,
+# e.g. "postgresql://user@host/agent?pool_size=20&max_overflow=10&pool_pre_ping=true"
+ENGINE_OPTIONS = {
+    "pool_size": int,
+    "max_overflow": int,
+    "pool_timeout": int,
+    "pool_recycle": int,
+    "pool_pre_ping": _as_bool,
+}
+
+# asyncio driver used in place of the default or a blocking driver named
+# in DATABASE_STRING; async drivers (and psycopg 3, which is both) pass through
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgresql+pg8000": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql+mysqldb": "mysql+aiomysql",
+    "mysql+mysqlconnector": "mysql+aiomysql",
+}
+
+
+# Applied to every new connection when DATABASE_STRING is a sqlite:// URL
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    # negative values are KiB rather than pages
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64 * 1024)),
+    "temp_store": "MEMORY",
+}
+
+
+def apply_sqlite_profile(engine) -> None:
+    """
+    WAL lets readers run alongside the writer, and busy_timeout makes a
+    blocked writer wait instead of failing with "database is locked".
+    """
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def split_engine_options(database_string: str) -> Tuple[URL, Dict[str, Any]]:
+    """
+    Strip the engine/pool options out of a database string and return the
+    cleaned URL together with the keyword arguments for create_engine.
+    """
+    url = make_url(database_string)
+    query = dict(url.query)
+    options = {}
+    for key, cast in ENGINE_OPTIONS.items():
+        if key in query:
+            options[key] = cast(query.pop(key))
+    return url.set(query=query), options
+
+
+def to_async_url(url: URL) -> URL:
+    """Swap a plain dialect name or a blocking driver for its asyncio driver"""
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+# Estimated counts stop scanning after this many rows
+ESTIMATED_COUNT_CAP = 10000
+COUNT_MODES = ("exact", "estimated", "none")
+
+
+class ItemCount(NamedTuple):
+    # total is only a lower bound when truncated, i.e. past the estimate cap
+    total: Optional[int]
+    truncated: bool = False
+
+
+def encode_cursor(created_at: datetime.datetime, item_id: str) -> str:
+    """Opaque keyset cursor pointing at the last item of a page"""
+    raw = json.dumps([created_at.isoformat(), item_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, str]:
+    try:
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), item_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def count_mode(count: Optional[str], cursor: Optional[str]) -> str:
+    """
+    Exact totals stay the default for page/pageSize requests so old clients
+    keep working; cursor requests only count when asked to.
+    """
+    if count is None:
+        return "none" if cursor is not None else "exact"
+    if count not in COUNT_MODES:
+        raise ValueError(f"Invalid count mode: {count}")
+    return count
+
+
+def paginate(query, created_column, id_column, page, per_page, cursor):
+    """
+    Order a query by (created_at, id) and window it either by keyset cursor
+    or by page offset. One extra row is fetched to detect a following page.
+    """
+    query = query.order_by(created_column, id_column)
+    if cursor is not None:
+        created_at, item_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                created_column > created_at,
+                and_(created_column == created_at, id_column > item_id),
+            )
+        )
+        return query.limit(per_page + 1)
+    return query.offset((page - 1) * per_page).limit(per_page + 1)
+
+
+def count_items(session, id_column, mode: str, **filters) -> ItemCount:
+    if mode == "none":
+        return ItemCount(None)
+    rows = select(id_column).filter_by(**filters)
+    if mode == "estimated":
+        # one row past the cap tells a capped count from an exact one
+        rows = rows.limit(ESTIMATED_COUNT_CAP + 1)
+    total = session.scalar(select(func.count()).select_from(rows.subquery()))
+    if mode == "estimated" and total > ESTIMATED_COUNT_CAP:
+        return ItemCount(ESTIMATED_COUNT_CAP, truncated=True)
+    return ItemCount(total)
+
+
+def build_page(rows, page, per_page, cursor, count: ItemCount, key) -> Tuple[list, Pagination]:
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    total = count.total
+    pagination = Pagination(
+        total_items=total,
+        total_truncated=count.truncated or None,
+        total_pages=(
+            math.ceil(total / per_page)
+            if total is not None and not count.truncated
+            else None
+        ),
+        current_page=page if cursor is None else None,
+        page_size=per_page,
+        next_cursor=encode_cursor(*key(rows[-1])) if has_more else None,
+    )
+    return rows, pagination
+
+
+class AgentDBBase:
+    """
+    The agent database operations, shared by AgentDB and AsyncAgentDB.
+    Each operation is a function of a sync Session; the subclass runs it
+    through _execute on its own engine, blocking or on the event loop.
+    Caching and the write-behind buffer are handled here, once.
+    """
+
+    def __init__(
+        self,
+        debug_enabled: bool = False,
+        write_behind: bool = False,
+        flush_interval: float = 0.05,
+        cache: Optional[ReadCache] = None,
+    ) -> None:
         self.debug_enabled = debug_enabled
-        if self.debug_enabled:
-            LOG.info(f"Initializing AgentDB with database_string: {database_string}")
-        self.engine = create_engine(database_string)
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        self.cache = cache
+        # step/artifact writes are batched into periodic commits when enabled
+        self.write_behind = (
+            WriteBehindQueue(
+                self._write_batch, flush_interval, is_transient=is_transient_error
+            )
+            if write_behind
+            else None
+        )
 
-    async def create_task(
-        self, input: Optional[str], additional_input: Optional[dict] = {}
-    ) -> Task:
-        if self.debug_enabled:
-            LOG.info("Creating new task")
+    async def _execute(self, operation: Callable[[Session], Any], write: bool = False) -> Any:
+        """operation(session) on a new session; write marks operations that commit"""
+        raise NotImplementedError
+
+    async def _run(
+        self, action: str, operation: Callable[[Session], Any], write: bool = False
+    ) -> Any:
         try:
-            with self.Session() as session:
-                new_task = TaskModel(
-                    task_id=str(uuid.uuid4()),
-                    input=input,
-                    additional_input=additional_input if additional_input else {},
-                )
-                session.add(new_task)
-                session.commit()
-                session.refresh(new_task)
-                if self.debug_enabled:
-                    pass
-                return convert_to_task(new_task, self.debug_enabled)
+            return await self._execute(operation, write)
         except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while creating task: {e}")
+            LOG.error(f"SQLAlchemy error while {action}: {e}")
             raise
-
         except Exception as e:
-            LOG.error(f"Unexpected error while creating task: {e}")
+            LOG.error(f"Unexpected error while {action}: {e}")
             raise
 
+    async def _write_batch(self, batch: WriteBatch) -> None:
+        def write(session: Session) -> None:
+            for statement, rows in write_batch_statements(self.engine.dialect, batch):
+                session.execute(statement, rows)
+            session.commit()
+
+        await self._execute(write, write=True)
+
+    async def create_task(
+        self,
+        input: Optional[str],
+        additional_input: Optional[dict] = {},
+        ready: bool = True,
+    ) -> Task:
+        if self.debug_enabled:
+            LOG.info("Creating new task")
+
+        def create(session: Session) -> Task:
+            new_task = TaskModel(
+                task_id=str(uuid.uuid4()),
+                input=input,
+                additional_input=additional_input if additional_input else {},
+                ready=ready,
+                artifacts=[],
+            )
+            session.add(new_task)
+            session.commit()
+            return convert_to_task(new_task, self.debug_enabled)
+
+        return await self._run("creating task", create, write=True)
+
+    async def set_task_ready(self, task_id: str, ready: bool = True) -> None:
+        if self.debug_enabled:
+            LOG.info(f"Marking task {task_id} ready: {ready}")
+
+        def mark(session: Session) -> None:
+            session.execute(update(TaskModel).filter_by(task_id=task_id).values(ready=ready))
+            session.commit()
+
+        try:
+            await self._run("updating task", mark, write=True)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(task_id=task_id)
+
     async def create_step(
         self,
         task_id: str,
@@ -163,30 +746,20 @@ class AgentDB:
     ) -> Step:
         if self.debug_enabled:
             LOG.info(f"Creating new step for task_id: {task_id}")
-        try:
-            with self.Session() as session:
-                new_step = StepModel(
-                    task_id=task_id,
-                    step_id=str(uuid.uuid4()),
-                    name=input.input,
-                    input=input.input,
-                    status="created",
-                    is_last=is_last,
-                    additional_input=additional_input,
-                )
-                session.add(new_step)
-                session.commit()
-                session.refresh(new_step)
-                if self.debug_enabled:
-                    LOG.info(f"Created new step with step_id: {new_step.step_id}")
-                return convert_to_step(new_step, self.debug_enabled)
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while creating step: {e}")
-            raise
+        values = new_step_row(task_id, input, is_last, additional_input)
+        if self.write_behind is not None:
+            self.write_behind.add_step(values)
+            return buffered_step(self.write_behind, values["step_id"])
 
-        except Exception as e:
-            LOG.error(f"Unexpected error while creating step: {e}")
-            raise
+        def create(session: Session) -> Step:
+            new_step = StepModel(**values, artifacts=[])
+            session.add(new_step)
+            session.commit()
+            if self.debug_enabled:
+                LOG.info(f"Created new step with step_id: {new_step.step_id}")
+            return convert_to_step(new_step, self.debug_enabled)
+
+        return await self._run("creating step", create, write=True)
 
     async def create_artifact(
         self,
@@ -198,91 +771,104 @@ class AgentDB:
     ) -> Artifact:
         if self.debug_enabled:
             LOG.info(f"Creating new artifact for task_id: {task_id}")
-        try:
-            with self.Session() as session:
-                if (
-                    existing_artifact := session.query(ArtifactModel)
-                    .filter_by(
-                        task_id=task_id,
-                        file_name=file_name,
-                        relative_path=relative_path,
-                    )
-                    .first()
-                ):
-                    session.close()
-                    if self.debug_enabled:
-                        LOG.info(f"Artifact already exists with relative_path: {relative_path}")
-
-                    return convert_to_artifact(existing_artifact)
-
-                new_artifact = ArtifactModel(
-                    artifact_id=str(uuid.uuid4()),
-                    task_id=task_id,
-                    step_id=step_id,
-                    agent_created=agent_created,
-                    file_name=file_name,
-                    relative_path=relative_path,
+        # stored as "", a NULL would never conflict with the dedupe index
+        relative_path = relative_path or ""
+        values = new_artifact_row(task_id, file_name, relative_path, agent_created, step_id)
+
+        def existing(session: Session) -> Optional[ArtifactModel]:
+            return (
+                session.query(ArtifactModel)
+                .filter_by(task_id=task_id, file_name=file_name, relative_path=relative_path)
+                .first()
+            )
+
+        def create(session: Session) -> Artifact:
+            if self.write_behind is not None:
+                if not self.write_behind.find_artifact(
+                    task_id, file_name, relative_path
+                ) and (artifact := existing(session)):
+                    return convert_to_artifact(artifact)
+                return convert_to_artifact(
+                    ArtifactModel(**self.write_behind.add_artifact(values))
                 )
-                session.add(new_artifact)
+            upsert = artifact_upsert(self.engine.dialect, values)
+            if upsert is not None:
+                artifact = session.scalars(upsert).one()
                 session.commit()
-                session.refresh(new_artifact)
+                return convert_to_artifact(artifact)
+            if artifact := existing(session):
                 if self.debug_enabled:
-                    priLOG.infont(f"Created new artifact with artifact_id: {new_artifact.artifact_id}")
+                    LOG.info(f"Artifact already exists with relative_path: {relative_path}")
+                return convert_to_artifact(artifact)
+            new_artifact = ArtifactModel(**values)
+            session.add(new_artifact)
+            session.commit()
+            if self.debug_enabled:
+                LOG.info(f"Created new artifact with artifact_id: {new_artifact.artifact_id}")
+            return convert_to_artifact(new_artifact)
 
-                return convert_to_artifact(new_artifact)
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while creating step: {e}")
-            raise
-        except Exception as e:
-            LOG.error(f"Unexpected error while creating step: {e}")
-            raise
+        try:
+            return await self._run("creating artifact", create, write=True)
+        finally:
+            # the task and step embed their artifact lists
+            if self.cache is not None:
+                self.cache.invalidate(task_id=task_id, step_id=step_id)
 
-    async def get_task(self, task_id: int) -> Task:
+    async def get_task(self, task_id: str, include_archived: bool = False) -> Task:
         """Get a task by its id"""
         if self.debug_enabled:
             LOG.info(f"Getting task with task_id: {task_id}")
-        try:
-            with self.Session() as session:
-                if task_obj := (
-                    session.query(TaskModel)
-                    .options(joinedload(TaskModel.artifacts))
-                    .filter_by(task_id=task_id)
-                    .first()
-                ):
-                    return convert_to_task(task_obj, self.debug_enabled)
-                else:
-                    LOG.info(f"Task not found with task_id: {task_id}")
+        if self.cache is not None and (task := self.cache.get_task(task_id)):
+            return task
+        # taken before the read so an invalidation racing it keeps the row out
+        generation = self.cache.generation("task", task_id) if self.cache is not None else None
 
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while getting task: {e}")
-            raise
-        except Exception as e:
-            LOG.error(f"Unexpected error while getting task: {e}")
-            raise
+        def get(session: Session) -> Optional[Task]:
+            if task_obj := (
+                session.query(TaskModel)
+                .options(joinedload(TaskModel.artifacts))
+                .filter_by(task_id=task_id)
+                .first()
+            ):
+                task = convert_to_task(task_obj, self.debug_enabled)
+                if self.cache is not None:
+                    self.cache.set_task(task, generation)
+                return task
+            if include_archived and (archived := session.get(TaskArchiveModel, task_id)):
+                return unpack_archive(archived.payload)[0]
+            LOG.info(f"Task not found with task_id: {task_id}")
+            return None
 
-    async def get_step(self, task_id: int, step_id: int) -> Step:
+        return await self._run("getting task", get)
+
+    async def get_step(self, task_id: str, step_id: str) -> Step:
         if self.debug_enabled:
             LOG.info(f"Getting step with task_id: {task_id} and step_id: {step_id}")
-        try:
-            with self.Session() as session:
-                if step := (
-                    session.query(StepModel)
-                    .options(joinedload(StepModel.artifacts))
-                    .filter(StepModel.step_id == step_id)
-                    .first()
-                ):
-                    return convert_to_step(step, self.debug_enabled)
-
-                else:
-                    LOG.info(f"Step not found with task_id: {task_id} and step_id: {step_id}")
+        if self.write_behind is not None and self.write_behind.step_state(step_id)[1]:
+            return buffered_step(self.write_behind, step_id)
+        if self.cache is not None and (step := self.cache.get_step(step_id)):
+            return step
+        generation = self.cache.generation("step", step_id) if self.cache is not None else None
 
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while getting step: {e}")
-            raise
+        def get(session: Session) -> Optional[Step]:
+            if step_model := (
+                session.query(StepModel)
+                .options(joinedload(StepModel.artifacts))
+                .filter(StepModel.step_id == step_id)
+                .first()
+            ):
+                step = (
+                    buffered_step(self.write_behind, step_id, step_model, self.debug_enabled)
+                    if self.write_behind is not None
+                    else convert_to_step(step_model, self.debug_enabled)
+                )
+                if self.cache is not None:
+                    self.cache.set_step(step, generation)
+                return step
+            LOG.info(f"Step not found with task_id: {task_id} and step_id: {step_id}")
+            return None
 
-        except Exception as e:
-            LOG.error(f"Unexpected error while getting step: {e}")
-            raise
+        return await self._run("getting step", get)
 
     async def update_step(
         self,
@@ -290,145 +876,310 @@ class AgentDB:
         step_id: str,
         status: str,
         additional_input: Optional[Dict[str, Any]] = {},
+        output: Optional[str] = None,
+        is_last: Optional[bool] = None,
     ) -> Step:
         if self.debug_enabled:
             LOG.info(f"Updating step with task_id: {task_id} and step_id: {step_id}")
-        try:
-            with self.Session() as session:
-                if (
-                    step := session.query(StepModel)
-                    .filter_by(task_id=task_id, step_id=step_id)
-                    .first()
-                ):
-                    step.status = status
-                    step.additional_input = additional_input
-                    session.commit()
-                    return await self.get_step(task_id, step_id)
-                else:
-
-                    LOG.info(f"Step not found for update with task_id: {task_id} and step_id: {step_id}")
+        values = step_update_values(status, additional_input, output, is_last)
+        if self.write_behind is not None:
+            return await self._buffer_step_update(task_id, step_id, **values)
 
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while getting step: {e}")
-            raise
+        def change(session: Session) -> Optional[Step]:
+            if step := (
+                session.query(StepModel)
+                .options(selectinload(StepModel.artifacts))
+                .filter_by(task_id=task_id, step_id=step_id)
+                .first()
+            ):
+                for column, value in values.items():
+                    setattr(step, column, value)
+                session.commit()
+                return convert_to_step(step, self.debug_enabled)
+            LOG.info(f"Step not found for update with task_id: {task_id} and step_id: {step_id}")
+            return None
 
-        except Exception as e:
-            LOG.error(f"Unexpected error while getting step: {e}")
-            raise
+        try:
+            return await self._run("updating step", change, write=True)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(step_id=step_id)
+
+    async def _buffer_step_update(self, task_id: str, step_id: str, **values) -> Step:
+        if (step := await self.get_step(task_id, step_id)) is None:
+            LOG.info(f"Step not found for update with task_id: {task_id} and step_id: {step_id}")
+            return None
+        values["modified_at"] = datetime.datetime.utcnow()
+        self.write_behind.update_step(step_id, values)
+        if self.cache is not None:
+            self.cache.invalidate(step_id=step_id)
+        return merge_step_update(step, values)
 
     async def get_artifact(self, artifact_id: str) -> Artifact:
         if self.debug_enabled:
             LOG.info(f"Getting artifact with and artifact_id: {artifact_id}")
-        try:
-            with self.Session() as session:
-                if (
-                    artifact_model := session.query(ArtifactModel)
-                    .filter_by(artifact_id=artifact_id)
-                    .first()
-                ):
-                    return convert_to_artifact(artifact_model)
-                else:
-                    LOG.info(f"Artifact not found with and artifact_id: {artifact_id}")
+        if self.write_behind is not None and (
+            values := self.write_behind.find_artifact_by_id(artifact_id)
+        ):
+            return convert_to_artifact(ArtifactModel(**values))
+        if self.cache is not None and (artifact := self.cache.get_artifact(artifact_id)):
+            return artifact
+        generation = self.cache.generation("artifact", artifact_id) if self.cache is not None else None
 
-        except SQLAlchemyError as e:
-            LOG.info(f"SQLAlchemy error while getting artifact: {e}")
-            raise
-        except Exception as e:
-            LOG.info(f"Unexpected error while getting artifact: {e}")
-            raise
+        def get(session: Session) -> Optional[Artifact]:
+            if artifact_model := (
+                session.query(ArtifactModel).filter_by(artifact_id=artifact_id).first()
+            ):
+                artifact = convert_to_artifact(artifact_model)
+                if self.cache is not None:
+                    self.cache.set_artifact(artifact, generation)
+                return artifact
+            LOG.info(f"Artifact not found with and artifact_id: {artifact_id}")
+            return None
+
+        return await self._run("getting artifact", get)
 
     async def list_tasks(
-        self, page: int = 1, per_page: int = 10
+        self,
+        page: int = 1,
+        per_page: int = 10,
+        include_artifacts: bool = True,
+        cursor: Optional[str] = None,
+        count: Optional[str] = None,
     ) -> Tuple[List[Task], Pagination]:
         if self.debug_enabled:
             LOG.info("Listing tasks")
-        try:
-            with self.Session() as session:
-                tasks = (
-                    session.query(TaskModel)
-                    .offset((page - 1) * per_page)
-                    .limit(per_page)
-                    .all()
-                )
-                total = session.query(TaskModel).count()
-                pages = math.ceil(total / per_page)
-                pagination = Pagination(
-                    total_items=total,
-                    total_pages=pages,
-                    current_page=page,
-                    page_size=per_page,
-                )
-                return [
-                    convert_to_task(task, self.debug_enabled) for task in tasks
-                ], pagination
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while listing tasks: {e}")
-            raise
 
-        except Exception as e:
-            LOG.error(f"Unexpected error while listing tasks: {e}")
-            raise
+        def list_page(session: Session) -> Tuple[List[Task], Pagination]:
+            query = session.query(TaskModel)
+            if include_artifacts:
+                # one batched query for the whole page instead of one per task
+                query = query.options(selectinload(TaskModel.artifacts))
+            tasks = paginate(
+                query, TaskModel.created_at, TaskModel.task_id, page, per_page, cursor
+            ).all()
+            total = count_items(session, TaskModel.task_id, count_mode(count, cursor))
+            tasks, pagination = build_page(
+                tasks, page, per_page, cursor, total,
+                lambda task: (task.created_at, task.task_id),
+            )
+            return [
+                convert_to_task(task, self.debug_enabled, include_artifacts)
+                for task in tasks
+            ], pagination
+
+        return await self._run("listing tasks", list_page)
 
     async def list_steps(
-        self, task_id: str, page: int = 1, per_page: int = 10
+        self,
+        task_id: str,
+        page: int = 1,
+        per_page: int = 10,
+        include_artifacts: bool = True,
+        cursor: Optional[str] = None,
+        count: Optional[str] = None,
+        include_archived: bool = False,
     ) -> Tuple[List[Step], Pagination]:
         if self.debug_enabled:
             LOG.info(f"Listing steps for task_id: {task_id}")
-        try:
-            with self.Session() as session:
-                steps = (
-                    session.query(StepModel)
-                    .filter_by(task_id=task_id)
-                    .offset((page - 1) * per_page)
-                    .limit(per_page)
-                    .all()
-                )
-                total = session.query(StepModel).filter_by(task_id=task_id).count()
-                pages = math.ceil(total / per_page)
-                pagination = Pagination(
-                    total_items=total,
-                    total_pages=pages,
-                    current_page=page,
-                    page_size=per_page,
+
+        def list_page(session: Session) -> Tuple[List[Step], Pagination]:
+            # archived tasks have no live steps left, so one lookup decides
+            if include_archived and (archived := session.get(TaskArchiveModel, task_id)):
+                return page_archived_steps(
+                    unpack_archive(archived.payload)[1],
+                    page, per_page, include_artifacts, cursor, count,
                 )
-                return [
-                    convert_to_step(step, self.debug_enabled) for step in steps
-                ], pagination
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while listing steps: {e}")
-            raise
-        except Exception as e:
-            LOG.error(f"Unexpected error while listing steps: {e}")
-            raise
+            query = session.query(StepModel).filter_by(task_id=task_id)
+            if include_artifacts:
+                query = query.options(selectinload(StepModel.artifacts))
+            steps = paginate(
+                query, StepModel.created_at, StepModel.step_id, page, per_page, cursor
+            ).all()
+            total = count_items(
+                session, StepModel.step_id, count_mode(count, cursor), task_id=task_id
+            )
+            steps, pagination = build_page(
+                steps, page, per_page, cursor, total,
+                lambda step: (step.created_at, step.step_id),
+            )
+            return [
+                convert_to_step(step, self.debug_enabled, include_artifacts)
+                for step in steps
+            ], pagination
+
+        return await self._run("listing steps", list_page)
 
     async def list_artifacts(
-        self, task_id: str, page: int = 1, per_page: int = 10
+        self,
+        task_id: str,
+        page: int = 1,
+        per_page: int = 10,
+        cursor: Optional[str] = None,
+        count: Optional[str] = None,
     ) -> Tuple[List[Artifact], Pagination]:
         if self.debug_enabled:
             LOG.info(f"Listing artifacts for task_id: {task_id}")
-        try:
-            with self.Session() as session:
-                artifacts = (
-                    session.query(ArtifactModel)
-                    .filter_by(task_id=task_id)
-                    .offset((page - 1) * per_page)
-                    .limit(per_page)
-                    .all()
-                )
-                total = session.query(ArtifactModel).filter_by(task_id=task_id).count()
-                pages = math.ceil(total / per_page)
-                pagination = Pagination(
-                    total_items=total,
-                    total_pages=pages,
-                    current_page=page,
-                    page_size=per_page,
+
+        def list_page(session: Session) -> Tuple[List[Artifact], Pagination]:
+            query = session.query(ArtifactModel).filter_by(task_id=task_id)
+            artifacts = paginate(
+                query,
+                ArtifactModel.created_at,
+                ArtifactModel.artifact_id,
+                page,
+                per_page,
+                cursor,
+            ).all()
+            total = count_items(
+                session,
+                ArtifactModel.artifact_id,
+                count_mode(count, cursor),
+                task_id=task_id,
+            )
+            artifacts, pagination = build_page(
+                artifacts, page, per_page, cursor, total,
+                lambda artifact: (artifact.created_at, artifact.artifact_id),
+            )
+            return [convert_to_artifact(artifact) for artifact in artifacts], pagination
+
+        return await self._run("listing artifacts", list_page)
+
+    async def append_messages(
+        self, task_id: str, messages: List[Dict[str, Any]], instruction: bool = False
+    ) -> None:
+        if self.debug_enabled:
+            LOG.info(f"Appending {len(messages)} chat messages for task_id: {task_id}")
+
+        def append(session: Session) -> None:
+            session.execute(
+                insert(ChatMessageModel),
+                [message_row(task_id, message, instruction) for message in messages],
+            )
+            session.commit()
+
+        await self._run("appending chat messages", append, write=True)
+
+    async def list_messages(
+        self, task_id: str, after_id: int = 0, instruction_only: bool = False
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Messages of a task newer than after_id, oldest first"""
+
+        def list_all(session: Session) -> List[Tuple[int, Dict[str, Any]]]:
+            query = (
+                select(ChatMessageModel)
+                .filter(
+                    ChatMessageModel.task_id == task_id,
+                    ChatMessageModel.message_id > after_id,
                 )
-                return [
-                    convert_to_artifact(artifact) for artifact in artifacts
-                ], pagination
-        except SQLAlchemyError as e:
-            LOG.error(f"SQLAlchemy error while listing artifacts: {e}")
-            raise
-        except Exception as e:
-            LOG.error(f"Unexpected error while listing artifacts: {e}")
-            raise
+                .order_by(ChatMessageModel.message_id)
+            )
+            if instruction_only:
+                query = query.filter(ChatMessageModel.instruction == True)
+            return [convert_to_message(m) for m in session.scalars(query)]
+
+        return await self._run("listing chat messages", list_all)
+
+    async def next_step_number(self, task_id: str) -> int:
+        """Bump and return the step counter of a task"""
+
+        def bump(session: Session) -> int:
+            conversation = session.get(ConversationModel, task_id, with_for_update=True)
+            if conversation is None:
+                conversation = ConversationModel(task_id=task_id, steps_amount=0)
+                session.add(conversation)
+            conversation.steps_amount += 1
+            session.commit()
+            return conversation.steps_amount
+
+        return await self._run("counting steps", bump, write=True)
+
+
+class AgentDB(AgentDBBase):
+    """The agent database on a blocking engine, queried on the calling thread"""
+
+    def __init__(
+        self,
+        database_string,
+        debug_enabled: bool = False,
+        write_behind: bool = False,
+        flush_interval: float = 0.05,
+        cache: Optional[ReadCache] = None,
+    ) -> None:
+        super().__init__(debug_enabled, write_behind, flush_interval, cache)
+        if self.debug_enabled:
+            LOG.info(f"Initializing AgentDB with database_string: {database_string}")
+        url, engine_options = split_engine_options(database_string)
+        self.engine = create_engine(url, **engine_options)
+        if url.get_backend_name() == "sqlite":
+            apply_sqlite_profile(self.engine)
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            migrate_schema(conn)
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def _execute(self, operation: Callable[[Session], Any], write: bool = False) -> Any:
+        with self.Session() as session:
+            return operation(session)
+
+    async def close(self) -> None:
+        if self.write_behind is not None:
+            await self.write_behind.close()
+        self.engine.dispose()
+
+
+class AsyncAgentDB(AgentDBBase):
+    """
+    AgentDB backed by SQLAlchemy's asyncio extension so database I/O no longer
+    blocks the event loop. Drop-in replacement for AgentDB.
+    """
+
+    def __init__(
+        self,
+        database_string,
+        debug_enabled: bool = False,
+        write_behind: bool = False,
+        flush_interval: float = 0.05,
+        cache: Optional[ReadCache] = None,
+    ) -> None:
+        super().__init__(debug_enabled, write_behind, flush_interval, cache)
+        if self.debug_enabled:
+            LOG.info(f"Initializing AsyncAgentDB with database_string: {database_string}")
+        url, engine_options = split_engine_options(database_string)
+        self.engine = create_async_engine(to_async_url(url), **engine_options)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        # SQLite allows one writer at a time: queue writes behind a single lane
+        # so they wait on each other here instead of on the database lock,
+        # while reads keep running concurrently on their own connections
+        self._write_lock = None
+        if url.get_backend_name() == "sqlite":
+            apply_sqlite_profile(self.engine.sync_engine)
+            self._write_lock = asyncio.Lock()
+        self._tables_created = False
+        self._tables_lock = asyncio.Lock()
+
+    async def _ensure_tables(self) -> None:
+        # create_all needs a running loop, so it happens on first use
+        if self._tables_created:
+            return
+        async with self._tables_lock:
+            if not self._tables_created:
+                async with self.engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+                    await conn.run_sync(migrate_schema)
+                self._tables_created = True
+
+    def _write_lane(self):
+        return self._write_lock or contextlib.nullcontext()
+
+    async def _execute(self, operation: Callable[[Session], Any], write: bool = False) -> Any:
+        await self._ensure_tables()
+        lane = self._write_lane() if write else contextlib.nullcontext()
+        # the operation runs on the session's sync facade, its I/O still awaits
+        async with lane, self.Session() as session:
+            return await session.run_sync(operation)
+
+    async def close(self) -> None:
+        if self.write_behind is not None:
+            await self.write_behind.close()
+        await self.engine.dispose()
@@ -0,0 +1,161 @@
+import abc
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from schema import Artifact, Step, Task
+
+
+class CacheBackend(abc.ABC):
+    """
+    Storage for cached rows. Values are JSON strings so a backend shared
+    between server processes (redis, memcached, ...) can hold them as-is and
+    invalidations made by one process are seen by all of them.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str, ttl: float) -> None:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, *keys: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class LocalCacheBackend(CacheBackend):
+    """In-process LRU dict with per-entry expiry"""
+
+    def __init__(self, max_items: int = 1024) -> None:
+        self.max_items = max_items
+        self._items: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        if (item := self._items.get(key)) is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+class ReadCache:
+    """
+    Read-through cache for get_task, get_step and get_artifact. The DB
+    write paths invalidate the entries they change; the TTL bounds how stale
+    a row can get when another process writes without a shared backend.
+
+    A reader takes generation() before its DB read and hands it to set_*,
+    which drops the row if the key was invalidated in between, so a write
+    racing the read can't leave its old version cached for the whole TTL.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl: float = 5.0,
+        prefix: str = "agentdb",
+        max_generations: int = 4096,
+    ) -> None:
+        self.backend = backend or LocalCacheBackend()
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.max_generations = max_generations
+        # key -> clock value of its last invalidation; keys pushed out of the
+        # bounded map fall back to the newest stamp evicted so far
+        self._clock = 0
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        self._evicted_generation = 0
+
+    def _key(self, kind: str, item_id: str) -> str:
+        return f"{self.prefix}:{kind}:{item_id}"
+
+    def generation(self, kind: str, item_id: str) -> int:
+        """Invalidation generation of a "task", "step" or "artifact" entry"""
+        return self._generations.get(self._key(kind, item_id), self._evicted_generation)
+
+    def _get(self, kind: str, item_id: str, model):
+        if (value := self.backend.get(self._key(kind, item_id))) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # a fresh object per hit, callers are free to mutate it
+        return model.model_validate_json(value)
+
+    def _set(self, kind: str, item_id: str, obj, generation: Optional[int]) -> None:
+        if generation is not None and generation != self.generation(kind, item_id):
+            return
+        self.backend.set(self._key(kind, item_id), obj.model_dump_json(), self.ttl)
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        return self._get("task", task_id, Task)
+
+    def set_task(self, task: Task, generation: Optional[int] = None) -> None:
+        if task:
+            self._set("task", task.task_id, task, generation)
+
+    def get_step(self, step_id: str) -> Optional[Step]:
+        return self._get("step", step_id, Step)
+
+    def set_step(self, step: Step, generation: Optional[int] = None) -> None:
+        if step:
+            self._set("step", step.step_id, step, generation)
+
+    def get_artifact(self, artifact_id: str) -> Optional[Artifact]:
+        return self._get("artifact", artifact_id, Artifact)
+
+    def set_artifact(self, artifact: Artifact, generation: Optional[int] = None) -> None:
+        if artifact:
+            self._set("artifact", artifact.artifact_id, artifact, generation)
+
+    def invalidate(
+        self,
+        task_id: Optional[str] = None,
+        step_id: Optional[str] = None,
+        artifact_id: Optional[str] = None,
+    ) -> None:
+        keys = []
+        if task_id:
+            keys.append(self._key("task", task_id))
+        if step_id:
+            keys.append(self._key("step", step_id))
+        if artifact_id:
+            keys.append(self._key("artifact", artifact_id))
+        self._clock += 1
+        for key in keys:
+            self._generations[key] = self._clock
+            self._generations.move_to_end(key)
+        while len(self._generations) > self.max_generations:
+            self._evicted_generation = self._generations.popitem(last=False)[1]
+        self.backend.delete(*keys)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -5,6 +5,14 @@ class NotFoundError(Exception):
     pass
 
 
+class QueueFullError(Exception):
+    pass
+
+
+class StreamInterruptedError(Exception):
+    """A streamed reply failed after some of its deltas reached the consumer"""
+
+
 class AgentException(Exception):
     """Base class for specific exceptions relevant in the execution of Agents"""
 
@@ -0,0 +1,99 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set
+
+
+class TaskEvent:
+    def __init__(self, event_id: int, task_id: str, event: str, data: Dict[str, Any]):
+        self.event_id = event_id
+        self.task_id = task_id
+        self.event = event
+        self.data = data
+
+    def to_sse(self) -> str:
+        payload = json.dumps({"task_id": self.task_id, **self.data}, default=str)
+        return f"id: {self.event_id}\nevent: {self.event}\ndata: {payload}\n\n"
+
+
+class EventBroker:
+    """
+    Fans task events out to subscribers (the SSE endpoint). Publishing never
+    waits: every subscriber has a bounded queue and a slow one loses its
+    oldest events. The last `history` events of each task are kept so a
+    client reconnecting with Last-Event-ID can catch up; `live_only` events
+    (token deltas) are delivered but not kept, so a long completion can't
+    push the step and status events out of the history.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 1000,
+        history: int = 200,
+        max_tasks: int = 1000,
+        live_only: Iterable[str] = ("llm_token",),
+    ):
+        self.max_queue = max_queue
+        self.history = history
+        self.max_tasks = max_tasks
+        self.live_only = frozenset(live_only)
+        self.published = 0
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self._recent: "OrderedDict[str, deque]" = OrderedDict()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def publish(self, task_id: str, event: str, **data: Any) -> None:
+        item = TaskEvent(next(self._ids), task_id, event, {"time": time.time(), **data})
+        self.published += 1
+        if event not in self.live_only:
+            if task_id not in self._recent:
+                self._recent[task_id] = deque(maxlen=self.history)
+                while len(self._recent) > self.max_tasks:
+                    self._recent.popitem(last=False)
+            self._recent[task_id].append(item)
+        for queue in self._subscribers.get(task_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(item)
+
+    async def subscribe(
+        self,
+        task_id: str,
+        last_event_id: Optional[int] = None,
+        keepalive: Optional[float] = None,
+    ) -> AsyncIterator[Optional[TaskEvent]]:
+        """Events of a task as they are published, None after keepalive idle seconds"""
+        queue: asyncio.Queue = asyncio.Queue(self.max_queue)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            seen = 0
+            if last_event_id is not None:
+                for item in list(self._recent.get(task_id, ())):
+                    if item.event_id > last_event_id:
+                        seen = item.event_id
+                        yield item
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # already replayed from history
+                if item.event_id > seen:
+                    yield item
+        finally:
+            subscribers = self._subscribers.get(task_id, set())
+            subscribers.discard(queue)
+            if not subscribers:
+                self._subscribers.pop(task_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "published": self.published,
+            "dropped": self.dropped,
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+        }
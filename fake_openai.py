@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from agent_log import AgentLogger
+from llm_backends import DEFAULT_REPLY, fake_embedding
+
+LOG = AgentLogger(__name__)
+
+
+class FakeOpenAI:
+    """
+    Local stand-in for the OpenAI chat completions and embeddings endpoints,
+    for running the agent and its benchmarks without network or key. Every
+    completion returns the same reply, streamed in chunks of chunk_chars
+    characters with a fixed first-token and per-chunk delay. Prompt caching
+    is imitated per message: the longest run of leading messages seen in an
+    earlier request is reported as cached tokens.
+    Point the agent at it with OPENAI_BASE_URL=http://localhost:<port>/v1.
+    """
+
+    def __init__(
+        self,
+        reply: str = DEFAULT_REPLY,
+        chunk_chars: int = 4,
+        first_token_delay: float = 0.2,
+        token_delay: float = 0.01,
+        embedding_size: int = 1536,
+    ) -> None:
+        self.reply = reply
+        self.chunk_chars = chunk_chars
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.embedding_size = embedding_size
+        self.requests = 0
+        self._prefixes: set = set()
+        self.app = FastAPI(title="Fake OpenAI")
+        self.app.add_api_route("/v1/chat/completions", self.chat_completions, methods=["POST"])
+        self.app.add_api_route("/v1/embeddings", self.embeddings, methods=["POST"])
+        self.app.add_api_route("/v1/models", self.models, methods=["GET"])
+
+    def _usage(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        prompt = cached = 0
+        prefix = hashlib.sha256()
+        hit = True
+        for message in messages:
+            prefix.update(json.dumps(message, sort_keys=True).encode())
+            tokens = len(str(message.get("content", ""))) // 4 + 3
+            prompt += tokens
+            digest = prefix.hexdigest()
+            if hit and digest in self._prefixes:
+                cached += tokens
+            else:
+                hit = False
+                self._prefixes.add(digest)
+        completion = len(self.reply) // 4 + 1
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+        model = body.get("model") or "fake"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        if not body.get("stream"):
+            await asyncio.sleep(
+                self.first_token_delay
+                + self.token_delay * math.ceil(len(self.reply) / self.chunk_chars)
+            )
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": self.reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": self._usage(body.get("messages", [])),
+                }
+            )
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(self.first_token_delay)
+            yield chunk({"role": "assistant", "content": ""})
+            for start in range(0, len(self.reply), self.chunk_chars):
+                yield chunk({"content": self.reply[start : start + self.chunk_chars]})
+                await asyncio.sleep(self.token_delay)
+            yield chunk({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": self._usage(body.get("messages", [])),
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    async def embeddings(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        return JSONResponse(
+            {
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(str(text), self.embedding_size)}
+                    for i, text in enumerate(inputs)
+                ],
+                "model": body.get("model") or "fake",
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+        )
+
+    async def models(self):
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "local"}]}
+
+
+if __name__ == "__main__":
+    """Runs the fake OpenAI server"""
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI-compatible API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--reply-file", help="file with the reply every completion returns")
+    parser.add_argument("--chunk-chars", type=int, default=4)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    reply = DEFAULT_REPLY
+    if args.reply_file:
+        with open(args.reply_file) as f:
+            reply = f.read()
+    server = FakeOpenAI(
+        reply,
+        chunk_chars=args.chunk_chars,
+        first_token_delay=args.first_token_delay,
+        token_delay=args.token_delay,
+    )
+    config = Config()
+    config.bind = [f"localhost:{args.port}"]
+    LOG.info(f"Fake OpenAI listening on port {args.port}")
+    asyncio.run(serve(server.app, config))
@@ -0,0 +1,140 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# a ```json fenced block, the closing fence may be missing from a cut-off reply
+_FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.S)
+
+
+def _close(text: str) -> str:
+    """text with its open strings, objects and arrays closed"""
+    closers = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+    if in_string:
+        text += "\\" if escaped else ""
+        text += '"'
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    elif text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(closers))
+
+
+def parse_reply(text: str) -> Tuple[Any, bool]:
+    """
+    The JSON value of an LLM reply and whether it had to be repaired first.
+    A code fence, text before or after the first object and a reply cut off
+    mid-object are repaired locally; anything else raises ValueError.
+    """
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+    if (fence := _FENCE.search(text)) is not None and "{" in fence.group(1):
+        text = fence.group(1)
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in the reply")
+    text = text[start:]
+    try:
+        # stops at the end of the object, whatever follows it
+        value, _ = json.JSONDecoder().raw_decode(text)
+        return value, True
+    except ValueError:
+        pass
+    return json.loads(_close(text)), True
+
+
+class AbilityStreamParser:
+    """
+    Incremental scanner over a streamed LLM reply. It tracks JSON nesting
+    and string state per character and hands back each ability object of
+    the reply ("ability": {...} or the elements of "abilities": [...]) as
+    soon as its closing brace has arrived, without waiting for the rest.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.count = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        # depth of the "abilities" array / "ability" object being read
+        self._array_depth: Optional[int] = None
+        self._object_depth: Optional[int] = None
+        self._object_start = 0
+
+    def feed(self, delta: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """(position in the reply, ability call) for every call completed by delta"""
+        self.text += delta
+        found = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start : self._pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos + 1
+            elif char == ":":
+                # keys only matter on the top-level object
+                if self._depth == 1:
+                    self._key = self._last_string
+            elif char == ",":
+                if self._depth == 1:
+                    self._key = None
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "[" and self._key == "abilities":
+                    self._array_depth = 2
+                elif char == "{" and (
+                    (self._depth == 2 and self._key == "ability")
+                    or (self._array_depth == 2 and self._depth == 3)
+                ):
+                    self._object_depth = self._depth
+                    self._object_start = self._pos
+            elif char in "}]":
+                if char == "}" and self._depth == self._object_depth:
+                    call = self._decode(text[self._object_start : self._pos + 1])
+                    if call is not None:
+                        found.append((self.count, call))
+                    self.count += 1
+                    self._object_depth = None
+                if char == "]" and self._depth == self._array_depth:
+                    self._array_depth = None
+                self._depth -= 1
+            self._pos += 1
+        return found
+
+    @staticmethod
+    def _decode(raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            call = json.loads(raw)
+        except ValueError:
+            return None
+        return call if isinstance(call, dict) else None
@@ -1,71 +1,351 @@
+import asyncio
 import typing
 import os
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-from openai import OpenAI
-from openai import AsyncOpenAI
+import time
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_random_exponential
+from openai import RateLimitError
 from dotenv import load_dotenv
+from errors import StreamInterruptedError
+from context_window import TokenCounter
+from db_cache import LocalCacheBackend
+from llm_backends import (
+    BackendRegistry,
+    LiteLLMBackend,
+    OpenAIBackend,
+    RecordingBackend,
+    StubBackend,
+    parse_routes,
+)
+from llm_cache import ResponseCache, SQLiteCacheBackend
+from llm_embeddings import Embedder, EmbeddingStore
+from llm_hedge import Hedger
+from llm_limiter import LLMLimiter, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from llm_singleflight import SingleFlight
 
 load_dotenv() 
 model_name = os.getenv("OPENAI_MODEL")
-client = AsyncOpenAI(
-    api_key = os.getenv("OPENAI_API_KEY") ,
-    organization = os.getenv("ORGANIZATION_ID")
+embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+
+
+def _backends() -> BackendRegistry:
+    registry = BackendRegistry(
+        os.getenv("LLM_BACKEND", "openai"), parse_routes(os.getenv("LLM_ROUTES"))
+    )
+    openai_backend = OpenAIBackend(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        organization=os.getenv("ORGANIZATION_ID"),
+    )
+    if record_path := os.getenv("LLM_RECORD_PATH"):
+        openai_backend = RecordingBackend(openai_backend, record_path)
+    registry.register("openai", openai_backend)
+    registry.register(
+        "stub",
+        StubBackend(
+            os.getenv("LLM_STUB_PATH"),
+            latency=float(os.getenv("LLM_STUB_LATENCY", 0)),
+            token_delay=float(os.getenv("LLM_STUB_TOKEN_DELAY", 0)),
+        ),
+    )
+    try:
+        registry.register("litellm", LiteLLMBackend())
+    except ImportError:
+        # optional, only needed when routed to
+        if registry.default == "litellm":
+            raise
+    return registry
+
+
+backends = _backends()
+
+limiter = LLMLimiter(
+    max_concurrency=int(os.getenv("LLM_CONCURRENCY", 8)),
+    requests_per_minute=int(os.getenv("LLM_RPM", 0)),
+    tokens_per_minute=int(os.getenv("LLM_TPM", 0)),
+)
+single_flight = SingleFlight()
+hedger = Hedger(
+    percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", 0)),
+    min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20)),
+    deadline=float(os.getenv("LLM_DEADLINE", 0)) or None,
+    allow=limiter.has_capacity,
 )
+token_counter = TokenCounter(model_name)
+# reply tokens charged up front, corrected from the usage when it is reported
+response_tokens = int(os.getenv("CONTEXT_RESPONSE_TOKENS", 1024))
+# appended to the first message of every request, always the same bytes
+JSON_HINT = " use json_mode and dont return base64"
+
+
+def build_messages(messages: typing.List[typing.Dict[str, typing.Any]]) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    The messages as sent: a new list with the JSON hint on the first one.
+    The caller's messages are left as they are, so a retried or repeated
+    request sends the same prefix and provider prompt caching can hit.
+    """
+    if not messages:
+        return []
+    first = dict(messages[0], content=str(messages[0]["content"]) + JSON_HINT)
+    return [first, *messages[1:]]
+
+
+def _rate_limited(e: Exception) -> None:
+    if isinstance(e, RateLimitError):
+        retry_after = e.response.headers.get("retry-after")
+        try:
+            limiter.pause(float(retry_after))
+        except (TypeError, ValueError):
+            limiter.pause(1.0)
+
 
 @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+async def _embed_batch(texts: typing.List[str], model: str) -> typing.List[typing.List[float]]:
+    backend, backend_model = backends.resolve(model)
+    tokens = sum(token_counter.count_text(text) for text in texts)
+    try:
+        async with limiter.slot(tokens, PRIORITY_BACKGROUND) as lease:
+            vectors, lease.used = await backend.embed(texts, backend_model)
+    except Exception as e:
+        _rate_limited(e)
+        raise
+    return vectors
+
+
+embedders: typing.Dict[str, Embedder] = {}
+
+
+def embedder(model: typing.Optional[str] = None) -> Embedder:
+    """The batching, caching embedder of a model, one store file per model"""
+    model = model or embedding_model
+    if model not in embedders:
+        cache_dir = os.getenv("EMBEDDING_CACHE_DIR")
+        path = os.path.join(cache_dir, model.replace("/", "_")) if cache_dir else None
+        embedders[model] = Embedder(
+            lambda texts: _embed_batch(texts, model),
+            EmbeddingStore(path),
+            count_tokens=token_counter.count_text,
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", 256)),
+            batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", 50000)),
+            concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", 4)),
+        )
+    return embedders[model]
+
+
+async def create_embeddings(
+    texts: typing.List[str], model: typing.Optional[str] = None
+) -> typing.List[typing.List[float]]:
+    """One embedding per text, in order; texts seen before come from the cache"""
+    return (await embedder(model).embed(texts)).tolist()
+
+
+async def _embed_prompt(text: str) -> typing.List[float]:
+    [vector] = await create_embeddings([text])
+    return vector
+
+
+def _response_cache() -> typing.Optional[ResponseCache]:
+    kind = os.getenv("LLM_CACHE", "memory").lower()
+    size = int(os.getenv("LLM_CACHE_SIZE", 1000))
+    if kind == "off":
+        return None
+    if kind == "sqlite":
+        backend = SQLiteCacheBackend(os.getenv("LLM_CACHE_PATH", "llm_cache.db"), size)
+    else:
+        backend = LocalCacheBackend(size)
+    return ResponseCache(
+        backend,
+        ttl=float(os.getenv("LLM_CACHE_TTL", 86400)),
+        embed=_embed_prompt,
+        similarity=float(os.getenv("LLM_CACHE_SIMILARITY", 0)),
+    )
+
+
+response_cache = _response_cache()
+
+
+def llm_stats() -> typing.Dict[str, typing.Any]:
+    """Counters of the LLM client layer, for the agent metrics"""
+    stats = {
+        "limiter": limiter.stats(),
+        "single_flight": single_flight.stats(),
+        "hedging": hedger.stats(),
+        "backends": backends.stats(),
+        "embeddings": {model: e.stats() for model, e in embedders.items()},
+    }
+    if response_cache is not None:
+        stats["cache"] = response_cache.stats()
+    return stats
+
+@retry(
+    wait=wait_random_exponential(min=1, max=40),
+    stop=stop_after_attempt(3),
+    # the consumer has seen part of the reply, a new attempt would repeat it
+    retry=retry_if_not_exception_type(StreamInterruptedError),
+)
 async def chat_completion_request(
     messages,
     functions=None,
     function_call=None,
-    model=str,
+    model=None,
     custom_labels=None,
-    temperature=None) -> typing.Union[typing.Dict[str, typing.Any], Exception]:
-    """Generate a response to a list of messages using OpenAI's API"""
+    temperature=None,
+    on_token: typing.Optional[typing.Callable[[str], None]] = None,
+    cache: bool = False,
+    accept: typing.Optional[typing.Callable[[str], bool]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    deadline: typing.Optional[float] = None,
+    on_usage: typing.Optional[typing.Callable[[typing.Dict[str, int]], None]] = None,
+    response_format: typing.Optional[typing.Dict[str, typing.Any]] = None) -> typing.Union[typing.Dict[str, typing.Any], Exception]:
+    """
+    Generate a response to a list of messages with the backend serving model
+    (default OPENAI_MODEL).
+    With on_token the reply is streamed and each delta is passed to it as it arrives.
+    With cache True identical requests are answered from the response cache;
+    it is off by default, a call site opts in when its prompt is worth reusing.
+    With accept only replies it returns True for are cached, so a reply the
+    caller can't use isn't served again.
+    temperature defaults to 0.3.
+    API calls wait for the shared limiter, lower priority values go first.
+    Concurrent identical requests share one API call and its result or error.
+    A call taking longer than deadline (default LLM_DEADLINE) seconds once it
+    has its limiter slot raises TimeoutError and is retried. A stream that
+    fails after its first delta went to on_token is not retried, it raises
+    StreamInterruptedError. A slow call may be hedged, a streamed one until
+    its first token.
+    on_usage gets the tokens the provider reported (prompt, cached, total),
+    an empty dict when the reply came from the cache.
+    response_format is passed to the provider, {"type": "json_object"} for
+    its JSON mode.
+    """
+    streamed = False
+    if on_token is not None:
+        consumer = on_token
+
+        def on_token(delta: str) -> None:
+            nonlocal streamed
+            streamed = True
+            consumer(delta)
+
     try:
-        messages[0]["content"] = str(messages[0]["content"])+" use json_mode and dont return base64"
+        messages = build_messages(messages)
         kwargs = {
-            "model": model_name,
+            "model": model or model_name,
             "messages": messages,
-            "temperature":  0.3,
+            "temperature": 0.3 if temperature is None else temperature,
+            "response_format": response_format,
         }
-        completion = await client.chat.completions.create(**kwargs)
-        response = completion.choices[0].message.content
+        # a reply in JSON mode is not interchangeable with a free text one
+        scope = kwargs["model"]
+        if response_format:
+            scope = f"{scope}|{response_format.get('type')}"
+        cache = cache and response_cache is not None
+        if cache:
+            cached = await response_cache.get(messages, scope, kwargs["temperature"])
+            if cached is not None and (accept is None or accept(cached)):
+                if on_token is not None:
+                    on_token(cached)
+                if on_usage is not None:
+                    on_usage({})
+                return cached
+        # identical requests already in flight are joined, not sent again
+        flight_key = ResponseCache.key(messages, scope, kwargs["temperature"])
+        flight_key += ":stream" if on_token is not None else ":full"
+        response, usage = await single_flight.run(
+            flight_key,
+            lambda emit: _complete(kwargs, scope, priority, emit, cache, deadline, accept),
+            on_token,
+        )
+        if on_usage is not None:
+            on_usage(dict(usage))
         return response
     except Exception as e:
         print("debug message chat completion >>",messages)
         print("Unable to generate ChatCompletion response")
         print(f"Exception: {e}")
+        if streamed:
+            raise StreamInterruptedError(f"Stream failed after its first delta: {e!r}") from e
         raise
 
 
-@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
-async def create_chat_embedding_request(
-    messages, model="text-embedding-ada-002"
-) -> typing.Union[typing.Dict[str, typing.Any], Exception]:
-    """Generate an embedding for a list of messages using OpenAI's API"""
-    try:
-        return await openai.Embedding.acreate(
-            input=[f"{m['role']}: {m['content']}" for m in messages],
-            engine=model,
-        )
-    except Exception as e:
-        print("Unable to generate ChatCompletion response")
-        print(f"Exception: {e}")
-        raise
+async def _complete(
+    kwargs: typing.Dict[str, typing.Any],
+    scope: str,
+    priority: int,
+    on_token: typing.Optional[typing.Callable[[str], None]],
+    cache: bool,
+    deadline: typing.Optional[float] = None,
+    accept: typing.Optional[typing.Callable[[str], bool]] = None) -> typing.Tuple[str, typing.Dict[str, int]]:
+    """
+    One API call (or a hedged pair) through the limiter, the reply and its
+    usage; the reply goes to the cache under scope if accept takes it
+    """
+    messages = kwargs["messages"]
+    estimate = token_counter.count_messages(messages) + response_tokens
+
+    # a stream is hedged on its time to first token, its deltas go out after that
+    latency_key = kwargs["model"] if on_token is None else f"{kwargs['model']}:first_token"
+
+    async def call(claim: typing.Callable[[], bool]) -> typing.Tuple[str, typing.Dict[str, int]]:
+        started = time.monotonic()
+        if on_token is None:
+            backend, model = backends.resolve(kwargs["model"])
+            completion = await backend.complete(
+                messages, model, kwargs["temperature"], kwargs["response_format"]
+            )
+            hedger.record(latency_key, time.monotonic() - started)
+            return completion.content, completion.usage
+        deltas, usage = [], {}
+        async for delta in chat_completion_stream(**kwargs, usage=usage):
+            if not deltas:
+                hedger.record(latency_key, time.monotonic() - started)
+                if not claim():
+                    raise asyncio.CancelledError()
+            deltas.append(delta)
+            on_token(delta)
+        return "".join(deltas), usage
+
+    async def attempt(claim: typing.Callable[[], bool]) -> typing.Tuple[str, typing.Dict[str, int]]:
+        async with limiter.slot(estimate, priority) as lease:
+            # the deadline starts with the slot, time queued behind other calls isn't charged
+            response, usage = await hedger.within(kwargs["model"], call(claim), deadline)
+            lease.used = usage.get("total_tokens")
+            return response, usage
 
-@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
-async def create_text_embedding_request(
-    text, model="text-embedding-ada-002"
-) -> typing.Union[typing.Dict[str, typing.Any], Exception]:
-    """Generate an embedding for a list of messages using OpenAI's API"""
     try:
-        return await openai.Embedding.acreate(
-            input=[text],
-            engine=model,
-        )
+        response, usage = await hedger.run(latency_key, attempt, deadline=deadline)
     except Exception as e:
-        print("Unable to generate ChatCompletion response")
-        print(f"Exception: {e}")
+        _rate_limited(e)
         raise
+    if cache and response and (accept is None or accept(response)):
+        await response_cache.set(messages, scope, kwargs["temperature"], response)
+    return response, usage
+
+
+async def chat_completion_stream(
+    messages,
+    model=None,
+    temperature=0.3,
+    usage: typing.Optional[typing.Dict[str, int]] = None,
+    response_format: typing.Optional[typing.Dict[str, typing.Any]] = None) -> typing.AsyncIterator[str]:
+    """
+    Yield the content deltas of a streamed completion as they arrive.
+    Not retried: a consumer has already seen the deltas of a failed stream.
+    usage is filled in with the provider's token counts once the stream ends.
+    """
+    backend, model = backends.resolve(model or model_name)
+    async for delta in backend.stream(messages, model, temperature, usage, response_format):
+        yield delta
 
 
+async def create_chat_embedding_request(
+    messages, model=None
+) -> typing.List[typing.List[float]]:
+    """Embed each message of a chat as "role: content", one vector per message"""
+    return await create_embeddings(
+        [f"{m['role']}: {m['content']}" for m in messages], model
+    )
+
+async def create_text_embedding_request(
+    text, model=None
+) -> typing.List[typing.List[float]]:
+    """Embed one text, returned as a list holding its vector"""
+    return await create_embeddings([text], model)
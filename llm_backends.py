@@ -0,0 +1,344 @@
+import abc
+import asyncio
+import hashlib
+import json
+import math
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from openai import NOT_GIVEN, AsyncOpenAI
+from llm_cache import ResponseCache
+
+
+class Completion:
+    def __init__(self, content: str, usage: Optional[Dict[str, int]] = None) -> None:
+        self.content = content
+        self.usage = usage or {}
+
+
+def usage_dict(usage: Any) -> Dict[str, int]:
+    """prompt, completion, total and provider-cached prompt tokens of an API usage object"""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    else:
+        cached = getattr(details, "cached_tokens", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "cached_tokens": cached or 0,
+    }
+
+
+class LLMBackend(abc.ABC):
+    """A provider of chat completions and embeddings"""
+
+    @abc.abstractmethod
+    async def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Completion:
+        """response_format asks for structured output, e.g. {"type": "json_object"}"""
+        pass
+
+    @abc.abstractmethod
+    def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        usage: Optional[Dict[str, int]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """Content deltas of the reply as they arrive, usage is filled in at the end"""
+        pass
+
+    @abc.abstractmethod
+    async def embed(self, texts: List[str], model: str) -> Tuple[List[List[float]], Optional[int]]:
+        """One vector per text and the tokens used"""
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI or any server speaking its API (OPENAI_BASE_URL)"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        organization: Optional[str] = None,
+        base_url: Optional[str] = None,
+    ) -> None:
+        self.api_key = api_key
+        self.organization = organization
+        self.base_url = base_url
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # created on first use, a stub-only setup needs no API key
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key, organization=self.organization, base_url=self.base_url
+            )
+        return self._client
+
+    async def complete(self, messages, model, temperature, response_format=None) -> Completion:
+        completion = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format=response_format or NOT_GIVEN,
+        )
+        return Completion(completion.choices[0].message.content, usage_dict(completion.usage))
+
+    async def stream(
+        self, messages, model, temperature, usage=None, response_format=None
+    ) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format=response_format or NOT_GIVEN,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.choices and (delta := chunk.choices[0].delta.content):
+                yield delta
+            if usage is not None and getattr(chunk, "usage", None) is not None:
+                usage.update(usage_dict(chunk.usage))
+
+    async def embed(self, texts, model):
+        response = await self.client.embeddings.create(input=texts, model=model)
+        vectors = [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+        return vectors, response.usage.total_tokens
+
+
+class LiteLLMBackend(LLMBackend):
+    """Any provider litellm supports, the model name selects it (e.g. "ollama/llama3")"""
+
+    def __init__(self) -> None:
+        try:
+            import litellm
+        except ImportError as e:
+            raise ImportError("LiteLLMBackend needs the litellm package") from e
+        self.litellm = litellm
+
+    async def complete(self, messages, model, temperature, response_format=None) -> Completion:
+        extra = {"response_format": response_format} if response_format else {}
+        response = await self.litellm.acompletion(
+            model=model, messages=messages, temperature=temperature, **extra
+        )
+        return Completion(
+            response.choices[0].message.content,
+            usage_dict(getattr(response, "usage", None)),
+        )
+
+    async def stream(
+        self, messages, model, temperature, usage=None, response_format=None
+    ) -> AsyncIterator[str]:
+        extra = {"response_format": response_format} if response_format else {}
+        response = await self.litellm.acompletion(
+            model=model, messages=messages, temperature=temperature, stream=True, **extra
+        )
+        async for chunk in response:
+            if chunk.choices and (delta := chunk.choices[0].delta.content):
+                yield delta
+            if usage is not None and getattr(chunk, "usage", None) is not None:
+                usage.update(usage_dict(chunk.usage))
+
+    async def embed(self, texts, model):
+        response = await self.litellm.aembedding(model=model, input=texts)
+        usage = getattr(response, "usage", None)
+        return (
+            [item["embedding"] for item in response.data],
+            usage.total_tokens if usage is not None else None,
+        )
+
+
+# a well-formed agent reply, for running steps end to end
+DEFAULT_REPLY = json.dumps(
+    {
+        "thoughts": {
+            "text": "Checking the workspace before finishing.",
+            "reasoning": "Nothing else is needed.",
+            "plan": "- list files\n- finish",
+            "criticism": "",
+            "speak": "Listing the workspace and finishing.",
+        },
+        "abilities": [
+            {"name": "list_files", "args": {"path": "."}},
+            {"name": "finish", "args": {"reason": "Done"}},
+        ],
+    }
+)
+
+
+def fake_embedding(text: str, size: int = 1536) -> List[float]:
+    """Deterministic unit vector per text"""
+    seed = hashlib.sha256(text.encode()).digest()
+    values = [
+        seed[i % len(seed)] / 255.0 - 0.5 + ((i * 7919) % 13) / 130.0
+        for i in range(size)
+    ]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic offline backend. Replies come from a recording (JSON lines
+    of {"key", "response"} as written by RecordingBackend, keyed on the
+    normalized messages); a request that wasn't recorded gets default.
+    latency is waited before the first chunk and token_delay between
+    chunks of chunk_chars characters. Embeddings are derived from the text.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        latency: float = 0.0,
+        token_delay: float = 0.0,
+        chunk_chars: int = 4,
+        default: str = DEFAULT_REPLY,
+        embedding_size: int = 1536,
+    ) -> None:
+        self.latency = latency
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        self.default = default
+        self.embedding_size = embedding_size
+        self.recorded: Dict[str, str] = {}
+        self.replayed = 0
+        self.missed = 0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        self.recorded[item["key"]] = item["response"]
+
+    @staticmethod
+    def _usage(messages: List[Dict[str, Any]], content: str) -> Dict[str, int]:
+        prompt = sum(len(str(m.get("content", ""))) // 4 + 3 for m in messages)
+        completion = len(content) // 4 + 1
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+            "cached_tokens": 0,
+        }
+
+    def reply(self, messages: List[Dict[str, Any]]) -> str:
+        key = ResponseCache.key(messages, None, None)
+        if key in self.recorded:
+            self.replayed += 1
+            return self.recorded[key]
+        self.missed += 1
+        return self.default
+
+    async def complete(self, messages, model, temperature, response_format=None) -> Completion:
+        content = self.reply(messages)
+        chunks = -(-len(content) // self.chunk_chars)
+        await asyncio.sleep(self.latency + self.token_delay * chunks)
+        return Completion(content, self._usage(messages, content))
+
+    async def stream(
+        self, messages, model, temperature, usage=None, response_format=None
+    ) -> AsyncIterator[str]:
+        content = self.reply(messages)
+        await asyncio.sleep(self.latency)
+        for start in range(0, len(content), self.chunk_chars):
+            yield content[start : start + self.chunk_chars]
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        if usage is not None:
+            usage.update(self._usage(messages, content))
+
+    async def embed(self, texts, model):
+        vectors = [fake_embedding(text, self.embedding_size) for text in texts]
+        return vectors, sum(len(text) // 4 + 1 for text in texts)
+
+
+class RecordingBackend(LLMBackend):
+    """Passes calls to backend and appends every reply to path, for StubBackend replays"""
+
+    def __init__(self, backend: LLMBackend, path: str) -> None:
+        self.backend = backend
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, messages: List[Dict[str, Any]], response: str) -> None:
+        line = json.dumps({"key": ResponseCache.key(messages, None, None), "response": response})
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    async def complete(self, messages, model, temperature, response_format=None) -> Completion:
+        completion = await self.backend.complete(messages, model, temperature, response_format)
+        self._record(messages, completion.content)
+        return completion
+
+    async def stream(
+        self, messages, model, temperature, usage=None, response_format=None
+    ) -> AsyncIterator[str]:
+        deltas = []
+        async for delta in self.backend.stream(
+            messages, model, temperature, usage, response_format
+        ):
+            deltas.append(delta)
+            yield delta
+        self._record(messages, "".join(deltas))
+
+    async def embed(self, texts, model):
+        return await self.backend.embed(texts, model)
+
+
+class BackendRegistry:
+    """
+    Maps a model name to the backend serving it. routes rewrites a model
+    name first (e.g. {"gpt-3.5-turbo": "stub/gpt-3.5-turbo"}); a name
+    starting with a registered backend name and "/" goes to that backend
+    with the prefix removed, any other name to the default backend.
+    """
+
+    def __init__(self, default: str = "openai", routes: Optional[Dict[str, str]] = None) -> None:
+        self.default = default
+        self.routes = routes or {}
+        self.backends: Dict[str, LLMBackend] = {}
+        self.calls: Dict[str, int] = {}
+
+    def register(self, name: str, backend: LLMBackend) -> None:
+        self.backends[name] = backend
+
+    def resolve(self, model: str) -> Tuple[LLMBackend, str]:
+        model = self.routes.get(model, model) or ""
+        prefix, _, rest = model.partition("/")
+        if rest and prefix in self.backends:
+            name, model = prefix, rest
+        else:
+            name = self.default
+        self.calls[name] = self.calls.get(name, 0) + 1
+        return self.backends[name], model
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"calls": dict(self.calls)}
+        for name, backend in self.backends.items():
+            if isinstance(backend, StubBackend):
+                stats[name] = {"replayed": backend.replayed, "missed": backend.missed}
+        return stats
+
+
+def parse_routes(spec: Optional[str]) -> Dict[str, str]:
+    """"model=backend/model,..." as set in LLM_ROUTES"""
+    routes = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            model, target = item.split("=", 1)
+            routes[model.strip()] = target.strip()
+    return routes
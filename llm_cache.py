@@ -0,0 +1,197 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from db_cache import CacheBackend, LocalCacheBackend
+from agent_log import AgentLogger
+
+LOG = AgentLogger(__name__)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    CacheBackend in a local SQLite file, kept across restarts and shared by
+    the processes of one host. Past max_items the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, path: str = "llm_cache.db", max_items: int = 10000) -> None:
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_used_at ON cache (used_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET used_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.max_items:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY used_at LIMIT ?)",
+                    (count - self.max_items,),
+                )
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """role, name and content, the parts that reach the model"""
+    normalized = []
+    for message in messages:
+        # content is kept byte for byte, whitespace can change the reply
+        item = {"role": message.get("role", ""), "content": str(message.get("content", ""))}
+        if message.get("name"):
+            item["name"] = message["name"]
+        normalized.append(item)
+    return normalized
+
+
+class ResponseCache:
+    """
+    Completion cache in front of the LLM API. The exact tier is keyed on a
+    hash of the normalized messages, model and temperature. With embed and
+    a similarity threshold set, a miss also looks for a cached prompt of the
+    same model and temperature whose embedding is at least that similar.
+    Prompt embeddings are held in memory only, for the last semantic_items
+    entries.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl: float = 86400.0,
+        embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+        similarity: float = 0.0,
+        semantic_items: int = 1000,
+    ) -> None:
+        self.backend = backend or LocalCacheBackend()
+        self.ttl = ttl
+        self.embed = embed if similarity > 0 else None
+        self.similarity = similarity
+        self.semantic_items = semantic_items
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._vectors: "OrderedDict[str, Tuple[str, np.ndarray]]" = OrderedDict()
+        # embeddings computed by a missed get, reused by the set that follows
+        self._pending: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    @staticmethod
+    def key(messages: List[Dict[str, Any]], model: Optional[str], temperature: Any) -> str:
+        payload = json.dumps(
+            [normalize_messages(messages), model, temperature],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return "llm:" + hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _scope(model: Optional[str], temperature: Any) -> str:
+        return f"{model}:{temperature}"
+
+    async def _vector(self, messages: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        text = "\n".join(f"{m['role']}: {m['content']}" for m in normalize_messages(messages))
+        try:
+            vector = np.asarray(await self.embed(text), dtype=np.float32)
+        except Exception as e:
+            LOG.warning(f"Prompt embedding for the response cache failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    async def get(
+        self, messages: List[Dict[str, Any]], model: Optional[str], temperature: Any
+    ) -> Optional[str]:
+        key = self.key(messages, model, temperature)
+        if (value := self.backend.get(key)) is not None:
+            self.hits += 1
+            return value
+        if self.embed is not None and (vector := await self._vector(messages)) is not None:
+            self._pending[key] = vector
+            while len(self._pending) > 64:
+                self._pending.popitem(last=False)
+            scope = self._scope(model, temperature)
+            candidates = [
+                (other_key, other)
+                for other_key, (other_scope, other) in self._vectors.items()
+                if other_scope == scope
+            ]
+            if candidates:
+                scores = np.stack([other for _, other in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    match_key = candidates[best][0]
+                    if (value := self.backend.get(match_key)) is not None:
+                        self._vectors.move_to_end(match_key)
+                        self.semantic_hits += 1
+                        return value
+                    # expired or evicted from the backend
+                    del self._vectors[match_key]
+        self.misses += 1
+        return None
+
+    async def set(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str],
+        temperature: Any,
+        response: str,
+    ) -> None:
+        key = self.key(messages, model, temperature)
+        self.backend.set(key, response, self.ttl)
+        if self.embed is None:
+            return
+        vector = self._pending.pop(key, None)
+        if vector is None:
+            vector = await self._vector(messages)
+        if vector is not None:
+            self._vectors[key] = (self._scope(model, temperature), vector)
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.semantic_items:
+                self._vectors.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+import numpy as np
+
+
+def content_key(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Vectors by content hash. With a path the vectors live in a float32
+    memory map (<path>.f32) and the hashes, one per row after a first line
+    holding the dimension, in <path>.keys. Rows are only appended, vectors
+    before their keys, so a crash can't leave a key pointing at an unwritten
+    row. One process writes a store; without a path it is kept in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, grow_rows: int = 1024) -> None:
+        self.path = path
+        self.grow_rows = grow_rows
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self._index: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self._vectors: Optional[np.ndarray] = None
+        if path and os.path.exists(f"{path}.keys"):
+            self._load()
+
+    def _load(self) -> None:
+        with open(f"{self.path}.keys") as f:
+            lines = f.read().splitlines()
+        if not lines or not os.path.exists(f"{self.path}.f32"):
+            return
+        self.dim = int(lines[0])
+        capacity = os.path.getsize(f"{self.path}.f32") // (self.dim * 4)
+        keys = lines[1 : capacity + 1]
+        self._vectors = np.memmap(
+            f"{self.path}.f32", dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+        self._index = {key: row for row, key in enumerate(keys)}
+        self._keys = keys
+        self.rows = len(keys)
+
+    def _reserve(self, count: int) -> None:
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if self.rows + count <= capacity:
+            return
+        capacity = max(capacity * 2, self.rows + count, self.grow_rows)
+        if self.path is None:
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            if self._vectors is not None:
+                vectors[: self.rows] = self._vectors[: self.rows]
+            self._vectors = vectors
+            return
+        if self._vectors is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(f"{self.path}.keys", "w") as f:
+                f.write(f"{self.dim}\n")
+        else:
+            self._vectors.flush()
+            self._vectors = None
+        with open(f"{self.path}.f32", "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(
+            f"{self.path}.f32", dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        return {
+            key: np.array(self._vectors[row])
+            for key in keys
+            if (row := self._index.get(key)) is not None
+        }
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> None:
+        fresh = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._index]
+        if not fresh:
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._reserve(len(fresh))
+        start = self.rows
+        for offset, (_, vector) in enumerate(fresh):
+            self._vectors[start + offset] = vector
+        if self.path is not None:
+            self._vectors.flush()
+            with open(f"{self.path}.keys", "a") as f:
+                f.write("".join(f"{key}\n" for key, _ in fresh))
+        for offset, (key, _) in enumerate(fresh):
+            self._index[key] = start + offset
+            self._keys.append(key)
+        self.rows += len(fresh)
+
+    def keys(self) -> List[str]:
+        """Keys in row order"""
+        return self._keys
+
+    def matrix(self) -> np.ndarray:
+        """All stored vectors, one row per key; a view, not a copy"""
+        if self._vectors is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._vectors[: self.rows]
+
+    def __len__(self) -> int:
+        return self.rows
+
+
+class Embedder:
+    """
+    Embeds lists of any size. Texts already in the store are not sent
+    again, the rest are de-duplicated and split into batches of at most
+    batch_size texts and batch_tokens tokens that run concurrently.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        store: Optional[EmbeddingStore] = None,
+        count_tokens: Callable[[str], int] = lambda text: len(text) // 4 + 1,
+        batch_size: int = 256,
+        batch_tokens: int = 50000,
+        concurrency: int = 4,
+    ) -> None:
+        self.embed_batch = embed_batch
+        self.store = store if store is not None else EmbeddingStore()
+        self.count_tokens = count_tokens
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.concurrency = concurrency
+        self.texts = 0
+        self.cache_hits = 0
+        self.batches = 0
+
+    def split(self, texts: List[str]) -> List[List[str]]:
+        batches: List[List[str]] = []
+        batch: List[str] = []
+        tokens = 0
+        for text in texts:
+            size = self.count_tokens(text)
+            if batch and (len(batch) >= self.batch_size or tokens + size > self.batch_tokens):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(text)
+            tokens += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """float32 array with one row per text, in order"""
+        keys = [content_key(text) for text in texts]
+        found = self.store.get_many(keys)
+        self.texts += len(texts)
+        self.cache_hits += sum(1 for key in keys if key in found)
+        missing = list({key: text for key, text in zip(keys, texts) if key not in found}.items())
+        if missing:
+            limit = asyncio.Semaphore(self.concurrency)
+
+            async def run(batch: List[str]) -> np.ndarray:
+                async with limit:
+                    return np.asarray(await self.embed_batch(batch), dtype=np.float32)
+
+            batches = self.split([text for _, text in missing])
+            self.batches += len(batches)
+            vectors = np.concatenate(await asyncio.gather(*(run(batch) for batch in batches)))
+            missing_keys = [key for key, _ in missing]
+            self.store.put_many(missing_keys, vectors)
+            found.update(zip(missing_keys, vectors))
+        if not texts:
+            return np.zeros((0, self.store.dim or 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "texts": self.texts,
+            "cache_hits": self.cache_hits,
+            "hit_rate": self.cache_hits / self.texts if self.texts else 0.0,
+            "batches": self.batches,
+            "stored": len(self.store),
+        }
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from agent_log import AgentLogger
+
+LOG = AgentLogger(__name__)
+
+
+class LatencyHistogram:
+    """Latencies of the last max_samples successful calls"""
+
+    def __init__(self, max_samples: int = 500) -> None:
+        self.samples: deque = deque(maxlen=max_samples)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": len(self.samples),
+            **{
+                f"p{p}_ms": round(self.percentile(p) * 1000, 1) if self.samples else 0.0
+                for p in (50, 95, 99)
+            },
+        }
+
+
+class Hedger:
+    """
+    Deadline and hedging around one LLM call. A call is given up after
+    deadline seconds, counted by within() from where the caller starts it,
+    so time queued for a limiter slot is not charged. When hedging is on and
+    the model has min_samples recorded latencies, a call still running after
+    its percentile latency is duplicated; the first successful reply wins
+    and the other is cancelled. A streamed call commits earlier: the first
+    attempt to call its claim() (on its first token) wins and the others are
+    cancelled right then, so only time to first token is hedged. allow is
+    asked before each duplicate, so hedges aren't sent into a saturated
+    limiter.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        min_delay: float = 0.5,
+        deadline: Optional[float] = None,
+        allow: Callable[[], bool] = lambda: True,
+    ) -> None:
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.deadline = deadline
+        self.allow = allow
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def record(self, model: Optional[str], seconds: float) -> None:
+        self.histograms.setdefault(str(model), LatencyHistogram()).record(seconds)
+
+    def delay(self, model: Optional[str]) -> Optional[float]:
+        """Seconds to wait before duplicating a call to model, None to not hedge"""
+        histogram = self.histograms.get(str(model))
+        if not self.percentile or histogram is None or len(histogram.samples) < self.min_samples:
+            return None
+        return max(histogram.percentile(self.percentile), self.min_delay)
+
+    async def within(
+        self, model: Optional[str], call: Awaitable[Any], deadline: Optional[float] = None
+    ) -> Any:
+        """call, raising TimeoutError after deadline (default self.deadline) seconds"""
+        deadline = deadline if deadline is not None else self.deadline
+        try:
+            return await asyncio.wait_for(call, deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            LOG.warning(f"LLM call to {model} passed its {deadline}s deadline")
+            raise
+
+    async def run(
+        self,
+        model: Optional[str],
+        attempt: Callable[[Callable[[], bool]], Awaitable[Any]],
+        hedge: bool = True,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """
+        The result of attempt(claim), raced against a duplicate once it is
+        slower than the latencies recorded for model. No duplicate is sent
+        when it couldn't start before deadline.
+        """
+        deadline = deadline if deadline is not None else self.deadline
+        attempts: List[asyncio.Task] = []
+        claimed = asyncio.get_running_loop().create_future()
+
+        def start() -> asyncio.Task:
+            def claim() -> bool:
+                # True for the first attempt to commit, which cancels the others
+                if claimed.done():
+                    return claimed.result() is task
+                claimed.set_result(task)
+                for other in attempts:
+                    if other is not task:
+                        other.cancel()
+                return True
+
+            task = asyncio.ensure_future(attempt(claim))
+            attempts.append(task)
+            return task
+
+        primary = start()
+        try:
+            delay = self.delay(model) if hedge else None
+            if delay is not None and (deadline is None or delay < deadline):
+                done, _ = await asyncio.wait(
+                    {primary, claimed}, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done and self.allow():
+                    self.hedged += 1
+                    start()
+            error: Optional[BaseException] = None
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        # lost the race to the first token
+                        continue
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            "latency": {model: h.summary() for model, h in self.histograms.items()},
+        }
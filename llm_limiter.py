@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from agent_log import AgentLogger
+
+LOG = AgentLogger(__name__)
+
+# lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+class TokenBucket:
+    """Budget refilled continuously at per_minute / 60 per second"""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken, a request larger than the bucket waits for a full one"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund, when negative) the gap between estimate and actual use"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class Lease:
+    """A granted request slot; set used to the real token count once known"""
+
+    def __init__(self, tokens: int) -> None:
+        self.tokens = tokens
+        self.used: Optional[int] = None
+
+
+class LLMLimiter:
+    """
+    Admission control shared by every LLM call of the process. At most
+    max_concurrency requests are in flight, and requests and estimated
+    tokens per minute are kept within their budgets (0 = no budget).
+    Waiting calls are served lowest priority value first, then in arrival
+    order, so interactive steps overtake queued background planning.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.in_flight = 0
+        self.granted = 0
+        self.rate_limited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _pump(self) -> None:
+        while self._queue:
+            _, _, tokens, waiter = self._queue[0]
+            if waiter.done():
+                # cancelled while queued
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight >= self.max_concurrency:
+                return
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            heapq.heappop(self._queue)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            self.granted += 1
+            waiter.set_result(None)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._pump()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._pump()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[Lease]:
+        """Wait for a request slot worth tokens estimated tokens"""
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), tokens, waiter))
+        queued_at = time.monotonic()
+        self._pump()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # granted in the same tick the caller was cancelled
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._pump()
+            raise
+        waited = time.monotonic() - queued_at
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        lease = Lease(tokens)
+        try:
+            yield lease
+        finally:
+            if lease.used is not None and self.tokens is not None:
+                self.tokens.adjust(lease.used - tokens)
+            self._release()
+
+    def has_capacity(self) -> bool:
+        """Whether a new request would start without queueing"""
+        return self.in_flight < self.max_concurrency and self._wait_time(0) <= 0
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request back, after the provider answered 429"""
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        LOG.warning(f"LLM rate limited, pausing requests for {seconds:.1f}s")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued": sum(1 for *_, waiter in self._queue if not waiter.done()),
+            "in_flight": self.in_flight,
+            "granted": self.granted,
+            "rate_limited": self.rate_limited,
+            "wait_ms_avg": round(self.wait_total / self.granted * 1000, 1) if self.granted else 0.0,
+            "wait_ms_max": round(self.wait_max * 1000, 1),
+        }
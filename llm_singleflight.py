@@ -0,0 +1,77 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.deltas: List[str] = []
+        self.listeners: List[Callable[[str], None]] = []
+
+    def on_token(self, delta: str) -> None:
+        self.deltas.append(delta)
+        for listener in list(self.listeners):
+            listener(delta)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one. The first caller
+    starts the call as its own task; later callers wait on that task and
+    get its result or exception. Streamed deltas go to every waiter, one
+    joining late first gets the text so far as a single delta. A cancelled
+    waiter only stops waiting; the call is cancelled once nobody waits.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: Dict[str, _Flight] = {}
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(
+        self,
+        key: str,
+        call: Callable[[Optional[Callable[[str], None]]], Awaitable[Any]],
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Any:
+        """
+        call gets the token callback of the flight when on_token is given,
+        callers that stream and callers that don't must use different keys
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(
+                call(flight.on_token if on_token is not None else None)
+            )
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+            if on_token is not None and flight.deltas:
+                on_token("".join(flight.deltas))
+        if on_token is not None:
+            flight.listeners.append(on_token)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if on_token is not None:
+                flight.listeners.remove(on_token)
+            if not flight.waiters and not flight.task.done():
+                # a new caller must not join a call that is being cancelled
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+        }
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from agent_log import AgentLogger
+from llm_embeddings import EmbeddingStore
+from llm_hedge import LatencyHistogram
+
+LOG = AgentLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+
+def hash_embedding(texts: List[str], size: int = 512) -> np.ndarray:
+    """
+    Offline vectors for texts: every word is hashed to a signed column
+    (the hashing trick), rows are L2 normalized. Texts sharing words get
+    a high cosine similarity, no model or network call is needed.
+    """
+    vectors = np.zeros((len(texts), size), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            column = int.from_bytes(digest[:4], "little") % size
+            vectors[row, column] += 1.0 if digest[4] & 1 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class IVFIndex:
+    """
+    Inverted file index over unit vectors: rows are grouped by their
+    nearest of n_lists spherical k-means centroids and a query scans only
+    the rows of its n_probe nearest groups.
+    """
+
+    def __init__(
+        self, vectors: np.ndarray, n_lists: int, n_probe: int, iterations: int = 8
+    ) -> None:
+        self.size = len(vectors)
+        self.n_probe = n_probe
+        rng = np.random.default_rng(0)
+        n_lists = max(1, min(n_lists, self.size))
+        centroids = np.array(vectors[rng.choice(self.size, n_lists, replace=False)])
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for group in range(n_lists):
+                members = vectors[assign == group]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    if norm:
+                        centroids[group] = centroid / norm
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assign == group) for group in range(n_lists)]
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        """Rows worth scoring for query"""
+        probe = np.argsort(-(self.centroids @ query))[: self.n_probe]
+        return np.concatenate([self.lists[group] for group in probe])
+
+
+class _Partition:
+    """The objects of one data class and task, their vectors in an EmbeddingStore keyed by id"""
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        # most partitions stay small, the store starts with room for a few rows
+        self.vectors = EmbeddingStore(path, grow_rows=16)
+        self.objects: Dict[str, dict] = {}
+        self.index: Optional[IVFIndex] = None
+        # the index being rebuilt on the memstore's build thread
+        self.building: Optional[Future] = None
+        if path and os.path.exists(f"{path}.jsonl"):
+            with open(f"{path}.jsonl") as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        self.objects[item["id"]] = item["obj"]
+
+    def add(self, uid: str, data_obj: dict, vector: np.ndarray) -> None:
+        # the object is written first, a row without one is never searched
+        if self.path is not None:
+            with open(f"{self.path}.jsonl", "a") as f:
+                f.write(json.dumps({"id": uid, "obj": data_obj}, ensure_ascii=False) + "\n")
+        self.objects[uid] = data_obj
+        self.vectors.put_many([uid], vector[np.newaxis, :])
+
+
+class LocalMemstore:
+    """
+    In-process replacement for WeaviateMemstore (VECTOR_DB=local). Objects
+    are partitioned by data class and task_id; each partition keeps its
+    vectors in a memory-mapped file under path (in memory without a path)
+    and is searched by brute-force cosine similarity. Partitions holding at
+    least ivf_threshold objects get an IVFIndex, rebuilt once they have
+    doubled. Builds run on a background thread, queries don't wait for
+    them: until the new index is ready the old one (or a full scan) is used,
+    and rows added since the build are always scanned. embed turns texts
+    into vectors, hash_embedding by default.
+    """
+
+    def __init__(
+        self,
+        data_classes: list = None,
+        path: Optional[str] = None,
+        embed: Callable[[List[str]], np.ndarray] = hash_embedding,
+        ivf_threshold: int = 10000,
+        n_probe: int = 16,
+        limit: int = 10,
+    ) -> None:
+        self.data_class_names = ["ability", "chat", "file", "website", *(data_classes or [])]
+        self.path = path
+        self.embed = embed
+        self.ivf_threshold = ivf_threshold
+        self.n_probe = n_probe
+        self.limit = limit
+        self.partitions: Dict[tuple, _Partition] = {}
+        self.index_builds = 0
+        self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memstore-ivf")
+        self.insert_latency = LatencyHistogram()
+        self.query_latency = LatencyHistogram()
+
+    def _partition(self, data_class: str, task_id: str) -> _Partition:
+        key = (data_class, task_id)
+        if key not in self.partitions:
+            path = None
+            if self.path:
+                folder = os.path.join(self.path, data_class)
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, re.sub(r"[^\w.-]", "_", task_id or "_"))
+            self.partitions[key] = _Partition(path)
+        return self.partitions[key]
+
+    @staticmethod
+    def _text(data_obj: dict) -> str:
+        # what text2vec would vectorize: the text properties but the task id
+        return "\n".join(
+            str(value) for name, value in data_obj.items()
+            if name != "task_id" and isinstance(value, str)
+        )
+
+    def _check_class(self, data_class: str) -> None:
+        if data_class not in self.data_class_names:
+            LOG.error(f"Data class {data_class} not found")
+            raise AttributeError(f"Data class {data_class} not found")
+
+    def _refresh_index(self, partition: _Partition, matrix: np.ndarray) -> None:
+        """Swap in a finished build, start one when the index is missing or outgrown"""
+        if partition.building is not None:
+            if not partition.building.done():
+                return
+            try:
+                partition.index = partition.building.result()
+            except Exception as err:
+                LOG.error(f"IVF index build failed: {err}")
+            partition.building = None
+        rows = len(matrix)
+        if self.ivf_threshold and rows >= self.ivf_threshold and (
+            partition.index is None or rows >= 2 * partition.index.size
+        ):
+            # rows are only appended, the view stays valid while the store grows
+            self.index_builds += 1
+            partition.building = self._builder.submit(
+                lambda: IVFIndex(np.array(matrix), int(np.sqrt(rows)), self.n_probe)
+            )
+
+    def wait_for_indexes(self) -> None:
+        """Block until the index builds under way have finished and are in use"""
+        for partition in list(self.partitions.values()):
+            while partition.building is not None:
+                partition.building.exception()
+                self._refresh_index(partition, partition.vectors.matrix())
+
+    def _search(
+        self,
+        partition: _Partition,
+        query: np.ndarray,
+        limit: Optional[int] = None,
+        where: Optional[Callable[[dict], bool]] = None,
+    ) -> list:
+        rows = partition.vectors.rows
+        if not rows:
+            return []
+        matrix = partition.vectors.matrix()
+        self._refresh_index(partition, matrix)
+        if partition.index is not None and where is None:
+            candidates = np.concatenate(
+                [partition.index.candidates(query), np.arange(partition.index.size, rows)]
+            )
+        else:
+            candidates = np.arange(rows)
+        keys = partition.vectors.keys()
+        if where is not None:
+            candidates = np.array(
+                [row for row in candidates if where(partition.objects[keys[row]])], dtype=np.int64
+            )
+        if not len(candidates):
+            return []
+        if len(candidates) == rows:
+            # everything is scored (probes may cover every list, in any
+            # order), skip copying the rows out
+            candidates = np.arange(rows)
+            scores = matrix @ query
+        else:
+            scores = matrix[candidates] @ query
+        limit = min(limit or self.limit, len(candidates))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [dict(partition.objects[keys[candidates[i]]]) for i in best]
+
+    def add_data_obj(self, data_class: str, data_obj: dict) -> str:
+        """
+        Add data obj to the store of its class and task
+        """
+        self._check_class(data_class)
+        started = time.monotonic()
+        uid = str(uuid.uuid4())
+        [vector] = np.asarray(self.embed([self._text(data_obj)]), dtype=np.float32)
+        self._partition(data_class, data_obj.get("task_id", "")).add(uid, data_obj, vector)
+        self.insert_latency.record(time.monotonic() - started)
+        return uid
+
+    def get_data_obj(self, task_id: str, data_class: str, query: str) -> list:
+        self._check_class(data_class)
+        started = time.monotonic()
+        [vector] = np.asarray(self.embed([query]), dtype=np.float32)
+        found = self._search(self._partition(data_class, task_id), vector)
+        self.query_latency.record(time.monotonic() - started)
+        return found
+
+    def get_obj_by_id(self, task_id: str, data_class: str, uid: str) -> list:
+        self._check_class(data_class)
+        started = time.monotonic()
+        partition = self._partition(data_class, task_id)
+        found = partition.vectors.get_many([uid])
+        if uid not in found:
+            return []
+        found = self._search(partition, found[uid])
+        self.query_latency.record(time.monotonic() - started)
+        return found
+
+    def ask_data_obj(
+        self,
+        task_id: str,
+        data_class: str,
+        question: str,
+        with_path: str = None,
+        with_value: Any = None,
+        uid: str = None
+    ) -> str:
+        """
+        The content of the object closest to question; there is no QnA
+        model, the best match stands in for the answer
+        """
+        self._check_class(data_class)
+        partition = self._partition(data_class, task_id)
+        if uid:
+            found = partition.vectors.get_many([uid])
+            best = self._search(partition, found[uid], 1) if uid in found else []
+        else:
+            [vector] = np.asarray(self.embed([question]), dtype=np.float32)
+            where = None
+            if with_path and with_value:
+                where = lambda obj: obj.get(with_path) == with_value
+            best = self._search(partition, vector, 1, where)
+        if best and best[0].get("content"):
+            return str(best[0]["content"])
+        return "No answer found"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "partitions": len(self.partitions),
+            "objects": sum(len(p.objects) for p in self.partitions.values()),
+            "indexed_partitions": sum(p.index is not None for p in self.partitions.values()),
+            "index_builds": self.index_builds,
+            "insert": self.insert_latency.summary(),
+            "query": self.query_latency.summary(),
+        }
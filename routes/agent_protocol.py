@@ -1,13 +1,17 @@
 import json
 from typing import Optional
-from fastapi import APIRouter, Query, Request, Response, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Header, Query, Request, Response, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
 from errors import *
 import sys
 sys.path.append("..")
 from schema import *
+from agent_log import AgentLogger
+LOG = AgentLogger(__name__)
 base_router = APIRouter()
 
+COUNT_PATTERN = "^(exact|estimated|none)$"
+
 
 @base_router.get("/", tags=["root"])
 async def root():
@@ -25,8 +29,25 @@ async def check_server_status():
     return Response(content="Server is running.", status_code=200)
 
 
+@base_router.get("/metrics", tags=["server"])
+async def get_metrics(request: Request):
+    """
+    Cache, queue and latency counters of the running agent.
+    """
+    agent = request["agent"]
+    return Response(
+        content=json.dumps(agent.get_metrics()),
+        status_code=200,
+        media_type="application/json",
+    )
+
+
 @base_router.post("/agent/tasks", tags=["agent"], response_model=Task)
-async def create_agent_task(request: Request, task_request: TaskRequestBody) -> Task:
+async def create_agent_task(
+    request: Request,
+    task_request: TaskRequestBody,
+    background: Optional[bool] = Query(False),
+) -> Task:
 
     agent = request["agent"]
     print("request >",request)
@@ -35,10 +56,11 @@ async def create_agent_task(request: Request, task_request: TaskRequestBody) ->
 
 
     try:
-        task_request = await agent.create_task(task_request)
+        task_request = await agent.create_task(task_request, background=background)
         return Response(
             content=task_request.json(),
-            status_code=200,
+            # still being set up, poll the task until ready is true
+            status_code=200 if task_request.ready else 202,
             media_type="application/json",
         )
     except Exception:
@@ -54,16 +76,27 @@ async def list_agent_tasks(
     request: Request,
     page: Optional[int] = Query(1, ge=1),
     page_size: Optional[int] = Query(10, ge=1),
+    include_artifacts: Optional[bool] = Query(True),
+    cursor: Optional[str] = Query(None),
+    count: Optional[str] = Query(None, pattern=COUNT_PATTERN),
 ) -> TaskListResponse:
 
     agent = request["agent"]
     try:
-        tasks = await agent.list_tasks(page, page_size)
+        tasks = await agent.list_tasks(
+            page, page_size, include_artifacts, cursor=cursor, count=count
+        )
         return Response(
             content=tasks.json(),
             status_code=200,
             media_type="application/json",
         )
+    except ValueError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=400,
+            media_type="application/json",
+        )
     except NotFoundError:
         LOG.exception("Error whilst trying to list tasks")
         return Response(
@@ -81,11 +114,13 @@ async def list_agent_tasks(
 
 
 @base_router.get("/agent/tasks/{task_id}", tags=["agent"], response_model=Task)
-async def get_agent_task(request: Request, task_id: str) -> Task:
+async def get_agent_task(
+    request: Request, task_id: str, include_archived: Optional[bool] = Query(False)
+) -> Task:
 
     agent = request["agent"]
     try:
-        task = await agent.get_task(task_id)
+        task = await agent.get_task(task_id, include_archived=include_archived)
         return Response(
             content=task.json(),
             status_code=200,
@@ -115,16 +150,34 @@ async def list_agent_task_steps(
     task_id: str,
     page: Optional[int] = Query(1, ge=1),
     page_size: Optional[int] = Query(10, ge=1, alias="pageSize"),
+    include_artifacts: Optional[bool] = Query(True),
+    cursor: Optional[str] = Query(None),
+    count: Optional[str] = Query(None, pattern=COUNT_PATTERN),
+    include_archived: Optional[bool] = Query(False),
 ) -> TaskStepsListResponse:
 
     agent = request["agent"]
     try:
-        steps = await agent.list_steps(task_id, page, page_size)
+        steps = await agent.list_steps(
+            task_id,
+            page,
+            page_size,
+            include_artifacts,
+            cursor=cursor,
+            count=count,
+            include_archived=include_archived,
+        )
         return Response(
             content=steps.json(),
             status_code=200,
             media_type="application/json",
         )
+    except ValueError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=400,
+            media_type="application/json",
+        )
     except NotFoundError:
         LOG.exception("Error whilst trying to list steps")
         return Response(
@@ -143,7 +196,10 @@ async def list_agent_task_steps(
 
 @base_router.post("/agent/tasks/{task_id}/steps", tags=["agent"], response_model=Step)
 async def execute_agent_task_step(
-    request: Request, task_id: str, step: Optional[StepRequestBody] = None
+    request: Request,
+    task_id: str,
+    step: Optional[StepRequestBody] = None,
+    background: Optional[bool] = Query(False),
 ) -> Step:
 
 
@@ -153,12 +209,27 @@ async def execute_agent_task_step(
         # An empty step request represents a yes to continue command
         if not step:
             step = StepRequestBody(input="y")
-        step = await agent.execute_step(task_id, step)
+        if background:
+            # queued, poll the step or long-poll its /wait endpoint
+            step = await agent.submit_step(task_id, step)
+            return Response(
+                content=step.json(),
+                status_code=202,
+                media_type="application/json",
+            )
+        step = await agent.run_step(task_id, step)
         return Response(
             content=step.json(),
             status_code=200,
             media_type="application/json",
         )
+    except QueueFullError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=429,
+            headers={"Retry-After": "1"},
+            media_type="application/json",
+        )
     except NotFoundError:
         print(f"Error whilst trying to execute a task step: {task_id}")
         return Response(
@@ -198,6 +269,66 @@ async def get_agent_task_step(request: Request, task_id: str, step_id: str) -> S
         )
 
 
+@base_router.get("/agent/tasks/{task_id}/events", tags=["agent"])
+async def stream_agent_task_events(
+    request: Request,
+    task_id: str,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+) -> StreamingResponse:
+
+    agent = request["agent"]
+    try:
+        if await agent.get_task(task_id) is None:
+            raise NotFoundError
+    except NotFoundError:
+        return Response(
+            content=json.dumps({"error": f"Task not found {task_id}"}),
+            status_code=404,
+            media_type="application/json",
+        )
+    return StreamingResponse(
+        agent.stream_events(task_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@base_router.get(
+    "/agent/tasks/{task_id}/steps/{step_id}/wait", tags=["agent"], response_model=Step
+)
+async def wait_agent_task_step(
+    request: Request,
+    task_id: str,
+    step_id: str,
+    timeout: Optional[float] = Query(30, ge=0, le=120),
+) -> Step:
+
+    agent = request["agent"]
+    try:
+        step = await agent.wait_for_step(task_id, step_id, timeout)
+        if step is None:
+            raise NotFoundError
+        return Response(
+            content=step.json(),
+            # still queued or running once the timeout ran out
+            status_code=200 if step.status == Status.completed else 202,
+            media_type="application/json",
+        )
+    except NotFoundError:
+        return Response(
+            content=json.dumps({"error": "Step not found"}),
+            status_code=404,
+            media_type="application/json",
+        )
+    except Exception:
+        LOG.exception("Error whilst waiting for a step")
+        return Response(
+            content=json.dumps({"error": "Internal server error"}),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
 @base_router.get(
     "/agent/tasks/{task_id}/artifacts",
     tags=["agent"],
@@ -208,14 +339,22 @@ async def list_agent_task_artifacts(
     task_id: str,
     page: Optional[int] = Query(1, ge=1),
     page_size: Optional[int] = Query(10, ge=1, alias="pageSize"),
+    cursor: Optional[str] = Query(None),
+    count: Optional[str] = Query(None, pattern=COUNT_PATTERN),
 ) -> TaskArtifactsListResponse:
 
     agent = request["agent"]
     try:
         artifacts: TaskArtifactsListResponse = await agent.list_artifacts(
-            task_id, page, page_size
+            task_id, page, page_size, cursor=cursor, count=count
         )
         return artifacts
+    except ValueError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=400,
+            media_type="application/json",
+        )
     except NotFoundError:
         LOG.exception("Error whilst trying to list artifacts")
         return Response(
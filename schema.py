@@ -2,8 +2,8 @@
 from __future__ import annotations
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class ArtifactUpload(BaseModel):
@@ -16,10 +16,29 @@ class ArtifactUpload(BaseModel):
 
 
 class Pagination(BaseModel):
-    total_items: int = Field(..., description="Total number of items.", example=42)
-    total_pages: int = Field(..., description="Total number of pages.", example=97)
-    current_page: int = Field(..., description="Current_page page number.", example=1)
+    total_items: Optional[int] = Field(
+        None,
+        description="Total number of items. Only set when a count was requested.",
+        example=42,
+    )
+    total_truncated: Optional[bool] = Field(
+        None,
+        description="Set when an estimated count stopped at its cap: total_items is "
+        "then a lower bound and total_pages is null.",
+        example=None,
+    )
+    total_pages: Optional[int] = Field(
+        None, description="Total number of pages.", example=97
+    )
+    current_page: Optional[int] = Field(
+        None, description="Current_page page number.", example=1
+    )
     page_size: int = Field(..., description="Number of items per page.", example=25)
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Cursor for the next page, null on the last page.",
+        example="WyIyMDIzLTAxLTAxVDAwOjAwOjAwIiwgImFiYyJd",
+    )
 
 
 class Artifact(BaseModel):
@@ -97,6 +116,11 @@ class Task(TaskRequestBody):
             "ab7b4091-2560-4692-a4fe-d831ea3ca7d6",
         ],
     )
+    ready: Optional[bool] = Field(
+        True,
+        description="Whether the task is set up and its first step can run.",
+        example=True,
+    )
 
 
 class StepRequestBody(BaseModel):
@@ -173,3 +197,48 @@ class TaskStepsListResponse(BaseModel):
 class TaskArtifactsListResponse(BaseModel):
     artifacts: Optional[List[Artifact]] = None
     pagination: Optional[Pagination] = None
+
+
+class Thoughts(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    analysis: Optional[str] = Field(
+        None, description="Analysis of the current state of the task."
+    )
+    reasoning: Optional[str] = Field(
+        None, description="Reasoning behind the thoughts."
+    )
+    speak: Optional[str] = Field(
+        None, description="Summary of the thoughts to say to the user."
+    )
+
+
+class AbilityCall(BaseModel):
+    name: Optional[str] = Field(
+        ..., description="Name of the ability to use.", example="read_file"
+    )
+    args: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Arguments of the ability.",
+        example={"file_path": "main.py"},
+    )
+
+
+class StepReply(BaseModel):
+    """The JSON reply the LLM gives for a step (prompts/*/system-reformat.j2)"""
+
+    model_config = ConfigDict(extra="allow")
+
+    thoughts: Thoughts
+    ability: Optional[AbilityCall] = Field(
+        None, description="The ability to run."
+    )
+    abilities: Optional[List[AbilityCall]] = Field(
+        None, description="Abilities to run, in order."
+    )
+
+    @model_validator(mode="after")
+    def has_ability(self) -> "StepReply":
+        if self.ability is None and self.abilities is None:
+            raise ValueError("reply has neither ability nor abilities")
+        return self
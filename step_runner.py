@@ -0,0 +1,187 @@
+import asyncio
+import contextlib
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+from errors import QueueFullError
+from schema import Step, StepRequestBody
+from agent_log import AgentLogger
+
+LOG = AgentLogger(__name__)
+
+class StepRunner:
+    """
+    Runs accepted steps on a fixed pool of workers so the request that
+    submitted them can return right away. The queue is bounded: when it is
+    full submit raises QueueFullError instead of letting the backlog grow.
+    Steps of one task still run one at a time, in submission order: each
+    task has its own queue and only tasks with no step running are handed
+    to a worker, so one busy task never holds more than one worker.
+    """
+
+    def __init__(self, agent, workers: int = 4, max_queue: int = 100) -> None:
+        self.agent = agent
+        self.workers = workers
+        self.max_queue = max_queue
+        # accepted and not finished yet, running or waiting
+        self.outstanding = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.abandoned = 0
+        self.closed = False
+        # ids of tasks with queued steps and none running, in arrival order
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._task_queues: Dict[str, Deque[Tuple[StepRequestBody, Step]]] = {}
+        self._task_locks: Dict[str, asyncio.Lock] = {}
+        self._task_lock_users: Dict[str, int] = {}
+        # finished flags of recent steps, for long-polling clients
+        self._done: "OrderedDict[str, asyncio.Event]" = OrderedDict()
+
+    def _start(self) -> None:
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+        if not self._workers:
+            self._workers = [
+                asyncio.get_running_loop().create_task(self._work())
+                for _ in range(self.workers)
+            ]
+
+    @contextlib.asynccontextmanager
+    async def task_lock(self, task_id: str):
+        """
+        Held while a step of task_id runs, by the workers and by steps
+        executed in the request, so the two never interleave on one task.
+        """
+        lock = self._task_locks.setdefault(task_id, asyncio.Lock())
+        self._task_lock_users[task_id] = self._task_lock_users.get(task_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._task_lock_users[task_id] -= 1
+            if not self._task_lock_users[task_id]:
+                del self._task_lock_users[task_id]
+                del self._task_locks[task_id]
+
+    async def submit(self, task_id: str, step_request: StepRequestBody) -> Step:
+        if self.closed:
+            self.rejected += 1
+            raise QueueFullError("Step queue is closed, the server is shutting down")
+        self._start()
+        if self.outstanding - self.running >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Step queue is full ({self.max_queue} steps)")
+        # take the slot before the row is created so concurrent submits can't overshoot
+        self.outstanding += 1
+        try:
+            step = await self.agent.create_step(task_id, step_request)
+        except Exception:
+            self.outstanding -= 1
+            raise
+        self._done[step.step_id] = asyncio.Event()
+        while len(self._done) > self.max_queue + 1000:
+            self._done.popitem(last=False)
+        if task_id in self._task_queues:
+            # the task is queued or running already, its worker picks this up
+            self._task_queues[task_id].append((step_request, step))
+        else:
+            self._task_queues[task_id] = deque([(step_request, step)])
+            self._ready.put_nowait(task_id)
+        return step
+
+    async def wait(self, step_id: str, timeout: float) -> bool:
+        """
+        Return once the step is finished or timeout seconds have passed.
+        False if the step was not submitted here, or has been forgotten;
+        the caller has to poll its status instead.
+        """
+        if (done := self._done.get(step_id)) is None:
+            return False
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            task_id = await self._ready.get()
+            steps = self._task_queues[task_id]
+            step_request, step = steps[0]
+            # _run records its own failures, only cancellation by close gets
+            # past it and close fails this step and the ones queued behind it
+            async with self.task_lock(task_id):
+                self.running += 1
+                try:
+                    await self._run(task_id, step_request, step)
+                finally:
+                    self.running -= 1
+            steps.popleft()
+            self.outstanding -= 1
+            self.completed += 1
+            if done := self._done.get(step.step_id):
+                done.set()
+            if steps:
+                # back of the line, other tasks get their turn first
+                self._ready.put_nowait(task_id)
+            else:
+                del self._task_queues[task_id]
+
+    async def _run(self, task_id: str, step_request: StepRequestBody, step: Step) -> None:
+        try:
+            await self.agent.db.update_step(
+                task_id, step.step_id, "running", step.additional_input
+            )
+            await self.agent.execute_step(task_id, step_request, step=step)
+        except Exception as err:
+            LOG.error(f"Step {step.step_id} of task {task_id} failed: {err}")
+            await self._fail(task_id, step, str(err))
+
+    async def _fail(self, task_id: str, step: Step, error: str) -> None:
+        self.agent.events.publish(task_id, "step_failed", step_id=step.step_id, error=error)
+        try:
+            await self.agent.db.update_step(
+                task_id,
+                step.step_id,
+                "completed",
+                step.additional_input,
+                output=f"Step failed: {error}",
+            )
+        except Exception as err:
+            LOG.error(f"Could not record failure of step {step.step_id}: {err}")
+
+    async def close(self) -> None:
+        """
+        Stop the workers. Steps still queued or running are recorded as
+        failed, so clients polling them see an outcome instead of a step
+        left "created" forever.
+        """
+        self.closed = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # a running step is still the head of its task queue
+        unfinished = [
+            (task_id, step)
+            for task_id, steps in self._task_queues.items()
+            for _, step in steps
+        ]
+        for task_id, step in unfinished:
+            LOG.warning(f"Step {step.step_id} of task {task_id} abandoned on shutdown")
+            await self._fail(task_id, step, "server shut down before the step finished")
+            if done := self._done.get(step.step_id):
+                done.set()
+        self.abandoned += len(unfinished)
+        self.outstanding -= len(unfinished)
+        self._task_queues.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.outstanding - self.running,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "abandoned": self.abandoned,
+        }
@@ -0,0 +1,184 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from abilities.scheduler import AbilityPrefetch, AbilityScheduler
+from llm_backends import DEFAULT_REPLY
+from json_stream import AbilityStreamParser, parse_reply
+
+
+def ability(read_only=False, reads=None, writes=None, side_effects=False):
+    return SimpleNamespace(
+        read_only=read_only,
+        reads=reads,
+        writes=writes,
+        exclusive=side_effects or not (read_only or writes),
+    )
+
+
+class FakeRegistry:
+    """Abilities sleep for their delay argument and log when they run"""
+
+    def __init__(self) -> None:
+        self.abilities = {
+            "read_file": ability(read_only=True, reads="file_path"),
+            "list_files": ability(read_only=True, reads="path"),
+            "write_file": ability(writes="file_path"),
+            "finish": ability(side_effects=True),
+        }
+        self.log = []
+        self.running = 0
+        self.peak = 0
+
+    async def run_ability(self, task_id, name, delay=0, fail=False, **args):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.log.append(("start", name, args))
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError(f"{name} failed")
+            return f"{name} {args}"
+        finally:
+            self.running -= 1
+            self.log.append(("end", name, args))
+
+
+def call(name, **args):
+    return {"name": name, "args": args}
+
+
+def chunks(text: str, size: int = 4):
+    """The deltas fake_openai streams a reply in"""
+    return [text[start : start + size] for start in range(0, len(text), size)]
+
+
+def test_plan_splits_conflicting_calls_into_waves():
+    scheduler = AbilityScheduler(FakeRegistry())
+    calls = [
+        call("read_file", file_path="a.txt"),
+        call("read_file", file_path="b.txt"),
+        call("write_file", file_path="b.txt"),
+        call("write_file", file_path="c/d.txt"),
+        call("list_files", path="c"),
+        call("finish", reason="done"),
+        call("unknown_ability"),
+    ]
+    assert scheduler.plan(calls) == [[0, 1], [2, 3], [4], [5], [6]]
+
+
+def test_run_all_keeps_reply_order_and_bounds_concurrency():
+    async def main():
+        registry = FakeRegistry()
+        scheduler = AbilityScheduler(registry, max_concurrency=2)
+        calls = [
+            call("read_file", file_path=f"{n}.txt", delay=0.01 * (5 - n)) for n in range(5)
+        ] + [call("read_file", file_path="bad.txt", fail=True)]
+        results = await scheduler.run_all("t", calls)
+        assert [output for output, _ in results[:5]] == [
+            f"read_file {{'file_path': '{n}.txt'}}" for n in range(5)
+        ]
+        output, error = results[5]
+        assert output is None and str(error) == "read_file failed"
+        assert registry.peak == 2
+
+    asyncio.run(main())
+
+
+def test_writes_wait_for_the_reads_before_them():
+    async def main():
+        registry = FakeRegistry()
+        scheduler = AbilityScheduler(registry)
+        await scheduler.run_all(
+            "t",
+            [
+                call("read_file", file_path="a.txt", delay=0.02),
+                call("write_file", file_path="a.txt"),
+            ],
+        )
+        assert [(event, name) for event, name, _ in registry.log] == [
+            ("start", "read_file"), ("end", "read_file"),
+            ("start", "write_file"), ("end", "write_file"),
+        ]
+
+    asyncio.run(main())
+
+
+def test_stream_parser_hands_back_each_call_once_it_is_closed():
+    parser = AbilityStreamParser()
+    found = []
+    for delta in chunks(DEFAULT_REPLY):
+        found.extend((position, parsed, len(parser.text)) for position, parsed in parser.feed(delta))
+    assert [(position, parsed) for position, parsed, _ in found] == [
+        (0, call("list_files", path=".")),
+        (1, call("finish", reason="Done")),
+    ]
+    # the first call is complete well before the rest of the reply arrives
+    assert found[0][2] < DEFAULT_REPLY.index('"finish"')
+
+
+def test_stream_parser_ignores_braces_in_strings_and_nested_objects():
+    reply = json.dumps(
+        {
+            "thoughts": {"text": 'a "{quoted}" brace }', "ability": {"name": "nope"}},
+            "ability": {"name": "read_file", "args": {"file_path": "x}.txt"}},
+        }
+    )
+    parser = AbilityStreamParser()
+    found = [found for delta in reply for found in parser.feed(delta)]
+    assert found == [(0, call("read_file", file_path="x}.txt"))]
+
+
+def test_parse_reply_repairs_fenced_and_cut_off_replies():
+    assert parse_reply('{"a": 1}') == ({"a": 1}, False)
+    assert parse_reply('Sure:\n```json\n{"a": 1}\n```\nDone') == ({"a": 1}, True)
+    assert parse_reply('{"a": {"b": "cut') == ({"a": {"b": "cut"}}, True)
+
+
+def test_prefetch_starts_leading_reads_while_streaming():
+    async def main():
+        registry = FakeRegistry()
+        scheduler = AbilityScheduler(registry)
+        reply = json.dumps(
+            {
+                "thoughts": {},
+                "abilities": [
+                    call("read_file", file_path="a.txt"),
+                    call("write_file", file_path="a.txt"),
+                    call("read_file", file_path="b.txt"),
+                ],
+            }
+        )
+        prefetch = AbilityPrefetch(scheduler, "t")
+        for delta in chunks(reply):
+            prefetch.feed(delta)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        # the read after the write must see it, so it is not started early
+        assert [(event, name) for event, name, _ in registry.log] == [
+            ("start", "read_file"), ("end", "read_file")
+        ]
+        calls, _ = parse_reply(reply)
+        started = [prefetch.take(n, c) for n, c in enumerate(calls["abilities"])]
+        assert started[0] is not None and started[1:] == [None, None]
+        results = await scheduler.run_all("t", calls["abilities"], started=started)
+        assert results[0] == ("read_file {'file_path': 'a.txt'}", None)
+        # the prefetched run is reused, not repeated
+        assert sum(name == "read_file" for event, name, _ in registry.log if event == "start") == 2
+        assert scheduler.stats() == {"prefetched": 1, "prefetch_hits": 1}
+
+    asyncio.run(main())
+
+
+def test_prefetch_discards_runs_the_final_reply_changed():
+    async def main():
+        registry = FakeRegistry()
+        scheduler = AbilityScheduler(registry)
+        prefetch = AbilityPrefetch(scheduler, "t")
+        prefetch.feed(json.dumps({"abilities": [call("read_file", file_path="a.txt", delay=1)]}))
+        await asyncio.sleep(0)
+        assert prefetch.take(0, call("read_file", file_path="other.txt", delay=1)) is None
+        await prefetch.discard()
+        assert registry.running == 0
+        assert scheduler.stats() == {"prefetched": 1, "prefetch_hits": 0}
+
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import agents
+import llm
+from conversation_store import ConversationStore, MemoryConversationBackend
+from db import AgentDB
+from llm_backends import BackendRegistry, Completion, parse_routes
+from schema import TaskRequestBody
+from workspace import LocalWorkspace
+
+
+class FakeProfileGenerator:
+    def __init__(self, task, model=None, prompt_model=None) -> None:
+        self.task = task
+
+    async def role_find(self, cache: bool = True) -> str:
+        # the first task's profile arrives last
+        await asyncio.sleep(0.05 if self.task.input == "first" else 0)
+        return json.dumps({"name": f"expert for {self.task.input}", "expertise": "testing"})
+
+
+class FakePlanning:
+    def __init__(self, task_input, task_id, abilities, workspace, model=None, prompt_model=None) -> None:
+        self.task_input = task_input
+
+    async def create_steps(self) -> str:
+        await asyncio.sleep(0.05 if self.task_input == "first" else 0)
+        return f"plan for {self.task_input}"
+
+
+def test_concurrent_bootstraps_keep_their_own_profile_and_plan(tmp_path, monkeypatch):
+    monkeypatch.setattr(agents, "ProfileGenerator", FakeProfileGenerator)
+    monkeypatch.setattr(agents, "AIPlanning", FakePlanning)
+
+    async def main():
+        agent = agents.ForgeAgent(
+            AgentDB(f"sqlite:///{tmp_path}/agent.db"),
+            LocalWorkspace(str(tmp_path / "workspace")),
+            ConversationStore(MemoryConversationBackend()),
+        )
+        first, second = await asyncio.gather(
+            agent.create_task(TaskRequestBody(input="first")),
+            agent.create_task(TaskRequestBody(input="second")),
+        )
+        for task in (first, second):
+            instructions = "\n".join(
+                m["content"] for m in await agent.conversations.instructions(task.task_id)
+            )
+            other = "second" if task is first else "first"
+            assert f"expert for {task.input}" in instructions
+            assert f"plan for {task.input}" in instructions
+            assert f"expert for {other}" not in instructions
+            assert f"plan for {other}" not in instructions
+
+    asyncio.run(main())
+
+
+def test_unparseable_profiles_are_retried_uncached_then_defaulted(tmp_path, monkeypatch):
+    calls = []
+
+    class ProseProfileGenerator(FakeProfileGenerator):
+        async def role_find(self, cache: bool = True) -> str:
+            calls.append(cache)
+            return "The best expert is a project manager."
+
+    monkeypatch.setattr(agents, "ProfileGenerator", ProseProfileGenerator)
+
+    async def main():
+        agent = agents.ForgeAgent(
+            AgentDB(f"sqlite:///{tmp_path}/agent.db"),
+            LocalWorkspace(str(tmp_path / "workspace")),
+            ConversationStore(MemoryConversationBackend()),
+        )
+        task = await agent.db.create_task("task")
+        assert await agent.generate_profile(task) is None
+
+    asyncio.run(main())
+    assert calls == [True] + [False] * (agents.PROFILE_ATTEMPTS - 1)
+
+
+def test_profile_and_plan_are_routed_by_their_own_model(tmp_path, monkeypatch):
+    class Recorder:
+        def __init__(self, reply: str) -> None:
+            self.reply = reply
+            self.models = []
+
+        async def complete(self, messages, model, temperature, response_format=None):
+            self.models.append(model)
+            return Completion(self.reply, {"total_tokens": 1})
+
+    small = Recorder(json.dumps({"name": "Ada", "expertise": "testing"}))
+    large = Recorder("1. do it")
+    registry = BackendRegistry(
+        "large", parse_routes("cheap-model=small/mini,big-model=large/max")
+    )
+    registry.register("small", small)
+    registry.register("large", large)
+    monkeypatch.setattr(llm, "backends", registry)
+    monkeypatch.setenv("OPENAI_MODEL", "gpt-4-turbo")
+    monkeypatch.setenv("PROFILE_MODEL", "cheap-model")
+    monkeypatch.setenv("PLANNING_MODEL", "big-model")
+
+    async def main():
+        agent = agents.ForgeAgent(
+            AgentDB(f"sqlite:///{tmp_path}/agent.db"),
+            LocalWorkspace(str(tmp_path / "workspace")),
+            ConversationStore(MemoryConversationBackend()),
+        )
+        task = await agent.db.create_task("task")
+        profile = await agent.generate_profile(task)
+        plan = await agent.plan_steps(task.task_id, task.input)
+        return profile, plan
+
+    profile, plan = asyncio.run(main())
+    assert profile == {"name": "Ada", "expertise": "testing"} and plan == "1. do it"
+    assert small.models == ["mini"] and large.models == ["max"]
+    # the templates are still picked by the prompt model, not the routed one
+    assert agents.ProfileGenerator(None, "cheap-model", "gpt-3.5-turbo").prompt_engine.model == "gpt-3.5-turbo"
+    assert agents.AIPlanning("t", "id", [], None, "big-model", "gpt-4").prompt_engine.model == "gpt-4"
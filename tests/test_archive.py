@@ -0,0 +1,29 @@
+import asyncio
+import datetime
+from archive import TaskArchiver
+from db import AgentDB
+from db_cache import ReadCache
+from schema import StepRequestBody
+
+
+def test_archiving_invalidates_task_step_and_artifact_entries(tmp_path):
+    async def main():
+        cache = ReadCache(ttl=60)
+        db = AgentDB(f"sqlite:///{tmp_path}/agent.db", cache=cache)
+        task = await db.create_task("task")
+        step = await db.create_step(task.task_id, StepRequestBody(input="step"), is_last=True)
+        artifact = await db.create_artifact(task.task_id, "a.txt", "out/", step_id=step.step_id)
+        await db.get_task(task.task_id)
+        await db.get_step(task.task_id, step.step_id)
+        await db.get_artifact(artifact.artifact_id)
+        assert len(cache.backend._items) == 3
+
+        archived = TaskArchiver(db, datetime.timedelta(0)).run()
+
+        assert archived == 1
+        assert len(cache.backend._items) == 0
+        restored = await db.get_task(task.task_id, include_archived=True)
+        assert restored.task_id == task.task_id
+        await db.close()
+
+    asyncio.run(main())
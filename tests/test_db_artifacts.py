@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from db import AgentDB, AsyncAgentDB
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+@pytest.mark.parametrize("db_class", [AgentDB, AsyncAgentDB])
+def test_artifact_without_path_is_created_once(tmp_path, db_class, write_behind):
+    async def main():
+        agent_db = db_class(f"sqlite:///{tmp_path}/agent.db", write_behind=write_behind)
+        task = await agent_db.create_task("task")
+        first = await agent_db.create_artifact(task.task_id, "a.txt", None)
+        if agent_db.write_behind is not None:
+            await agent_db.write_behind.flush()
+        second = await agent_db.create_artifact(task.task_id, "a.txt", None)
+        assert second.artifact_id == first.artifact_id
+        if agent_db.write_behind is not None:
+            await agent_db.write_behind.flush()
+        artifacts, _ = await agent_db.list_artifacts(task.task_id)
+        assert [artifact.artifact_id for artifact in artifacts] == [first.artifact_id]
+        await agent_db.close()
+
+    asyncio.run(main())
+
+
+def test_migration_folds_null_paths_into_empty_ones(tmp_path):
+    url = f"sqlite:///{tmp_path}/agent.db"
+    asyncio.run(AgentDB(url).close())
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO tasks (task_id) VALUES ('t')"))
+        for artifact_id, path in [("a1", None), ("a2", None), ("a3", None), ("b1", "")]:
+            conn.execute(
+                text(
+                    "INSERT INTO artifacts (artifact_id, task_id, file_name, relative_path) "
+                    "VALUES (:artifact_id, 't', :file_name, :path)"
+                ),
+                dict(artifact_id=artifact_id, file_name=artifact_id[0], path=path),
+            )
+    engine.dispose()
+
+    agent_db = AgentDB(url)
+    with agent_db.engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT artifact_id, relative_path FROM artifacts ORDER BY artifact_id")
+        ).all()
+    assert [tuple(row) for row in rows] == [("a1", ""), ("b1", "")]
+    asyncio.run(agent_db.close())
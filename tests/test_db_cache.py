@@ -0,0 +1,53 @@
+import asyncio
+import datetime
+from sqlalchemy import update
+from db import AgentDB, StepModel
+from db_cache import ReadCache
+from schema import Status, StepRequestBody, Task
+
+
+def test_update_between_read_and_set_keeps_the_stale_row_out(tmp_path):
+    async def main():
+        cache = ReadCache(ttl=60)
+        db = AgentDB(f"sqlite:///{tmp_path}/agent.db", cache=cache)
+        task = await db.create_task("task")
+        step = await db.create_step(task.task_id, StepRequestBody(input="step"))
+        set_step = cache.set_step
+
+        def racing_update(read_step, generation=None):
+            # what update_step does, landing after get_step read the row
+            with db.Session() as session:
+                session.execute(
+                    update(StepModel)
+                    .filter_by(step_id=step.step_id)
+                    .values(status=Status.completed.value)
+                )
+                session.commit()
+            cache.invalidate(step_id=step.step_id)
+            set_step(read_step, generation)
+
+        cache.set_step = racing_update
+        stale = await db.get_step(task.task_id, step.step_id)
+        cache.set_step = set_step
+
+        assert stale.status == Status.created
+        assert cache.get_step(step.step_id) is None
+        assert (await db.get_step(task.task_id, step.step_id)).status == Status.completed
+        await db.close()
+
+    asyncio.run(main())
+
+
+def test_generations_survive_eviction():
+    cache = ReadCache(max_generations=2)
+    now = datetime.datetime.utcnow()
+    task = Task(task_id="t1", input="task", created_at=now, modified_at=now, artifacts=[])
+    generation = cache.generation("task", "t1")
+    cache.invalidate(task_id="t1")
+    cache.invalidate(task_id="t2")
+    cache.invalidate(task_id="t3")
+
+    cache.set_task(task, generation)
+    assert cache.get_task("t1") is None
+    cache.set_task(task, cache.generation("task", "t1"))
+    assert cache.get_task("t1") == task
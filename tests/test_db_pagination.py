@@ -0,0 +1,32 @@
+import asyncio
+import pytest
+import db
+from db import AgentDB, AsyncAgentDB
+from schema import StepRequestBody
+
+
+@pytest.mark.parametrize("db_class", [AgentDB, AsyncAgentDB])
+def test_estimated_count_reports_truncation(tmp_path, monkeypatch, db_class):
+    monkeypatch.setattr(db, "ESTIMATED_COUNT_CAP", 5)
+
+    async def main():
+        agent_db = db_class(f"sqlite:///{tmp_path}/agent.db")
+        task = await agent_db.create_task("task")
+        for n in range(8):
+            await agent_db.create_step(task.task_id, StepRequestBody(input=f"step {n}"))
+
+        _, capped = await agent_db.list_steps(task.task_id, per_page=2, count="estimated")
+        assert capped.total_items == 5
+        assert capped.total_truncated is True
+        assert capped.total_pages is None
+
+        _, exact = await agent_db.list_steps(task.task_id, per_page=2, count="exact")
+        assert (exact.total_items, exact.total_pages) == (8, 4)
+        assert exact.total_truncated is None
+
+        monkeypatch.setattr(db, "ESTIMATED_COUNT_CAP", 8)
+        _, under = await agent_db.list_steps(task.task_id, per_page=2, count="estimated")
+        assert (under.total_items, under.total_pages, under.total_truncated) == (8, 4, None)
+        await agent_db.close()
+
+    asyncio.run(main())
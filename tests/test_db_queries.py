@@ -0,0 +1,94 @@
+"""Statements issued per list page, so N+1 artifact loading can't come back"""
+import asyncio
+import contextlib
+import pytest
+from sqlalchemy import event
+from db import AgentDB, AsyncAgentDB
+from schema import StepRequestBody
+
+
+@contextlib.contextmanager
+def count_statements(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def sync_engine(db):
+    return getattr(db.engine, "sync_engine", db.engine)
+
+
+async def fill(db, tasks: int, steps: int):
+    task_ids = []
+    for n in range(tasks):
+        task = await db.create_task(f"task {n}")
+        task_ids.append(task.task_id)
+        for m in range(steps):
+            step = await db.create_step(task.task_id, StepRequestBody(input=f"step {m}"))
+            await db.create_artifact(task.task_id, f"file{m}.txt", "out/", step_id=step.step_id)
+    return task_ids
+
+
+@pytest.mark.parametrize("db_class", [AgentDB, AsyncAgentDB])
+@pytest.mark.parametrize("per_page", [5, 25])
+def test_list_tasks_statement_count(tmp_path, db_class, per_page):
+    async def main():
+        db = db_class(f"sqlite:///{tmp_path}/agent.db")
+        await fill(db, tasks=30, steps=1)
+        with count_statements(sync_engine(db)) as statements:
+            tasks, _ = await db.list_tasks(per_page=per_page)
+        # page, artifacts of the page, total count
+        assert len(tasks) == per_page
+        assert all(task.artifacts for task in tasks)
+        assert len(statements) == 3
+        with count_statements(sync_engine(db)) as statements:
+            await db.list_tasks(per_page=per_page, include_artifacts=False)
+        assert len(statements) == 2
+        await db.close()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("db_class", [AgentDB, AsyncAgentDB])
+@pytest.mark.parametrize("per_page", [5, 25])
+def test_list_steps_statement_count(tmp_path, db_class, per_page):
+    async def main():
+        db = db_class(f"sqlite:///{tmp_path}/agent.db")
+        [task_id] = await fill(db, tasks=1, steps=30)
+        with count_statements(sync_engine(db)) as statements:
+            steps, _ = await db.list_steps(task_id, per_page=per_page)
+        assert len(steps) == per_page
+        assert all(step.artifacts for step in steps)
+        assert len(statements) == 3
+        with count_statements(sync_engine(db)) as statements:
+            await db.list_steps(task_id, per_page=per_page, count="none")
+        assert len(statements) == 2
+        await db.close()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("db_class", [AgentDB, AsyncAgentDB])
+def test_buffered_update_reads_the_step_once(tmp_path, db_class):
+    async def main():
+        db = db_class(f"sqlite:///{tmp_path}/agent.db", write_behind=True)
+        task = await db.create_task("task")
+        step = await db.create_step(task.task_id, StepRequestBody(input="step"))
+        await db.write_behind.flush()
+        with count_statements(sync_engine(db)) as statements:
+            updated = await db.update_step(
+                task.task_id, step.step_id, "completed", output="done", is_last=True
+            )
+        assert len([s for s in statements if s.lstrip().startswith("SELECT")]) == 1
+        assert (updated.status.value, updated.output, updated.is_last) == ("completed", "done", True)
+        assert updated == await db.get_step(task.task_id, step.step_id)
+        await db.close()
+
+    asyncio.run(main())
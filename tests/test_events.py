@@ -0,0 +1,22 @@
+import asyncio
+from events import EventBroker
+
+
+def test_token_deltas_stay_out_of_the_replay_history():
+    async def main():
+        broker = EventBroker(history=3)
+        broker.publish("t", "step_started", step_id="s")
+        for n in range(10):
+            broker.publish("t", "llm_token", step_id="s", delta=str(n))
+        broker.publish("t", "step_completed", step_id="s")
+
+        events = broker.subscribe("t", last_event_id=0)
+        replayed = [(await events.__anext__()).event for _ in range(2)]
+        assert replayed == ["step_started", "step_completed"]
+
+        broker.publish("t", "llm_token", step_id="s", delta="live")
+        live = await events.__anext__()
+        assert (live.event, live.data["delta"]) == ("llm_token", "live")
+        await events.aclose()
+
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+import asyncio
+import llm
+from ai_profile import is_profile
+from db_cache import LocalCacheBackend
+from llm_backends import Completion
+from llm_cache import ResponseCache
+
+
+class FakeBackend:
+    """Answers from a list of replies and records the temperature asked for"""
+
+    def __init__(self, *replies: str) -> None:
+        self.replies = list(replies)
+        self.temperatures = []
+
+    async def complete(self, messages, model, temperature, response_format=None):
+        self.temperatures.append(temperature)
+        return Completion(self.replies.pop(0), {"total_tokens": 1})
+
+
+def use(monkeypatch, backend: FakeBackend) -> ResponseCache:
+    cache = ResponseCache(LocalCacheBackend())
+    monkeypatch.setattr(llm.backends, "resolve", lambda model: (backend, model))
+    monkeypatch.setattr(llm, "response_cache", cache)
+    return cache
+
+
+def ask(**kwargs) -> str:
+    messages = [{"role": "user", "content": "Who fits this task?"}]
+    return asyncio.run(llm.chat_completion_request(messages, model="m", **kwargs))
+
+
+def test_key_keeps_whitespace():
+    def key(content):
+        return ResponseCache.key([{"role": "user", "content": content}], "m", 0)
+
+    assert key("a\n  b") != key("a b")
+    assert key("a\n  b") == key("a\n  b")
+
+
+def test_replies_are_not_cached_unless_asked(monkeypatch):
+    backend = FakeBackend("one", "two")
+    use(monkeypatch, backend)
+    assert ask() == "one"
+    assert ask() == "two"
+
+
+def test_rejected_replies_are_not_cached(monkeypatch):
+    backend = FakeBackend("not json", '{"name": "Ada", "expertise": "testing"}')
+    cache = use(monkeypatch, backend)
+    assert ask(cache=True, accept=is_profile) == "not json"
+    reply = ask(cache=True, accept=is_profile)
+    assert reply.startswith("{")
+    assert ask(cache=True, accept=is_profile) == reply
+    assert cache.stats()["hits"] == 1
+
+
+def test_temperature_is_passed_through(monkeypatch):
+    backend = FakeBackend("a", "b")
+    use(monkeypatch, backend)
+    ask(temperature=0)
+    ask()
+    assert backend.temperatures == [0, 0.3]
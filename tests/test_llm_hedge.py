@@ -0,0 +1,127 @@
+import asyncio
+import agents
+import llm
+from conversation_store import ConversationStore, MemoryConversationBackend
+from db import AgentDB
+from llm_backends import Completion
+from llm_hedge import Hedger
+from errors import StreamInterruptedError
+from llm_limiter import LLMLimiter
+from schema import StepRequestBody
+from workspace import LocalWorkspace
+
+
+class FakeBackend:
+    """Each call waits its entry of first_token seconds, then answers"""
+
+    def __init__(self, *first_token: float, reply: str = "one two three") -> None:
+        self.first_token = list(first_token)
+        self.reply = reply
+        self.calls = 0
+
+    async def complete(self, messages, model, temperature, response_format=None):
+        self.calls += 1
+        await asyncio.sleep(self.first_token.pop(0))
+        return Completion(self.reply, {"total_tokens": 1})
+
+    async def stream(self, messages, model, temperature, usage=None, response_format=None):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.first_token.pop(0))
+        for word in self.reply.split():
+            yield f"{word}@{call} "
+
+
+def use(monkeypatch, backend, hedger=None, limiter=None) -> None:
+    monkeypatch.setattr(llm.backends, "resolve", lambda model: (backend, model))
+    monkeypatch.setattr(llm, "response_cache", None)
+    monkeypatch.setattr(llm, "hedger", hedger or Hedger(percentile=0))
+    monkeypatch.setattr(llm, "limiter", limiter or LLMLimiter(max_concurrency=8))
+
+
+def ask(**kwargs) -> str:
+    messages = [{"role": "user", "content": "go"}]
+    return llm.chat_completion_request(messages, model="m", **kwargs)
+
+
+def test_streams_are_hedged_on_the_first_token(monkeypatch):
+    hedger = Hedger(percentile=50, min_samples=1, min_delay=0.01)
+    hedger.record("m:first_token", 0.01)
+    backend = FakeBackend(5, 0)
+    use(monkeypatch, backend, hedger)
+    deltas = []
+
+    async def main():
+        return await asyncio.wait_for(ask(on_token=deltas.append), 2)
+
+    assert asyncio.run(main()) == "one@2 two@2 three@2 "
+    # only the winner's deltas reached the consumer
+    assert deltas == ["one@2 ", "two@2 ", "three@2 "]
+    assert hedger.stats()["hedged"] == 1 and hedger.stats()["hedge_wins"] == 1
+
+
+def test_deadline_starts_once_the_limiter_slot_is_held(monkeypatch):
+    limiter = LLMLimiter(max_concurrency=1)
+    backend = FakeBackend(0.2, 0.2)
+    use(monkeypatch, backend, Hedger(percentile=0, deadline=0.3), limiter)
+
+    async def main():
+        # the second call queues 0.2s for the slot, then takes 0.2s itself
+        return await asyncio.gather(ask(), ask())
+
+    assert asyncio.run(main()) == ["one two three", "one two three"]
+    assert llm.hedger.timeouts == 0
+
+
+def test_a_timed_out_completion_fails_the_step(tmp_path, monkeypatch):
+    async def timed_out(*args, **kwargs):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(agents, "chat_completion_request", timed_out)
+
+    async def main():
+        agent = agents.ForgeAgent(
+            AgentDB(f"sqlite:///{tmp_path}/agent.db"),
+            LocalWorkspace(str(tmp_path / "workspace")),
+            ConversationStore(MemoryConversationBackend()),
+        )
+        task = await agent.db.create_task("task")
+        step = await agent.execute_step(task.task_id, StepRequestBody(input="y"))
+        stored = await agent.db.get_step(task.task_id, step.step_id)
+        return step, stored
+
+    step, stored = asyncio.run(main())
+    assert step.output == "Step failed: TimeoutError"
+    assert stored.status.value == "completed" and stored.output == "Step failed: TimeoutError"
+    assert step.is_last is False
+
+
+class BrokenStream:
+    """Streams two deltas and then fails, every time"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def stream(self, messages, model, temperature, usage=None, response_format=None):
+        self.calls += 1
+        yield '{"thoughts": '
+        yield '{"text": "abil'
+        raise ConnectionError("connection reset")
+
+
+def test_a_stream_failing_midway_is_not_replayed(monkeypatch):
+    backend = BrokenStream()
+    use(monkeypatch, backend)
+    deltas = []
+
+    async def main():
+        await ask(on_token=deltas.append)
+
+    try:
+        asyncio.run(main())
+    except StreamInterruptedError as err:
+        assert isinstance(err.__cause__, ConnectionError)
+    else:
+        raise AssertionError("the interrupted stream did not raise")
+    assert backend.calls == 1
+    assert deltas == ['{"thoughts": ', '{"text": "abil']
@@ -0,0 +1,41 @@
+import threading
+import local_memstore
+from local_memstore import LocalMemstore
+
+
+def fill(memstore: LocalMemstore, count: int) -> None:
+    for n in range(count):
+        memstore.add_data_obj(
+            "chat", {"role": "user", "content": f"message {n} about topic{n % 7}", "task_id": "t"}
+        )
+
+
+def test_queries_do_not_wait_for_the_index_build(monkeypatch):
+    release = threading.Event()
+    build = local_memstore.IVFIndex
+
+    def slow_build(*args, **kwargs):
+        release.wait(5)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(local_memstore, "IVFIndex", slow_build)
+    memstore = LocalMemstore(ivf_threshold=50, n_probe=64)
+    fill(memstore, 60)
+    # served by a full scan while the build is blocked
+    found = memstore.get_data_obj("t", "chat", "message 42 about topic0")
+    assert found[0]["content"] == "message 42 about topic0"
+    assert memstore.stats()["indexed_partitions"] == 0
+    release.set()
+    memstore.wait_for_indexes()
+    assert memstore.stats()["indexed_partitions"] == 1
+    found = memstore.get_data_obj("t", "chat", "message 42 about topic0")
+    assert found[0]["content"] == "message 42 about topic0"
+    assert memstore.stats()["index_builds"] == 1
+
+
+def test_partitions_start_small(tmp_path):
+    memstore = LocalMemstore(path=str(tmp_path))
+    fill(memstore, 3)
+    [partition] = memstore.partitions.values()
+    assert partition.vectors._vectors.shape[0] <= 16
+    assert (tmp_path / "chat" / "t.f32").stat().st_size <= 16 * 512 * 4
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+from schema import StepRequestBody
+from step_runner import StepRunner
+
+
+class FakeAgent:
+    """Steps run until their task is released, the db records status updates"""
+
+    def __init__(self) -> None:
+        self.steps = 0
+        self.status = {}
+        self.log = []
+        self.release = {}
+        self.events = SimpleNamespace(publish=lambda *args, **kwargs: None)
+        self.db = SimpleNamespace(update_step=self.update_step)
+
+    async def create_step(self, task_id, step_request):
+        self.steps += 1
+        step_id = f"{task_id}-{self.steps}"
+        self.status[step_id] = ("created", None)
+        return SimpleNamespace(step_id=step_id, additional_input={})
+
+    async def update_step(self, task_id, step_id, status, additional_input, output=None):
+        self.status[step_id] = (status, output)
+
+    async def execute_step(self, task_id, step_request, step=None):
+        self.log.append(("start", step.step_id))
+        await self.release.setdefault(task_id, asyncio.Event()).wait()
+        self.log.append(("end", step.step_id))
+        self.status[step.step_id] = ("completed", "done")
+
+
+async def settle() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_a_busy_task_holds_one_worker():
+    async def main():
+        agent = FakeAgent()
+        runner = StepRunner(agent, workers=2)
+        busy = [await runner.submit("a", StepRequestBody(input="y")) for _ in range(5)]
+        other = await runner.submit("b", StepRequestBody(input="y"))
+        agent.release["b"] = asyncio.Event()
+        agent.release["b"].set()
+        assert await runner.wait(other.step_id, 1)
+        assert agent.status[other.step_id] == ("completed", "done")
+        assert [s for event, s in agent.log if event == "start"] == [busy[0].step_id, other.step_id]
+        agent.release["a"].set()
+        for step in busy:
+            await runner.wait(step.step_id, 1)
+        # one at a time, in submission order
+        assert [entry for entry in agent.log if entry[1].startswith("a")] == [
+            (event, step.step_id) for step in busy for event in ("start", "end")
+        ]
+        assert runner.stats()["completed"] == 6
+        await runner.close()
+
+    asyncio.run(main())
+
+
+def test_steps_run_in_the_request_wait_for_the_task():
+    async def main():
+        agent = FakeAgent()
+        runner = StepRunner(agent, workers=2)
+        queued = await runner.submit("a", StepRequestBody(input="y"))
+        await settle()
+        entered = asyncio.Event()
+
+        async def in_request():
+            async with runner.task_lock("a"):
+                entered.set()
+
+        request = asyncio.create_task(in_request())
+        await settle()
+        assert not entered.is_set()
+        agent.release["a"].set()
+        await runner.wait(queued.step_id, 1)
+        await request
+        assert runner._task_locks == {}
+        await runner.close()
+
+    asyncio.run(main())
+
+
+def test_wait_reports_unknown_steps():
+    async def main():
+        runner = StepRunner(FakeAgent())
+        assert await runner.wait("not-submitted-here", 1) is False
+
+    asyncio.run(main())
+
+
+def test_close_fails_running_and_queued_steps():
+    async def main():
+        agent = FakeAgent()
+        runner = StepRunner(agent, workers=1)
+        steps = [await runner.submit("a", StepRequestBody(input="y")) for _ in range(3)]
+        await settle()
+        await runner.close()
+        for step in steps:
+            status, output = agent.status[step.step_id]
+            assert status == "completed" and output.startswith("Step failed")
+            assert await runner.wait(step.step_id, 0)
+        assert runner.stats() == {
+            "queued": 0, "running": 0, "completed": 0, "rejected": 0, "abandoned": 3
+        }
+
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import asyncio
+from write_behind import WriteBatch, WriteBehindQueue
+
+
+class Transient(Exception):
+    pass
+
+
+class FakeDatabase:
+    """Commits whole batches, rejecting any batch holding a poison step"""
+
+    def __init__(self, poison=(), down_for: int = 0) -> None:
+        self.poison = set(poison)
+        self.down_for = down_for
+        self.rows = {}
+
+    async def write_batch(self, batch: WriteBatch) -> None:
+        if self.down_for:
+            self.down_for -= 1
+            raise Transient("database is locked")
+        if self.poison & set(batch.new_steps):
+            raise ValueError("UNIQUE constraint failed")
+        for kind, key, values in batch.rows():
+            self.rows[key] = values
+
+
+def queue(database: FakeDatabase) -> WriteBehindQueue:
+    return WriteBehindQueue(
+        database.write_batch, max_attempts=2, is_transient=lambda e: isinstance(e, Transient)
+    )
+
+
+def test_poison_row_is_dropped_and_the_rest_written():
+    async def main():
+        database = FakeDatabase(poison={"s3"})
+        writes = queue(database)
+        for n in range(6):
+            writes.add_step({"step_id": f"s{n}", "task_id": "t"})
+        await writes.flush()
+        assert database.rows == {} and len(writes.pending) == 6
+        writes.add_step({"step_id": "s6", "task_id": "t"})
+        await writes.flush()
+        await writes.close()
+        assert set(database.rows) == {f"s{n}" for n in range(7)} - {"s3"}
+        stats = writes.stats()
+        assert stats["pending"] == 0
+        assert stats["dropped_rows"] == 1
+        assert stats["dropped"][0]["key"] == "s3"
+
+    asyncio.run(main())
+
+
+def test_transient_errors_are_retried_not_dropped():
+    async def main():
+        database = FakeDatabase(down_for=5)
+        writes = queue(database)
+        writes.add_step({"step_id": "s1", "task_id": "t"})
+        for _ in range(5):
+            await writes.flush()
+            assert writes.stats()["pending"] == 1
+        await writes.close()
+        assert set(database.rows) == {"s1"}
+        assert writes.stats()["dropped_rows"] == 0
+
+    asyncio.run(main())
+
+
+def test_split_keeps_steps_before_artifacts():
+    batch = WriteBatch()
+    batch.new_steps["s1"] = {"step_id": "s1"}
+    batch.step_updates["s0"] = {"status": "completed"}
+    batch.artifacts[("t", "a", "/")] = {"artifact_id": "a1"}
+    batch.artifacts[("t", "b", "/")] = {"artifact_id": "b1"}
+    first, second = batch.split()
+    assert [kind for kind, _, _ in first.rows()] == ["new_steps", "step_updates"]
+    assert [kind for kind, _, _ in second.rows()] == ["artifacts", "artifacts"]
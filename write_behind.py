@@ -0,0 +1,244 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from agent_log import AgentLogger
+
+LOG = AgentLogger(__name__)
+
+
+class WriteBatch:
+    """
+    Step and artifact writes collected between two flushes. Rows are plain
+    column dicts so a batch can be written with bulk statements.
+    """
+
+    def __init__(self) -> None:
+        # full rows for steps that are not in the database yet
+        self.new_steps: Dict[str, Dict[str, Any]] = {}
+        # changed columns for steps that already are
+        self.step_updates: Dict[str, Dict[str, Any]] = {}
+        # keyed by the (task_id, file_name, relative_path) dedupe triple
+        self.artifacts: Dict[Tuple, Dict[str, Any]] = {}
+        # failed writes of this batch so far
+        self.attempts = 0
+
+    def __len__(self) -> int:
+        return len(self.new_steps) + len(self.step_updates) + len(self.artifacts)
+
+    def rows(self) -> List[Tuple[str, Any, Dict[str, Any]]]:
+        """(kind, key, values) of every row, steps before the artifacts that may reference them"""
+        return [
+            (kind, key, values)
+            for kind in ("new_steps", "step_updates", "artifacts")
+            for key, values in getattr(self, kind).items()
+        ]
+
+    def split(self) -> Tuple["WriteBatch", "WriteBatch"]:
+        """Two batches holding the first and second half of the rows, in order"""
+        rows = self.rows()
+        halves = (WriteBatch(), WriteBatch())
+        for n, (kind, key, values) in enumerate(rows):
+            getattr(halves[n >= len(rows) // 2], kind)[key] = values
+        return halves
+
+    def update_step(self, step_id: str, values: Dict[str, Any]) -> None:
+        if step_id in self.new_steps:
+            self.new_steps[step_id].update(values)
+        else:
+            self.step_updates.setdefault(step_id, {}).update(values)
+
+    def merge(self, newer: "WriteBatch") -> None:
+        """Fold a newer batch on top of this one"""
+        self.new_steps.update(newer.new_steps)
+        for step_id, values in newer.step_updates.items():
+            self.update_step(step_id, values)
+        for key, values in newer.artifacts.items():
+            self.artifacts.setdefault(key, values)
+
+
+class WriteBehindQueue:
+    """
+    Buffers step and artifact writes and commits them from a background task
+    in one transaction per flush interval. Reads go through step_state and
+    find_artifact first so callers see their own unflushed writes.
+
+    A failed batch is retried with the next flush. Errors is_transient
+    accepts (database unreachable or locked) are retried for as long as
+    they last; after max_attempts other failures the batch is written in
+    halves until the rows that fail on their own are found. Those are
+    dropped, logged and kept in stats instead of blocking every later write.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[WriteBatch], Awaitable[None]],
+        flush_interval: float = 0.05,
+        max_batch: int = 500,
+        max_attempts: int = 3,
+        is_transient: Callable[[BaseException], bool] = lambda e: False,
+    ) -> None:
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.is_transient = is_transient
+        self.pending = WriteBatch()
+        self.in_flight: Optional[WriteBatch] = None
+        self.commits = 0
+        self.rows_written = 0
+        self.dropped_rows = 0
+        # the last rows dropped, with the error that rejected them
+        self.dropped: deque = deque(maxlen=100)
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add_step(self, values: Dict[str, Any]) -> None:
+        self.pending.new_steps[values["step_id"]] = dict(values)
+        self._schedule()
+
+    def update_step(self, step_id: str, values: Dict[str, Any]) -> None:
+        self.pending.update_step(step_id, dict(values))
+        self._schedule()
+
+    def add_artifact(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        key = (values["task_id"], values["file_name"], values["relative_path"])
+        if existing := self.find_artifact(*key):
+            return existing
+        self.pending.artifacts[key] = dict(values)
+        self._schedule()
+        return values
+
+    def find_artifact(
+        self, task_id: str, file_name: str, relative_path: str
+    ) -> Optional[Dict[str, Any]]:
+        key = (task_id, file_name, relative_path)
+        for batch in (self.pending, self.in_flight):
+            if batch is not None and key in batch.artifacts:
+                return batch.artifacts[key]
+        return None
+
+    def find_artifact_by_id(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        for batch in (self.pending, self.in_flight):
+            if batch is None:
+                continue
+            for values in batch.artifacts.values():
+                if values["artifact_id"] == artifact_id:
+                    return values
+        return None
+
+    def step_state(self, step_id: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Buffered columns for a step and whether the buffer holds the whole row
+        (the step was created since the last flush and is not in the database).
+        """
+        state: Dict[str, Any] = {}
+        is_new = False
+        for batch in (self.in_flight, self.pending):
+            if batch is None:
+                continue
+            if step_id in batch.new_steps:
+                state.update(batch.new_steps[step_id])
+                is_new = True
+            if step_id in batch.step_updates:
+                state.update(batch.step_updates[step_id])
+        return (state or None), is_new
+
+    def step_artifacts(self, step_id: str) -> List[Dict[str, Any]]:
+        artifacts = []
+        for batch in (self.in_flight, self.pending):
+            if batch is not None:
+                artifacts += [
+                    values
+                    for values in batch.artifacts.values()
+                    if values.get("step_id") == step_id
+                ]
+        return artifacts
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not len(self.pending):
+                return
+            batch, self.pending = self.pending, WriteBatch()
+            self.in_flight = batch
+            try:
+                await self.write_batch(batch)
+                self.commits += 1
+                self.rows_written += len(batch)
+            except Exception as e:
+                batch.attempts += 1
+                if self.is_transient(e) or batch.attempts < self.max_attempts:
+                    # keep the rows and retry them with the next flush
+                    LOG.error(f"Write-behind flush failed, retrying next interval: {e}")
+                    self._requeue(batch)
+                else:
+                    LOG.error(
+                        f"Write-behind flush failed {batch.attempts} times, "
+                        f"looking for the failing rows: {e}"
+                    )
+                    await self._isolate(batch)
+            finally:
+                self.in_flight = None
+
+    def _requeue(self, batch: WriteBatch) -> None:
+        batch.merge(self.pending)
+        self.pending = batch
+
+    async def _isolate(self, batch: WriteBatch) -> None:
+        """Write a failed batch in halves, dropping rows that fail alone"""
+        for half in batch.split():
+            if not len(half):
+                continue
+            try:
+                await self.write_batch(half)
+                self.commits += 1
+                self.rows_written += len(half)
+            except Exception as e:
+                if self.is_transient(e):
+                    self._requeue(half)
+                elif len(half) > 1:
+                    await self._isolate(half)
+                else:
+                    [(kind, key, values)] = half.rows()
+                    LOG.error(f"Write-behind dropped {kind} row {key}: {e}")
+                    self.dropped_rows += 1
+                    self.dropped.append({"kind": kind, "key": key, "values": values, "error": str(e)})
+
+    async def close(self) -> None:
+        """Stop the background flusher and write out whatever is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "commits": self.commits,
+            "rows_written": self.rows_written,
+            "dropped_rows": self.dropped_rows,
+            "dropped": [
+                {"kind": row["kind"], "key": str(row["key"]), "error": row["error"]}
+                for row in self.dropped
+            ],
+        }
+
+    def _schedule(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if len(self.pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # close() cancels this loop; never abandon a batch mid-commit
+            await asyncio.shield(self.flush())